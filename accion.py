@@ -1,91 +1,177 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
-import os
+from datetime import date
+
+import core
+from fetch_engine import get_fetch_engine
+from market_data import get_provider
+from portfolio_db import PortfolioDB
+from quote_cache import BackgroundQuotes
 
 st.set_page_config(page_title="Cartera de Acciones", layout="wide")
 st.title("📊 Mi Cartera de Acciones")
 
-CSV_FILE = "cartera.csv"
+POLL_SECONDS = 2  # the price table reruns on its own to show refreshed quotes
+
+# portfolio.db columns -> the names this page shows
+COLUMNAS = {"Symbol": "Símbolo", "Company": "Empresa", "Quantity": "Cantidad", "BuyPrice": "Precio Compra"}
+
+
+@st.cache_resource
+def abrir_base():
+    # The same portfolio.db and ledger as the desktop app. A cartera.csv
+    # from before (either app's columns) is imported into the ledger once.
+    core.open_database()
+    return PortfolioDB.db_file
+
+
+@st.cache_resource
+def cotizaciones():
+    # One quote cache for every session and rerun of the server, seeded
+    # with the last quotes stored in portfolio.db. Quotes are fetched in one
+    # batched request per refresh, in the background; the page always
+    # renders from the cache.
+    abrir_base()
+    return BackgroundQuotes(get_provider(), get_fetch_engine())
+
+
+def cada(segundos):
+    # st.fragment(run_every=...) when available (Streamlit >= 1.37): only the
+    # decorated part reruns, picking up quotes as they arrive
+    fragment = getattr(st, "fragment", None)
+    return fragment(run_every=segundos) if fragment else (lambda func: func)
+
 
-# Función para cargar y guardar
 def cargar_cartera():
-    if os.path.exists(CSV_FILE):
-        return pd.read_csv(CSV_FILE)
-    else:
-        return pd.DataFrame(columns=["Empresa", "Símbolo", "Cantidad", "Precio Compra"])
+    # The session's copy of the positions, indexed by symbol. A rerun only
+    # compares the ledger version; when either app recorded transactions,
+    # just the positions they touched are read again. CurrentPrice follows
+    # the quotes refreshed in the background.
+    abrir_base()
+    version = PortfolioDB.ledger_version()
+    copia = st.session_state.get("cartera_db")
+    if copia is None or version < copia["version"]:
+        copia = {"version": version, "cartera": PortfolioDB.get_portfolio_df().set_index("Symbol"), "precios": None}
+    elif version > copia["version"]:
+        version, filas, tocados = PortfolioDB.get_changed_positions(copia["version"])
+        cartera = copia["cartera"].drop(index=tocados, errors="ignore")
+        copia = {"version": version, "cartera": pd.concat([cartera, filas.set_index("Symbol")]), "precios": None}
+    precios = cotizaciones().version
+    if copia["precios"] != precios:
+        copia = dict(copia, cartera=con_cotizaciones(copia["cartera"]), precios=precios)
+    st.session_state.cartera_db = copia
+    return copia["cartera"]
+
 
-def guardar_cartera(df):
-    df.to_csv(CSV_FILE, index=False)
+def con_cotizaciones(cartera):
+    # CurrentPrice from the last known quotes, where there are any
+    cache = cotizaciones().provider.cache
+    ultimas = {sym: cache.last_known(sym) for sym in cartera.index}
+    precios = pd.Series({sym: q.price for sym, q in ultimas.items() if q is not None}, dtype=float)
+    cartera = cartera.copy()
+    cartera["CurrentPrice"] = precios.reindex(cartera.index).fillna(cartera["CurrentPrice"])
+    return cartera
 
-# Inicializar cartera
-if "cartera" not in st.session_state:
-    st.session_state.cartera = cargar_cartera()
 
-cartera = st.session_state.cartera
+def fecha_ledger(fecha):
+    return fecha.strftime("%d/%m/%Y")
 
-# Sidebar: Agregar acción
+
+def registrado(mensaje):
+    # After a write: rerun the page so the selector and the table are read
+    # again with it, and show the message on that rerun
+    st.session_state.aviso = mensaje
+    st.rerun()
+
+
+if "aviso" in st.session_state:
+    st.success(st.session_state.pop("aviso"))
+
+cartera = cargar_cartera()
+
+# Sidebar: Agregar acción (una compra en el ledger)
 st.sidebar.header("➕ Agregar una acción")
 with st.sidebar.form("form_entrada"):
     empresa = st.text_input("Nombre de la empresa")
-    simbolo = st.text_input("Símbolo de la acción (ej. AAPL)").upper()
+    simbolo = st.text_input("Símbolo de la acción (ej. AAPL)").upper().strip()
     cantidad = st.number_input("Cantidad de acciones", min_value=0.0, format="%.2f")
-    precio_compra = st.number_input("Precio de compra (USD)", min_value=0.0, format="%.2f")
+    precio_compra = st.number_input("Precio de compra", min_value=0.0, format="%.2f")
+    fecha_compra = st.date_input("Fecha de compra", value=date.today(), format="DD/MM/YYYY")
     agregar = st.form_submit_button("Agregar")
 
 if agregar and simbolo and cantidad > 0 and precio_compra > 0:
-    nueva = pd.DataFrame([[empresa, simbolo, cantidad, precio_compra]],
-                         columns=["Empresa", "Símbolo", "Cantidad", "Precio Compra"])
-    st.session_state.cartera = pd.concat([cartera, nueva], ignore_index=True)
-    guardar_cartera(st.session_state.cartera)
-    st.success(f"✅ Acción {simbolo} agregada")
+    PortfolioDB.add_transaction(simbolo, empresa.strip() or simbolo, 'BUY', cantidad, precio_compra,
+                                fecha_ledger(fecha_compra))
+    registrado(f"✅ Acción {simbolo} agregada")
 
-# Sidebar: Editar o eliminar
+# Sidebar: Editar, vender o eliminar (un ADJUST, SELL o CLOSE en el ledger)
 st.sidebar.header("✏️ Editar / ❌ Eliminar acción")
 if not cartera.empty:
-    seleccion = st.sidebar.selectbox("Selecciona una acción", cartera["Símbolo"] + " - " + cartera["Empresa"])
-    idx = cartera.index[cartera["Símbolo"] + " - " + cartera["Empresa"] == seleccion][0]
-    
-    accion = st.sidebar.radio("¿Qué deseas hacer?", ["Editar", "Eliminar"])
-    
+    seleccion = st.sidebar.selectbox("Selecciona una acción", cartera.index.tolist(),
+                                     format_func=lambda sym: f"{sym} - {cartera.at[sym, 'Company']}")
+    fila = cartera.loc[seleccion]
+
+    accion = st.sidebar.radio("¿Qué deseas hacer?", ["Editar", "Vender", "Eliminar"])
+
     if accion == "Editar":
         with st.sidebar.form("form_editar"):
-            nueva_empresa = st.text_input("Nuevo nombre", value=cartera.at[idx, "Empresa"])
-            nueva_cantidad = st.number_input("Nueva cantidad", value=cartera.at[idx, "Cantidad"], format="%.2f")
-            nuevo_precio = st.number_input("Nuevo precio compra", value=cartera.at[idx, "Precio Compra"], format="%.2f")
+            nueva_empresa = st.text_input("Nuevo nombre", value=fila["Company"])
+            nueva_cantidad = st.number_input("Nueva cantidad", value=float(fila["Quantity"]), format="%.2f")
+            nuevo_precio = st.number_input("Nuevo precio compra", value=float(fila["BuyPrice"]), format="%.2f")
             guardar_cambios = st.form_submit_button("Guardar cambios")
         if guardar_cambios:
-            st.session_state.cartera.at[idx, "Empresa"] = nueva_empresa
-            st.session_state.cartera.at[idx, "Cantidad"] = nueva_cantidad
-            st.session_state.cartera.at[idx, "Precio Compra"] = nuevo_precio
-            guardar_cartera(st.session_state.cartera)
-            st.success("✅ Acción actualizada")
+            PortfolioDB.update_symbol(seleccion, nueva_cantidad, nuevo_precio, company=nueva_empresa.strip() or None)
+            registrado("✅ Acción actualizada")
+    elif accion == "Vender":
+        with st.sidebar.form("form_vender"):
+            cantidad_venta = st.number_input("Cantidad a vender", min_value=0.0, max_value=float(fila["Quantity"]),
+                                             value=float(fila["Quantity"]), format="%.2f")
+            precio_venta = st.number_input("Precio de venta", min_value=0.0,
+                                           value=float(fila["CurrentPrice"] or fila["BuyPrice"]), format="%.2f")
+            fecha_venta = st.date_input("Fecha de venta", value=date.today(), format="DD/MM/YYYY")
+            vender = st.form_submit_button("Vender")
+        if vender and cantidad_venta > 0:
+            PortfolioDB.add_transaction(seleccion, fila["Company"], 'SELL', cantidad_venta, precio_venta,
+                                        fecha_ledger(fecha_venta))
+            registrado(f"✅ Venta de {seleccion} registrada")
     elif accion == "Eliminar":
         if st.sidebar.button("Eliminar esta acción"):
-            st.session_state.cartera = cartera.drop(idx).reset_index(drop=True)
-            guardar_cartera(st.session_state.cartera)
-            st.success("🗑️ Acción eliminada")
+            PortfolioDB.delete_symbol(seleccion)
+            registrado("🗑️ Acción eliminada")
+
 
 # Recalcular con precios actuales
-cartera = st.session_state.cartera
+@cada(POLL_SECONDS)
+def mostrar_cartera():
+    # Also picks up what the desktop app records while the page is open
+    cartera = cargar_cartera()
+    if cartera.empty:
+        st.info("Agrega acciones desde el panel izquierdo.")
+        return
 
-if not cartera.empty:
-    precios_actuales = []
-    for sym in cartera["Símbolo"]:
-        try:
-            precio = yf.Ticker(sym).history(period="1d")["Close"].iloc[-1]
-        except:
-            precio = 0
-        precios_actuales.append(precio)
-
-    cartera["Precio Actual"] = precios_actuales
+    quotes, stale, refreshing = cotizaciones().snapshot(cartera.index.tolist())
+    cartera = cartera.reset_index()[list(COLUMNAS) + ["CurrentPrice"]]
+    # Without a quote, the last price stored by either app (if any)
+    guardado = cartera["CurrentPrice"].where(cartera["CurrentPrice"] > 0)
+    cartera["Precio Actual"] = cartera["Symbol"].map(
+        lambda sym: quotes[sym].price if sym in quotes else None).astype(float).fillna(guardado)
+    cartera["Estado"] = [
+        "sin cotización" if pd.isna(precio) else "desactualizado" if sym not in quotes or sym in stale else "al día"
+        for sym, precio in zip(cartera["Symbol"], cartera["Precio Actual"])]
+    cartera = cartera.drop(columns="CurrentPrice").rename(columns=COLUMNAS)
     cartera["Total Inversión"] = cartera["Cantidad"] * cartera["Precio Compra"]
     cartera["Valor Actual"] = cartera["Cantidad"] * cartera["Precio Actual"]
     cartera["Diferencia $"] = cartera["Valor Actual"] - cartera["Total Inversión"]
     cartera["Diferencia %"] = (cartera["Diferencia $"] / cartera["Total Inversión"]) * 100
 
     st.subheader("📋 Resumen de tu cartera")
+    if refreshing:
+        st.caption("🔄 Actualizando precios...")
+    faltan = cartera.loc[cartera["Estado"] != "al día", "Símbolo"].tolist()
+    if faltan and not refreshing:
+        error = cotizaciones().last_error
+        st.warning(f"Precios desactualizados: {', '.join(faltan)}" + (f" ({error})" if error else ""))
     st.dataframe(cartera.style.format({
         "Precio Compra": "${:.2f}",
         "Precio Actual": "${:.2f}",
@@ -93,17 +179,18 @@ if not cartera.empty:
         "Valor Actual": "${:.2f}",
         "Diferencia $": "${:.2f}",
         "Diferencia %": "{:.2f}%"
-    }).applymap(lambda x: "color: green" if isinstance(x, float) and x > 0 else "color: red"))
+    }, na_rep="-").map(lambda x: "color: green" if isinstance(x, float) and x > 0 else "color: red"))
 
     st.subheader("📈 Rendimiento de tus acciones")
+    con_precio = cartera[cartera["Precio Actual"].notna()]
     fig = go.Figure()
     fig.add_trace(go.Bar(
-        x=cartera["Símbolo"],
-        y=cartera["Diferencia $"],
-        marker_color=cartera["Diferencia $"].apply(lambda x: 'green' if x >= 0 else 'red')
+        x=con_precio["Símbolo"],
+        y=con_precio["Diferencia $"],
+        marker_color=con_precio["Diferencia $"].apply(lambda x: 'green' if x >= 0 else 'red')
     ))
-    fig.update_layout(title="Ganancia/Pérdida por Acción", xaxis_title="Acción", yaxis_title="USD")
+    fig.update_layout(title="Ganancia/Pérdida por Acción", xaxis_title="Acción", yaxis_title="$")
     st.plotly_chart(fig, use_container_width=True)
-else:
-    st.info("Agrega acciones desde el panel izquierdo.")
 
+
+mostrar_cartera()
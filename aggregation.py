@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+AGGREGATE_COLUMNS = ['Symbol', 'Company', 'TotalQuantity', 'WeightedAvgPrice', 'CurrentPrice',
+                     'TotalInvested', 'TotalValue', 'ProfitLoss']
+# Added by valuation.value_currencies when a USD/ARS rate is known
+CURRENCY_COLUMNS = ['InvestedARS', 'InvestedUSD', 'ValueARS', 'ValueUSD']
+
+
+def value_positions(portfolio):
+    # Per-row valuation columns, computed in place on the portfolio frame
+    if "CurrentPrice" not in portfolio.columns:
+        portfolio["CurrentPrice"] = 0.0
+    portfolio["Value"] = portfolio["Quantity"] * portfolio["CurrentPrice"]
+    portfolio["Invested"] = portfolio["Quantity"] * portfolio["BuyPrice"]
+    portfolio["ProfitLoss"] = portfolio["Value"] - portfolio["Invested"]
+    return portfolio
+
+
+def aggregate_positions(portfolio):
+    # One groupby pass over the lots: every statistic is a built-in reduction
+    # over a precomputed column, so pandas never calls back into Python per
+    # group. The result feeds the summary table and the summary cards.
+    if portfolio.empty:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS)
+    if "Invested" not in portfolio.columns or "Value" not in portfolio.columns:
+        value_positions(portfolio)
+
+    currency_columns = [c for c in CURRENCY_COLUMNS if c in portfolio.columns]
+    agg = portfolio.groupby('Symbol').agg(
+        Company=('Company', 'first'),
+        TotalQuantity=('Quantity', 'sum'),
+        CurrentPrice=('CurrentPrice', 'first'),
+        TotalInvested=('Invested', 'sum'),
+        TotalValue=('Value', 'sum'),
+        **{c: (c, 'sum') for c in currency_columns},
+    ).reset_index()
+
+    quantity = agg['TotalQuantity'].to_numpy()
+    invested = agg['TotalInvested'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        agg['WeightedAvgPrice'] = np.where(quantity > 0, invested / quantity, 0.0)
+    agg['ProfitLoss'] = agg['TotalValue'] - agg['TotalInvested']
+    return agg[AGGREGATE_COLUMNS + currency_columns]
+
+
+def portfolio_totals(aggregate):
+    total_invested = float(aggregate['TotalInvested'].sum())
+    total_value = float(aggregate['TotalValue'].sum())
+    total_pl = total_value - total_invested
+    total_pl_pct = (total_pl / total_invested * 100) if total_invested > 0 else 0
+    totals = {
+        'invested': total_invested,
+        'value': total_value,
+        'profit_loss': total_pl,
+        'profit_loss_pct': total_pl_pct,
+    }
+    # The totals above add up prices in whatever currency each symbol trades
+    # in; these are the same totals with everything converted to one currency
+    if all(c in aggregate.columns for c in CURRENCY_COLUMNS):
+        totals['by_currency'] = {}
+        for currency in ('ARS', 'USD'):
+            invested = float(aggregate[f'Invested{currency}'].sum())
+            value = float(aggregate[f'Value{currency}'].sum())
+            totals['by_currency'][currency] = {
+                'invested': invested,
+                'value': value,
+                'profit_loss': value - invested,
+                'profit_loss_pct': (value - invested) / invested * 100 if invested > 0 else 0,
+            }
+    return totals
@@ -0,0 +1,227 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from price_history import PriceHistory
+
+# Backtests of trading-bot strategies over the stored daily bars. Prices are
+# one contiguous float64 array (field x date x symbol, FIELDS order); every
+# strategy turns it into a long/flat position per date and symbol with
+# vectorized indicators. Signals are taken at the close and filled at the
+# next day's open, the capital is split equally across the symbols, and a
+# cost (fraction of the traded amount) is paid on every fill. Parameter
+# sweeps run on a process pool that reads the prices from shared memory.
+FIELDS = ("open", "high", "low", "close")
+OPEN, HIGH, LOW, CLOSE = range(len(FIELDS))
+TRADING_DAYS = 252
+DEFAULT_CAPITAL = 1_000_000.0
+DEFAULT_COST = 0.005  # broker commission + market fees, per fill
+
+
+# Indicators: dates x symbols arrays in, same shape out (NaN while warming up)
+
+def sma(values, window):
+    return pd.DataFrame(values).rolling(window, min_periods=window).mean().to_numpy()
+
+
+def ema(values, span):
+    return pd.DataFrame(values).ewm(span=span, adjust=False, min_periods=span).mean().to_numpy()
+
+
+def rsi(values, period=14):
+    # Wilder's RSI: smoothed average gain over smoothed average loss
+    change = np.diff(values, axis=0, prepend=np.nan)
+    smooth = dict(alpha=1 / period, adjust=False, min_periods=period)
+    gain = pd.DataFrame(np.clip(change, 0, None)).ewm(**smooth).mean().to_numpy()
+    loss = pd.DataFrame(np.clip(-change, 0, None)).ewm(**smooth).mean().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + gain / loss)
+
+
+_indicators = None  # {(indicator, array address, parameter): values} during a sweep
+
+
+def indicator(func, values, param):
+    # func(values, param), computed once per sweep: a grid repeats the same
+    # windows in many combinations
+    if _indicators is None:
+        return func(values, param)
+    key = (func.__name__, values.__array_interface__['data'][0], param)
+    if key not in _indicators:
+        _indicators[key] = func(values, param)
+    return _indicators[key]
+
+
+# Strategies: (prices, **params) -> position (1 long, 0 flat) per date/symbol
+
+def sma_cross(prices, fast=20, slow=50):
+    close = prices[CLOSE]
+    return (indicator(sma, close, fast) > indicator(sma, close, slow)).astype(float)
+
+
+def ema_cross(prices, fast=12, slow=26):
+    close = prices[CLOSE]
+    return (indicator(ema, close, fast) > indicator(ema, close, slow)).astype(float)
+
+
+def rsi_reversion(prices, period=14, lower=30, upper=70):
+    # Buy when oversold, hold until overbought
+    value = indicator(rsi, prices[CLOSE], period)
+    events = np.where(value < lower, 1.0, np.where(value > upper, 0.0, np.nan))
+    return pd.DataFrame(events).ffill().fillna(0.0).to_numpy()
+
+
+STRATEGIES = {
+    'sma_cross': sma_cross,
+    'ema_cross': ema_cross,
+    'rsi_reversion': rsi_reversion,
+}
+
+
+def load_prices(symbols, start=None, end=None):
+    # (contiguous field x date x symbol array, dates, symbols) from `prices`
+    matrices = [PriceHistory.get_matrix(symbols, start, end, field=field) for field in FIELDS]
+    dates = matrices[CLOSE].index
+    array = np.stack([m.reindex(dates).to_numpy(dtype=float) for m in matrices])
+    # Close-only bars (e.g. a rate stored by a refresh, or 0 in a feed's
+    # open/high/low) trade at the close
+    array[array <= 0] = np.nan
+    for field in (OPEN, HIGH, LOW):
+        array[field] = np.where(np.isnan(array[field]), array[CLOSE], array[field])
+    return np.ascontiguousarray(array), dates, list(matrices[CLOSE].columns)
+
+
+def simulate(prices, position, cost=DEFAULT_COST):
+    # Daily growth factor per symbol for a position series. The position
+    # decided at close t-1 is filled at the open of t: the night is held
+    # with yesterday's position, the day with today's.
+    op, close = prices[OPEN], prices[CLOSE]
+    held = np.where(np.isnan(close), 0.0, position)
+    today = np.vstack([np.zeros((1, held.shape[1])), held[:-1]])  # from the open of t
+    overnight = np.vstack([np.zeros((1, held.shape[1])), today[:-1]])  # from the close of t-1
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        night = 1 + overnight * (op / prev_close - 1)
+        day = 1 + today * (close / op - 1)
+    growth = np.nan_to_num(night, nan=1.0) * np.nan_to_num(day, nan=1.0)
+    growth *= (1 - cost) ** np.abs(today - overnight)
+    return growth, today
+
+
+def statistics(equity):
+    returns = np.diff(equity) / equity[:-1]
+    years = len(equity) / TRADING_DAYS
+    peak = np.maximum.accumulate(equity)
+    sd = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    return {
+        'total_return': float(equity[-1] / equity[0] - 1),
+        'cagr': float((equity[-1] / equity[0]) ** (1 / years) - 1) if years > 0 else 0.0,
+        'volatility': float(sd * np.sqrt(TRADING_DAYS)),
+        'sharpe': float(returns.mean() / sd * np.sqrt(TRADING_DAYS)) if sd > 0 else 0.0,
+        'max_drawdown': float((equity / peak - 1).min()),
+    }
+
+
+def run(prices, strategy, params, capital=DEFAULT_CAPITAL, cost=DEFAULT_COST):
+    # One strategy and parameter set: portfolio equity curve, equity per
+    # symbol, positions and statistics
+    position = STRATEGIES[strategy](prices, **params)
+    growth, held = simulate(prices, position, cost)
+    per_symbol = capital / prices.shape[2] * np.cumprod(growth, axis=0)
+    equity = per_symbol.sum(axis=1)
+    stats = statistics(equity)
+    stats['fills'] = int(np.abs(np.diff(held, axis=0, prepend=0)).sum())
+    stats['exposure'] = float(held.mean())
+    return {'equity': equity, 'symbol_equity': per_symbol, 'held': held, 'stats': stats}
+
+
+def fills(prices, dates, symbols, result, cost=DEFAULT_COST):
+    # BUY/SELL records in the transactions table format, to replay with
+    # PortfolioDB.add_transactions: each entry buys with the symbol's whole
+    # equity (after the cost) at the open, each exit sells what was bought
+    held, per_symbol, op = result['held'], result['symbol_equity'], prices[OPEN]
+    change = np.diff(held, axis=0, prepend=0)
+    entry_day, entry_symbol = np.nonzero(change > 0)
+    exit_day, exit_symbol = np.nonzero(change < 0)
+    # Entries happen from the second day on, with the equity of the
+    # previous close
+    cash = per_symbol[entry_day - 1, entry_symbol] * (1 - cost)
+    buys = pd.DataFrame({'day': entry_day, 'col': entry_symbol, 'Action': 'BUY',
+                         'Price': op[entry_day, entry_symbol]})
+    buys['Quantity'] = cash / buys['Price']
+    # An exit sells the quantity of the symbol's latest entry
+    sells = pd.DataFrame({'day': exit_day, 'col': exit_symbol, 'Action': 'SELL',
+                          'Price': op[exit_day, exit_symbol]})
+    records = pd.concat([buys, sells], ignore_index=True).sort_values(['col', 'day', 'Action'])
+    records['Quantity'] = records.groupby('col')['Quantity'].ffill()
+    records = records.sort_values(['day', 'col'], kind='stable')
+    return pd.DataFrame({
+        'Date': pd.DatetimeIndex(dates)[records['day']].strftime('%d/%m/%Y'),
+        'Symbol': np.asarray(symbols, dtype=object)[records['col']],
+        'Company': np.asarray(symbols, dtype=object)[records['col']],
+        'Action': records['Action'].to_numpy(),
+        'Quantity': records['Quantity'].round(6).to_numpy(),
+        'Price': records['Price'].round(4).to_numpy(),
+    })
+
+
+def parameter_grid(grid):
+    # {'fast': [5, 10], 'slow': [50]} -> [{'fast': 5, 'slow': 50}, ...]
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+# Sweeps: workers map the shared block once and run many parameter sets
+
+_shared = {}
+
+
+def _attach(name, shape):
+    global _indicators
+    _indicators = {}
+    block = shared_memory.SharedMemory(name=name)
+    _shared['block'] = block  # keep the mapping alive
+    _shared['prices'] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def _run_shared(strategy, params, capital, cost):
+    result = run(_shared['prices'], strategy, params, capital, cost)
+    return params, result['stats'], result['equity']
+
+
+@metrics.timed("backtest.sweep")
+def sweep(prices, strategy, grid, capital=DEFAULT_CAPITAL, cost=DEFAULT_COST, workers=None):
+    # Every parameter combination of `grid`; returns (results frame sorted by
+    # Sharpe ratio, {index: equity curve}). workers=1 runs in this process.
+    global _indicators
+    combos = parameter_grid(grid)
+    workers = workers or min(len(combos), os.cpu_count() or 1)
+    if workers <= 1:
+        _indicators = {}
+        try:
+            outputs = []
+            for params in combos:
+                result = run(prices, strategy, params, capital, cost)
+                outputs.append((params, result['stats'], result['equity']))
+        finally:
+            _indicators = None
+    else:
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        block = shared_memory.SharedMemory(create=True, size=prices.nbytes)
+        try:
+            np.ndarray(prices.shape, dtype=np.float64, buffer=block.buf)[:] = prices
+            with ProcessPoolExecutor(workers, initializer=_attach, initargs=(block.name, prices.shape)) as pool:
+                outputs = list(pool.map(_run_shared, itertools.repeat(strategy), combos,
+                                        itertools.repeat(capital), itertools.repeat(cost)))
+        finally:
+            block.close()
+            block.unlink()
+
+    results = pd.DataFrame([{**params, **stats} for params, stats, _ in outputs])
+    curves = {i: equity for i, (_, _, equity) in enumerate(outputs)}
+    return results.sort_values('sharpe', ascending=False), curves
@@ -0,0 +1,60 @@
+# Per-symbol aggregation: groupby().apply(lambda) versus aggregate_positions.
+# Usage: python -m benchmarks.bench_aggregation
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregation import value_positions, aggregate_positions
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def make_lots(lots, seed=3):
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i}.BA" for i in range(max(10, lots // 20))])
+    picked = rng.choice(symbols, lots)
+    prices = pd.Series(rng.uniform(100, 50000, len(symbols)), index=symbols)
+    return pd.DataFrame({
+        'Symbol': picked,
+        'Company': picked,
+        'Quantity': rng.integers(1, 100, lots).astype(float),
+        'BuyPrice': rng.uniform(100, 50000, lots),
+        'CurrentPrice': prices.loc[picked].to_numpy(),
+    })
+
+
+def apply_lambda(portfolio):
+    # The previous update_summary_table implementation
+    return portfolio.groupby('Symbol').apply(
+        lambda x: pd.Series({
+            'TotalQuantity': x['Quantity'].sum(),
+            'WeightedAvgPrice': (x['Quantity'] * x['BuyPrice']).sum() / x['Quantity'].sum() if x['Quantity'].sum() > 0 else 0,
+            'CurrentPrice': x['CurrentPrice'].iloc[0] if not x['CurrentPrice'].empty else 0,
+            'TotalValue': x['Value'].sum()
+        })
+    ).reset_index()
+
+
+def best_of(func, arg, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    print(f"{'lots':>8} {'apply(lambda)':>14} {'agg':>10} {'speedup':>8}")
+    for lots in SIZES:
+        portfolio = value_positions(make_lots(lots))
+        old, expected = best_of(apply_lambda, portfolio, repeat=3)
+        new, result = best_of(aggregate_positions, portfolio)
+        np.testing.assert_allclose(result['WeightedAvgPrice'], expected['WeightedAvgPrice'])
+        np.testing.assert_allclose(result['TotalValue'], expected['TotalValue'])
+        print(f"{lots:>8} {old * 1000:>12.2f}ms {new * 1000:>8.2f}ms {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Parameter sweep over synthetic daily bars (random walks, no database):
+# the same grid run in this process and on the shared-memory process pool,
+# with the indicator memoization on in both.
+# Usage: python -m benchmarks.bench_backtest [symbols] [days] [workers]
+import os
+import sys
+import time
+
+import numpy as np
+
+import backtest
+
+GRID = {'fast': [5, 10, 20, 30], 'slow': [50, 100, 150, 200]}
+
+
+def synthetic_prices(symbols, days, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (days, symbols)), axis=0))
+    gap = np.exp(rng.normal(0, 0.005, (days, symbols)))
+    op = np.vstack([close[:1], close[:-1]]) * gap
+    high = np.maximum(op, close) * 1.01
+    low = np.minimum(op, close) * 0.99
+    return np.ascontiguousarray(np.stack([op, high, low, close]))
+
+
+def main(symbols=500, days=2520, workers=None):
+    prices = synthetic_prices(symbols, days)
+    workers = workers or os.cpu_count() or 1
+    combos = len(backtest.parameter_grid(GRID))
+    print(f"{symbols} symbols x {days} days, {combos} combinations, {prices.nbytes / 1e6:.0f} MB of prices")
+
+    pool = max(workers, 2)
+    for label, count in (("sequential", 1), (f"{pool} workers", pool)):
+        start = time.perf_counter()
+        results, _ = backtest.sweep(prices, 'sma_cross', GRID, workers=count)
+        elapsed = time.perf_counter() - start
+        best = results.iloc[0]
+        print(f"{label:<12} {elapsed:>7.2f}s ({combos / elapsed:.1f} combinations/s), "
+              f"best fast={best['fast']:.0f} slow={best['slow']:.0f} sharpe={best['sharpe']:.2f}")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:4]))
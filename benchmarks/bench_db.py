@@ -0,0 +1,138 @@
+# Compares the old connect-per-call PortfolioDB against the shared connection.
+# Usage: python -m benchmarks.bench_db [ops]
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from portfolio_db import PortfolioDB
+
+SYMBOLS = [f"SYM{i}.BA" for i in range(50)]
+
+
+class LegacyPortfolioDB:
+    # The previous implementation: open, commit and close on every call
+    db_file = None
+
+    @staticmethod
+    def add_transaction(symbol, company, action, quantity, price, date):
+        conn = sqlite3.connect(LegacyPortfolioDB.db_file)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO transactions (date, symbol, company, action, quantity, price)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (date, symbol, company, action, quantity, price))
+        cursor.execute('SELECT quantity, avg_price FROM portfolio WHERE symbol = ?', (symbol,))
+        row = cursor.fetchone()
+        if row:
+            current_qty, current_avg = row
+            if action == 'BUY':
+                new_qty = current_qty + quantity
+                new_avg = ((current_qty * current_avg) + (quantity * price)) / new_qty
+                cursor.execute('UPDATE portfolio SET quantity = ?, avg_price = ? WHERE symbol = ?',
+                               (new_qty, new_avg, symbol))
+            elif action == 'SELL':
+                new_qty = max(0, current_qty - quantity)
+                if new_qty == 0:
+                    cursor.execute('DELETE FROM portfolio WHERE symbol = ?', (symbol,))
+                else:
+                    cursor.execute('UPDATE portfolio SET quantity = ? WHERE symbol = ?',
+                                   (new_qty, symbol))
+        else:
+            if action == 'BUY':
+                cursor.execute('INSERT INTO portfolio (symbol, company, quantity, avg_price) VALUES (?, ?, ?, ?)',
+                               (symbol, company, quantity, price))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def update_current_price(symbol, price):
+        conn = sqlite3.connect(LegacyPortfolioDB.db_file)
+        conn.execute('UPDATE portfolio SET current_price = ? WHERE symbol = ?', (price, symbol))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def get_symbol_quantity(symbol):
+        conn = sqlite3.connect(LegacyPortfolioDB.db_file)
+        row = conn.execute('SELECT quantity FROM portfolio WHERE symbol = ?', (symbol,)).fetchone()
+        conn.close()
+        return row[0] if row else 0
+
+    @staticmethod
+    def update_symbol(symbol, quantity, price):
+        conn = sqlite3.connect(LegacyPortfolioDB.db_file)
+        conn.execute('UPDATE portfolio SET quantity = ?, avg_price = ? WHERE symbol = ?',
+                     (quantity, price, symbol))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def get_portfolio_df():
+        import pandas as pd
+        conn = sqlite3.connect(LegacyPortfolioDB.db_file)
+        df = pd.read_sql_query("SELECT symbol as Symbol, company as Company, quantity as Quantity, avg_price as BuyPrice, current_price as CurrentPrice FROM portfolio", conn)
+        conn.close()
+        return df
+
+
+def make_workload(ops, seed=42):
+    # Mixed workload roughly shaped like a session: many price writes and
+    # quantity lookups, fewer trades and edits, occasional full reads.
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(ops):
+        symbol = rng.choice(SYMBOLS)
+        roll = rng.random()
+        if roll < 0.30:
+            action = 'BUY' if rng.random() < 0.8 else 'SELL'
+            workload.append(('add_transaction', (symbol, symbol, action, rng.randint(1, 20),
+                                                 rng.uniform(100, 1000), "01/01/2025")))
+        elif roll < 0.70:
+            workload.append(('update_current_price', (symbol, rng.uniform(100, 1000))))
+        elif roll < 0.95:
+            workload.append(('get_symbol_quantity', (symbol,)))
+        elif roll < 0.99:
+            workload.append(('update_symbol', (symbol, rng.randint(1, 50), rng.uniform(100, 1000))))
+        else:
+            workload.append(('get_portfolio_df', ()))
+    return workload
+
+
+def run(db_class, workload):
+    start = time.perf_counter()
+    for name, args in workload:
+        getattr(db_class, name)(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    workload = make_workload(ops)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_file = os.path.join(tmp, "legacy.db")
+        pooled_file = os.path.join(tmp, "pooled.db")
+
+        # Same schema for both, created through the new layer
+        PortfolioDB.use_database(legacy_file)
+        PortfolioDB.init_db()
+        PortfolioDB.close()
+        sqlite3.connect(legacy_file).execute('PRAGMA journal_mode=DELETE').connection.close()
+        LegacyPortfolioDB.db_file = legacy_file
+        legacy = run(LegacyPortfolioDB, workload)
+
+        PortfolioDB.use_database(pooled_file)
+        pooled = run(PortfolioDB, workload)
+        PortfolioDB.close()
+
+    print(f"{ops} mixed operations")
+    print(f"  connect-per-call: {legacy:8.3f}s  {ops / legacy:10.0f} ops/sec")
+    print(f"  shared connection: {pooled:7.3f}s  {ops / pooled:10.0f} ops/sec")
+    print(f"  speedup: {legacy / pooled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Compares row-by-row CSV migration against the bulk import path.
+# Usage: python -m benchmarks.bench_import [rows]
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from portfolio_db import PortfolioDB
+
+
+def make_statement(path, rows, seed=7):
+    rng = random.Random(seed)
+    symbols = [f"SYM{i}.BA" for i in range(200)]
+    records = []
+    for i in range(rows):
+        symbol = rng.choice(symbols)
+        records.append({
+            'Date': f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2020, 2025)}",
+            'Symbol': symbol,
+            'Company': symbol,
+            'Action': 'BUY' if rng.random() < 0.7 else 'SELL',
+            'Quantity': rng.randint(1, 50),
+            'Price': round(rng.uniform(100, 50000), 2),
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "statement.csv")
+        make_statement(csv_path, rows)
+
+        # Old path: one add_transaction (and one commit) per row
+        PortfolioDB.use_database(os.path.join(tmp, "rows.db"))
+        start = time.perf_counter()
+        for _, row in pd.read_csv(csv_path).iterrows():
+            PortfolioDB.add_transaction(row['Symbol'], row['Company'], row['Action'],
+                                        row['Quantity'], row['Price'], row['Date'])
+        per_row = time.perf_counter() - start
+        expected = PortfolioDB.get_portfolio_df().sort_values('Symbol').reset_index(drop=True)
+
+        PortfolioDB.use_database(os.path.join(tmp, "bulk.db"))
+        bulk = PortfolioDB.import_transactions_csv(csv_path)['seconds']
+        result = PortfolioDB.get_portfolio_df().sort_values('Symbol').reset_index(drop=True)
+        PortfolioDB.close()
+
+    pd.testing.assert_frame_equal(expected, result, check_exact=False, rtol=1e-9)
+    print(f"{rows} transactions")
+    print(f"  row by row: {per_row:7.3f}s  {rows / per_row:10.0f} rows/sec")
+    print(f"  bulk:       {bulk:7.3f}s  {rows / bulk:10.0f} rows/sec")
+    print(f"  speedup: {per_row / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
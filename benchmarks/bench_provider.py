@@ -0,0 +1,56 @@
+# Refresh latency with one request per symbol versus one batched get_quotes,
+# against a local HTTP stand-in that adds a fixed delay per request.
+# Usage: python -m benchmarks.bench_provider [symbols] [delay_ms]
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from market_data import StaticPriceProvider
+
+
+def serve(document, delay):
+    payload = json.dumps(document).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    symbols = [f"SYM{i}.BA" for i in range(count)]
+    server = serve({s: {"price": 100 + i} for i, s in enumerate(symbols)}, delay)
+    provider = StaticPriceProvider(f"http://127.0.0.1:{server.server_address[1]}/quotes")
+
+    start = time.perf_counter()
+    for symbol in symbols:
+        provider.get_quote(symbol)
+    per_symbol = time.perf_counter() - start
+
+    start = time.perf_counter()
+    quotes = provider.get_quotes(symbols)
+    batched = time.perf_counter() - start
+    server.shutdown()
+
+    assert len(quotes) == count
+    print(f"{count} symbols, {delay * 1000:.0f}ms per request")
+    print(f"  one request per symbol: {per_symbol:7.3f}s")
+    print(f"  batched get_quotes:     {batched:7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Date and symbol queries on the ledger: full scan plus DD/MM/YYYY parsing in
+# pandas (how they had to be done before trade_date) versus the indexed SQL
+# queries in PortfolioDB.
+# Usage: python -m benchmarks.bench_queries [transactions]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from portfolio_db import PortfolioDB, SQL_INSERT_TRANSACTION
+
+
+def make_ledger(rows, seed=13):
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i}.BA" for i in range(500)])
+    picked = rng.choice(symbols, rows)
+    days = pd.Timestamp('2015-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 3650, rows)), unit='D')
+    return pd.DataFrame({
+        'date': days.strftime('%d/%m/%Y'),
+        'trade_date': days.strftime('%Y-%m-%d'),
+        'symbol': picked,
+        'company': picked,
+        'action': rng.choice(['BUY', 'SELL'], rows, p=[0.7, 0.3]),
+        'quantity': rng.integers(1, 50, rows).astype(float),
+        'price': rng.uniform(100, 50000, rows).round(2),
+    })
+
+
+def scan():
+    # Old way: everything into pandas, parse the text dates, filter there
+    with PortfolioDB._lock:
+        df = pd.read_sql_query('SELECT * FROM transactions', PortfolioDB.connection())
+    df['parsed'] = pd.to_datetime(df['date'], format='%d/%m/%Y')
+    return df
+
+
+def scan_symbol(symbol):
+    df = scan()
+    return df[df['symbol'] == symbol].sort_values(['parsed', 'id'])
+
+
+def scan_range(start, end):
+    df = scan()
+    return df[(df['parsed'] >= start) & (df['parsed'] <= end)].sort_values(['parsed', 'id'])
+
+
+def scan_monthly():
+    df = scan()
+    df['amount'] = df['quantity'] * df['price']
+    return df.groupby([df['parsed'].dt.strftime('%Y-%m'), 'action']).agg(
+        trades=('id', 'size'), quantity=('quantity', 'sum'), amount=('amount', 'sum'))
+
+
+def best_of(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        PortfolioDB.use_database(os.path.join(tmp, "ledger.db"))
+        with PortfolioDB.transaction() as conn:
+            conn.executemany(SQL_INSERT_TRANSACTION, make_ledger(rows).itertuples(index=False, name=None))
+        PortfolioDB.connection().execute('ANALYZE')
+
+        cases = [
+            ("history for SYM7.BA", (scan_symbol, 'SYM7.BA'), (PortfolioDB.get_symbol_history, 'SYM7.BA')),
+            ("trades in 2020 Q3", (scan_range, '2020-07-01', '2020-09-30'),
+             (PortfolioDB.get_trades, '01/07/2020', '30/09/2020')),
+            ("monthly summary", (scan_monthly,), (PortfolioDB.get_monthly_summary,)),
+        ]
+        print(f"{rows} transactions")
+        print(f"  {'query':22} {'scan+parse':>11} {'indexed':>10} {'speedup':>8}")
+        for name, (old_func, *old_args), (new_func, *new_args) in cases:
+            old, expected = best_of(old_func, *old_args)
+            new, result = best_of(new_func, *new_args)
+            assert len(result) == len(expected), (name, len(result), len(expected))
+            print(f"  {name:22} {old * 1000:9.1f}ms {new * 1000:8.1f}ms {old / new:7.1f}x")
+        PortfolioDB.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Rebalancing speed: rebalance() on one large portfolio (what runs after a
+# price refresh) and rebalance_matrix() on many accounts at once.
+# Usage: python -m benchmarks.bench_rebalance [symbols] [accounts]
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from rebalance import rebalance, rebalance_matrix
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(n_symbols=5_000, accounts=1_000):
+    rng = np.random.default_rng(3)
+    symbols = [f"SYM{i}.BA" if i % 2 else f"SYM{i}" for i in range(n_symbols)]
+    prices = rng.uniform(5, 50_000, n_symbols)
+    quantity = rng.integers(0, 200, n_symbols).astype(float)
+    portfolio = pd.DataFrame({'Symbol': symbols, 'Quantity': quantity, 'CurrentPrice': prices,
+                              'Value': quantity * prices})
+    targets = {s: w for s, w in zip(symbols, rng.dirichlet(np.ones(n_symbols)))}
+
+    seconds, (orders, summary) = best_of(lambda: rebalance(portfolio, targets, cash=1e6, tolerance=0.0005,
+                                                           min_trade=1_000))
+    print(f"rebalance, {n_symbols:,} symbols              {seconds * 1000:8.1f} ms  "
+          f"{len(orders):,} orders, drift {summary['max_drift_before']:.2%} -> {summary['max_drift_after']:.2%}")
+
+    n = 500
+    values = rng.uniform(0, 1e5, (accounts, n))
+    weights = rng.dirichlet(np.ones(n), accounts)
+    seconds, shares = best_of(lambda: rebalance_matrix(values, prices[:n], weights, cash=rng.uniform(0, 1e5, accounts),
+                                                       tolerance=0.0005))
+    print(f"rebalance_matrix, {accounts:,} accounts x {n} {seconds * 1000:8.1f} ms  "
+          f"{int((shares != 0).sum()):,} orders")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,72 @@
+# Portfolio rebuild from the ledger: full replay versus replay from the last
+# snapshot after a batch of new transactions.
+# Usage: python -m benchmarks.bench_rebuild [transactions]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from portfolio_db import PortfolioDB, SQL_INSERT_TRANSACTION
+
+NEW_TRANSACTIONS = 1_000
+
+
+def make_ledger(rows, seed=11):
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i}.BA" for i in range(500)])
+    picked = rng.choice(symbols, rows)
+    actions = rng.choice(['BUY', 'SELL', 'ADJUST', 'CLOSE'], rows, p=[0.6, 0.37, 0.02, 0.01])
+    return pd.DataFrame({
+        'date': '01/01/2025',
+        'trade_date': '2025-01-01',
+        'symbol': picked,
+        'company': picked,
+        'action': actions,
+        'quantity': rng.integers(1, 50, rows).astype(float),
+        'price': rng.uniform(100, 50000, rows).round(2),
+    })
+
+
+def insert(ledger):
+    with PortfolioDB.transaction() as conn:
+        conn.executemany(SQL_INSERT_TRANSACTION, ledger.itertuples(index=False, name=None))
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def positions():
+    return PortfolioDB.get_portfolio_df().sort_values('Symbol').reset_index(drop=True)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        PortfolioDB.use_database(os.path.join(tmp, "ledger.db"))
+        insert(make_ledger(rows))
+        full = timed(PortfolioDB.rebuild_portfolio, full=True)
+
+        insert(make_ledger(NEW_TRANSACTIONS, seed=12))
+        incremental = timed(PortfolioDB.rebuild_portfolio)
+        result = positions()
+        full_again = timed(PortfolioDB.rebuild_portfolio, full=True)
+        expected = positions()
+        PortfolioDB.close()
+
+    pd.testing.assert_frame_equal(expected, result, check_exact=False, rtol=1e-9)
+    print(f"{rows} transactions")
+    print(f"  full rebuild:                {full:7.3f}s  {rows / full:12,.0f} rows/sec")
+    print(f"  full rebuild (+{NEW_TRANSACTIONS}):        {full_again:7.3f}s")
+    print(f"  from snapshot (+{NEW_TRANSACTIONS}):       {incremental:7.3f}s")
+    print(f"  speedup: {full_again / incremental:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Risk analytics on a synthetic 500 symbols x 10 years of daily closes: the
+# first call loads the closes from SQLite, later calls reuse the cached
+# returns matrix, and a new daily bar only reloads that day.
+# Usage: python -m benchmarks.bench_risk [symbols] [days]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import risk
+from portfolio_db import PortfolioDB
+from price_history import PriceHistory
+
+
+def make_history(symbols, days, seed=5):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2015-01-01', periods=days)
+    market = rng.normal(0.0003, 0.012, days)
+    returns = market[:, None] * rng.uniform(0.5, 1.5, len(symbols)) + rng.normal(0, 0.015, (days, len(symbols)))
+    closes = 100 * np.exp(np.cumsum(returns, axis=0))
+    history = pd.DataFrame({
+        'symbol': np.repeat(symbols, days),
+        'date': np.tile(dates.strftime('%Y-%m-%d'), len(symbols)),
+        'close': closes.T.ravel(),
+    })
+    for field in ('open', 'high', 'low'):
+        history[field] = history['close']
+    history['volume'] = 0.0
+    return history, dates
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:36} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(n_symbols=500, days=2520):
+    symbols = [f"SYM{i}.BA" for i in range(n_symbols)]
+    with tempfile.TemporaryDirectory() as tmp:
+        PortfolioDB.use_database(os.path.join(tmp, "risk.db"))
+        history, dates = make_history(symbols, days)
+        timed(f"store {len(history):,} bars", lambda: PriceHistory.store(history))
+        portfolio = pd.DataFrame({'Symbol': symbols, 'Value': np.random.default_rng(1).uniform(1e3, 1e6, n_symbols)})
+
+        timed("analyze, cold (loads closes)", lambda: risk.analyze(portfolio, benchmark=symbols[0]))
+        report = timed("analyze, cached", lambda: risk.analyze(portfolio, benchmark=symbols[0]))
+
+        next_day = (dates[-1] + pd.offsets.BDay()).strftime('%Y-%m-%d')
+        bar = history[history['date'] == history['date'].iloc[days - 1]].assign(date=next_day)
+        PriceHistory.store(bar)
+        timed("analyze, after one new daily bar", lambda: risk.analyze(portfolio, benchmark=symbols[0]))
+
+        closes = PriceHistory.get_matrix(symbols, fill=False).to_numpy()
+        timed("returns + covariance only", lambda: risk.covariance(risk.simple_returns(closes)))
+        PortfolioDB.close()
+
+    p = report['portfolio']
+    print(f"portfolio volatility {p['volatility']:.2%}, beta {p['beta']:.2f}, "
+          f"historical VaR {p['var']['historical_var']:.2%}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
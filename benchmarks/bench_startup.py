@@ -0,0 +1,41 @@
+# Cold start time of the CLI and GUI entry points, each in a fresh interpreter.
+# The GUI is measured up to import (creating the window needs a display).
+# Usage: python -m benchmarks.bench_startup [runs]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(args, runs, cwd):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=cwd, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    cli = os.path.join(ROOT, "cli.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "portfolio.db")
+        cases = [
+            ("python (baseline)", ["-c", "pass"]),
+            ("cli.py --help", [cli, "--help"]),
+            ("cli.py report", [cli, "--db", db, "report"]),
+            ("import stock_tracker (GUI)", ["-c", f"import sys; sys.path.insert(0, {ROOT!r}); import stock_tracker"]),
+        ]
+        print(f"median of {runs} runs")
+        for name, args in cases:
+            print(f"  {name:30} {time_command(args, runs, tmp) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
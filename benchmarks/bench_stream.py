@@ -0,0 +1,47 @@
+# Streaming feed under load: the stand-in server pushes ticks at a high rate
+# through TcpPriceFeed into the TickBuffer, and a FrameCoalescer driven by a
+# fake after() counts how many UI updates that turns into (one per tick
+# before, at most one per frame now).
+# Usage: python -m benchmarks.bench_stream [ticks_per_second] [seconds]
+import sys
+import time
+
+from price_stream import DEFAULT_FRAME_MS, FrameCoalescer, StandInFeedServer, TcpPriceFeed, TickBuffer
+
+SYMBOLS = [f"SYM{i}.BA" for i in range(50)]
+
+
+def main(rate=20_000, seconds=3.0):
+    server = StandInFeedServer(rate=rate).start()
+    buffer = TickBuffer()
+    feed = TcpPriceFeed(*server.address)
+    feed.subscribe(SYMBOLS)
+
+    applied = []
+    pending = []
+    coalescer = FrameCoalescer(buffer, lambda latest: applied.append(len(latest)),
+                               lambda ms, callback: pending.append(callback))
+    feed.start(buffer.push)
+    coalescer.start()
+
+    # Main loop stand-in: run the scheduled frame every DEFAULT_FRAME_MS
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        time.sleep(DEFAULT_FRAME_MS / 1000)
+        if pending:
+            pending.pop(0)()
+    elapsed = time.perf_counter() - start
+    feed.stop()
+    server.stop()
+
+    print(f"ticks received      {buffer.received:>9,} ({buffer.received / elapsed:,.0f}/s)")
+    print(f"UI updates before   {buffer.received:>9,} (one per tick)")
+    print(f"UI updates now      {coalescer.frames:>9,} ({coalescer.frames / elapsed:.1f}/s, "
+          f"frame {DEFAULT_FRAME_MS} ms)")
+    if applied:
+        print(f"symbols per update  {sum(applied) / len(applied):>9.1f} (max {max(applied)})")
+    print(f"ring buffer         {len(buffer.history(SYMBOLS[0])):>9} ticks kept for {SYMBOLS[0]}")
+
+
+if __name__ == "__main__":
+    main(*(float(a) if i else int(a) for i, a in enumerate(sys.argv[1:3])))
@@ -0,0 +1,183 @@
+# Synthetic-load benchmark suite: builds portfolios of increasing size in a
+# temp portfolio.db, with a stubbed price provider and USD/ARS source, and
+# times the operations the app performs. Results are printed as a table and
+# can be written as JSON (--json) and compared with a previous run
+# (--compare) to catch regressions.
+# Usage: python -m benchmarks.suite [--sizes 100,1000,10000,100000]
+#            [--max-transactions 1000000] [--json out.json] [--compare old.json]
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import core
+import fx
+import market_data
+from aggregation import aggregate_positions, portfolio_totals, value_positions
+from market_data import PriceProvider, Quote
+from portfolio_db import PortfolioDB
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+TRANSACTIONS_PER_LOT = 10
+SINGLE_TRANSACTIONS = 1_000  # add_transaction calls timed per size
+REGRESSION_THRESHOLD = 1.2  # slower than this ratio is reported...
+REGRESSION_MIN_SECONDS = 0.005  # ...if it also lost this much (timer noise)
+
+
+class StubPriceProvider(PriceProvider):
+    # Deterministic prices for any symbol, no network
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def get_quotes(self, symbols, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        now = datetime.now()
+        return {s: Quote(s, 100.0 + zlib.crc32(s.encode()) % 10_000 / 10, now, None) for s in symbols}
+
+
+def make_ledger(lots, transactions, seed=1):
+    # Every lot is opened by a BUY, the rest is 75% buys and 25% sells
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i}.BA" for i in range(lots)])
+    extra = max(0, transactions - lots)
+    picked = np.concatenate([symbols, rng.choice(symbols, extra)])
+    actions = np.concatenate([np.full(lots, 'BUY'), rng.choice(['BUY', 'SELL'], extra, p=[0.75, 0.25])])
+    days = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 2000, len(picked)), unit='D')
+    return pd.DataFrame({
+        'Date': days.strftime('%d/%m/%Y'),
+        'Symbol': picked,
+        'Company': picked,
+        'Action': actions,
+        'Quantity': rng.integers(1, 20, len(picked)),
+        'Price': rng.uniform(100, 50_000, len(picked)).round(2),
+    })
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_size(tmp, lots, max_transactions):
+    transactions = min(lots * TRANSACTIONS_PER_LOT, max_transactions)
+    csv_path = os.path.join(tmp, f"ledger_{lots}.csv")
+    make_ledger(lots, transactions).to_csv(csv_path, index=False)
+    PortfolioDB.use_database(os.path.join(tmp, f"portfolio_{lots}.db"))
+    results = []
+
+    def record(case, seconds, ops):
+        results.append({'case': case, 'lots': lots, 'transactions': transactions, 'seconds': seconds,
+                        'ops': ops, 'ops_per_sec': ops / seconds if seconds > 0 else None})
+
+    # CSV migration (bulk import + rebuild) also populates the database
+    record('csv_migration', PortfolioDB.import_transactions_csv(csv_path)['seconds'], transactions)
+
+    portfolio = PortfolioDB.get_portfolio_df()
+    record('get_portfolio_df', best_of(PortfolioDB.get_portfolio_df), len(portfolio))
+
+    # Full refresh: batched quotes, FX and the bulk price write-back
+    symbols = portfolio['Symbol'].unique().tolist()
+    record('full_refresh', best_of(lambda: core.refresh_prices(symbols), repeat=1), len(symbols))
+
+    portfolio = PortfolioDB.get_portfolio_df()
+    record('valuation_columns', best_of(lambda: value_positions(portfolio.copy())), len(portfolio))
+    valued = value_positions(portfolio.copy())
+    record('summary_aggregation', best_of(lambda: portfolio_totals(aggregate_positions(valued))), len(valued))
+
+    record('rebuild_full', best_of(lambda: PortfolioDB.rebuild_portfolio(full=True), repeat=1), transactions)
+
+    # Individual trades on the populated database, one commit each
+    rng = np.random.default_rng(2)
+    trades = [(symbols[i], symbols[i], 'BUY' if rng.random() < 0.75 else 'SELL', int(rng.integers(1, 20)),
+               float(rng.uniform(100, 50_000)), "01/01/2025")
+              for i in rng.integers(0, len(symbols), SINGLE_TRANSACTIONS)]
+    start = time.perf_counter()
+    for trade in trades:
+        PortfolioDB.add_transaction(*trade)
+    record('add_transaction', time.perf_counter() - start, len(trades))
+
+    PortfolioDB.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def compare(results, path):
+    # Cases that got slower than REGRESSION_THRESHOLD times the previous run
+    with open(path, encoding="utf-8") as f:
+        previous = {(r['case'], r['lots']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        old = previous.get((r['case'], r['lots']))
+        if old and old['seconds'] > 0:
+            ratio = r['seconds'] / old['seconds']
+            slower = ratio > REGRESSION_THRESHOLD and r['seconds'] - old['seconds'] > REGRESSION_MIN_SECONDS
+            print(f"  {r['case']:22} {r['lots']:>8} {ratio:6.2f}x {'REGRESSION' if slower else ''}")
+            if slower:
+                regressions.append(r)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic-load benchmarks")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="lots per portfolio")
+    parser.add_argument("--max-transactions", type=int, default=1_000_000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every stub quote batch")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="previous --json output to compare against")
+    args = parser.parse_args(argv)
+
+    market_data.set_provider(StubPriceProvider(args.latency))
+    fx.set_fx_service(fx.FxService(sources={"Stub": lambda timeout: 1000.0}, priority=["Stub"]))
+
+    results = []
+    print(f"{'case':22} {'lots':>8} {'txns':>9} {'seconds':>10} {'ops/sec':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for lots in (int(s) for s in args.sizes.split(",")):
+            for r in run_size(tmp, lots, args.max_transactions):
+                results.append(r)
+                print(f"{r['case']:22} {r['lots']:>8} {r['transactions']:>9} {r['seconds']:>10.4f} "
+                      f"{r['ops_per_sec'] or 0:>12,.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.compare:
+        print(f"Compared with {args.compare}:")
+        if compare(results, args.compare):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
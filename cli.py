@@ -0,0 +1,392 @@
+# Command line interface for the portfolio, usable without a display.
+#   python cli.py refresh            fetch prices and the USD/ARS rate
+#   python cli.py report [--json]    valuation per position and totals
+#   python cli.py import FILE        bulk import a cartera/broker CSV
+#   python cli.py rebuild [--full]   recompute positions from the ledger
+#   python cli.py trades [--symbol S] [--from D] [--to D] [--monthly]
+#   python cli.py schedule [--watch] what the auto refresh would fetch now
+#   python cli.py --metrics {table,json,prometheus} COMMAND   timings after COMMAND
+#   python cli.py export FILE [--transactions]
+#   python cli.py feed-server [--port P] [--rate N]   stand-in streaming feed
+#   python cli.py risk [--backfill] [--benchmark S] [--correlation] [--json]
+#   python cli.py rebalance [--set T=W ...] [--cash X] [--by currency|market]
+#   python cli.py backtest STRATEGY [--grid P=V1,V2 ...] [--fills FILE]
+#   python cli.py lots [--method fifo|lifo|hifo] [--realized [--by year|month|symbol]]
+import argparse
+import json
+import sys
+import time
+
+import core
+import metrics
+from price_stream import StandInFeedServer
+from scheduler import DEFAULT_BUDGET, DEFAULT_INTERVAL, RefreshScheduler
+
+
+def cmd_refresh(args):
+    result = core.refresh_prices()
+    prices = result['prices']
+    failed = [symbol for symbol, price in prices.items() if not price]
+    print(f"Updated {len(prices) - len(failed)} of {len(prices)} symbols")
+    if failed:
+        print(f"No price for: {', '.join(failed)}")
+    fx_rate = result['fx_rate']
+    print(f"USD/ARS ({fx_rate.source}): ${fx_rate.rate:,.2f}" if fx_rate else "USD/ARS: No disponible")
+    if args.history:
+        from price_history import PriceHistory
+        from valuation import FX_SYMBOL
+        # The USD/ARS series too: cost bases convert at each trade's date
+        stored = PriceHistory.backfill(list(prices) + [FX_SYMBOL])
+        print(f"Stored {stored} daily bars")
+
+
+def cmd_report(args):
+    portfolio, _, totals = core.value_portfolio()
+    if args.json:
+        print(json.dumps({
+            'positions': portfolio.to_dict(orient='records'),
+            'totals': totals,
+        }, indent=2, default=str))
+        return
+    if portfolio.empty:
+        print("Portafolio vacío")
+        return
+    columns = ['Symbol', 'Quantity', 'BuyPrice', 'CurrentPrice', 'Value', 'ProfitLoss']
+    if 'Currency' in portfolio.columns:
+        columns += ['Currency', 'ValueARS', 'ValueUSD']
+    print(portfolio[columns].to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    print()
+    print(f"Total Invertido: ${totals['invested']:,.2f}")
+    print(f"Valor Actual:    ${totals['value']:,.2f}")
+    print(f"G/P Total:       ${totals['profit_loss']:,.2f} ({totals['profit_loss_pct']:.2f}%)")
+    for currency, t in totals.get('by_currency', {}).items():
+        print(f"En {currency}:          invertido ${t['invested']:,.2f}, valor ${t['value']:,.2f}, "
+              f"G/P ${t['profit_loss']:,.2f} ({t['profit_loss_pct']:.2f}%)")
+
+
+def cmd_import(args):
+    core.import_csv(args.file)
+
+
+def cmd_rebuild(args):
+    start = time.perf_counter()
+    positions = core.rebuild_portfolio(full=args.full)
+    print(f"Rebuilt {positions} positions in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def cmd_trades(args):
+    if args.monthly:
+        df = core.monthly_summary(args.start, args.end, symbol=args.symbol)
+    else:
+        df = core.trades(args.start, args.end, symbol=args.symbol).drop(columns='Id')
+    if df.empty:
+        print("Sin operaciones")
+        return
+    print(df.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+
+def cmd_lots(args):
+    import lots
+
+    open_lots, realized = core.tax_lots(args.method)
+    if args.symbol:
+        open_lots = open_lots[open_lots['Symbol'] == args.symbol.upper()]
+        realized = realized[realized['Symbol'] == args.symbol.upper()]
+    if args.realized:
+        if args.start or args.end:
+            from portfolio_db import iso_date
+            dates = realized['Date']
+            realized = realized[(dates >= (iso_date(args.start) or '')) & (dates <= (iso_date(args.end) or '9999'))]
+        if realized.empty:
+            print("Sin ventas")
+            return
+        table = lots.realized_summary(realized, args.by) if args.by else realized
+        if args.csv:
+            table.to_csv(args.csv, index=False)
+        print(table.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+        print()
+        print(f"G/P realizada ({args.method}): ${realized['Gain'].sum():,.2f} "
+              f"sobre ${realized['Cost'].sum():,.2f} de costo, {realized['SaleId'].nunique()} ventas")
+        return
+    if open_lots.empty:
+        print("Sin lotes abiertos")
+        return
+    if args.csv:
+        open_lots.to_csv(args.csv, index=False)
+    columns = ['LotId', 'Symbol', 'Date', 'Quantity', 'BuyPrice', 'CurrentPrice', 'Cost', 'Value',
+               'Unrealized', 'UnrealizedPct', 'HoldingDays']
+    print(open_lots[columns].to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    print()
+    cost, unrealized = open_lots['Cost'].sum(), open_lots['Unrealized'].sum()
+    print(f"G/P no realizada: ${unrealized:,.2f} ({unrealized / cost * 100 if cost else 0:.2f}%) "
+          f"en {len(open_lots)} lotes")
+    print(f"G/P realizada ({args.method}): ${realized['Gain'].sum():,.2f}")
+
+
+def cmd_schedule(args):
+    scheduler = RefreshScheduler(interval=args.interval, budget=args.budget)
+    for row in scheduler.status():
+        age = f"{row['age']:.0f}s" if row['age'] is not None else "nunca"
+        state = "abierto" if row['open'] else "cerrado"
+        print(f"{row['symbol']:12} {row['market']:5} {state:8} edad {age:>9}  "
+              f"score {row['score']:10.0f}  {'DUE' if row['due'] else ''}")
+    if not args.watch:
+        return
+    print(f"Refreshing every {scheduler.tick}s, budget {scheduler.budget} symbols/min (Ctrl+C to stop)")
+    try:
+        while True:
+            print(json.dumps(scheduler.run_once()))
+            time.sleep(scheduler.tick)
+    except KeyboardInterrupt:
+        pass
+
+
+def cmd_export(args):
+    rows = core.export_csv(args.file, transactions=args.transactions)
+    print(f"Exported {rows} rows to {args.file}")
+
+
+def cmd_risk(args):
+    import pandas as pd
+
+    report = core.risk_report(start=args.start, benchmark=args.benchmark, confidence=args.confidence,
+                              horizon=args.horizon, backfill=args.backfill)
+    if report is None:
+        print("Sin posiciones valuadas")
+        return
+    if args.json:
+        print(json.dumps(report, indent=2, default=lambda v: v.to_dict() if hasattr(v, 'to_dict') else str(v)))
+        return
+    p = report['portfolio']
+    print(f"Historia: {report['start']} a {report['end']} ({report['days']} ruedas)")
+    if report['missing']:
+        print(f"Sin historia (use --backfill): {', '.join(report['missing'])}")
+    table = pd.DataFrame({'Volatilidad': report['volatility'], 'Aporte al riesgo': report['risk_contribution']})
+    print(table.to_string(float_format=lambda v: f"{v:.2%}"))
+    print()
+    print(f"Volatilidad anual: {p['volatility']:.2%}")
+    if p['beta'] is not None:
+        print(f"Beta vs {p['benchmark']}: {p['beta']:.2f}")
+    var = p['var']
+    if var:
+        label = f"{p['confidence']:.0%}, {p['horizon']}d"
+        print(f"VaR histórico ({label}):    {var['historical_var']:.2%} (${var['historical_var_amount']:,.2f})")
+        print(f"CVaR histórico ({label}):   {var['historical_cvar']:.2%} (${var['historical_cvar_amount']:,.2f})")
+        print(f"VaR paramétrico ({label}):  {var['parametric_var']:.2%} (${var['parametric_var_amount']:,.2f})")
+        print(f"CVaR paramétrico ({label}): {var['parametric_cvar']:.2%} (${var['parametric_cvar_amount']:,.2f})")
+    exposure = report['exposure']
+    print()
+    for title, key in (("Moneda", 'currency'), ("Mercado", 'market'), ("Mayores posiciones", 'top')):
+        print(f"{title}: " + ", ".join(f"{k} {v:.1%}" for k, v in exposure[key].items()))
+    print(f"Concentración (Herfindahl): {exposure['herfindahl']:.3f}")
+    if args.correlation:
+        print()
+        print(report['correlation'].to_string(float_format=lambda v: f"{v:.2f}"))
+
+
+def parse_pairs(pairs, kind=float):
+    # ["META.BA=0.3", ...] -> {"META.BA": 0.3}
+    result = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        result[key.strip()] = kind(value)
+    return result
+
+
+def cmd_rebalance(args):
+    from portfolio_db import PortfolioDB
+
+    if args.set or args.remove or args.clear:
+        changes = parse_pairs(args.set)
+        changes.update(dict.fromkeys(args.remove or []))
+        PortfolioDB.set_targets(changes, replace=args.clear)
+    targets = PortfolioDB.get_targets()
+    if not targets:
+        print("Sin objetivos: use --set SIMBOLO=PESO (o una clase: ARS=0.6 --by currency)")
+        return
+    orders, summary = core.rebalance_plan(cash=args.cash, classify=args.by, tolerance=args.tolerance,
+                                          min_trade=args.min_trade, lots=parse_pairs(args.lot, int),
+                                          prices=parse_pairs(args.price), solver="milp" if args.milp else None)
+    if args.json:
+        print(json.dumps({'targets': targets, 'orders': orders.to_dict(orient='records'), 'summary': summary},
+                         indent=2))
+        return
+    print("Objetivos: " + ", ".join(f"{t} {w:.1%}" for t, w in targets.items()))
+    if orders.empty and summary['max_drift_before'] <= summary['tolerance']:
+        print("Sin órdenes: la cartera está dentro de la tolerancia")
+    elif orders.empty:
+        # Off target, but nothing to sell and no cash to buy with
+        hint = "use --cash X"
+        if summary['untargeted']:
+            hint += f" o fije objetivos para {', '.join(summary['untargeted'])} (0 las vende)"
+        print(f"Sin órdenes: el desvío ({summary['max_drift_before']:.1%}) supera la tolerancia "
+              f"({summary['tolerance']:.1%}) pero ninguna orden entra en el efectivo y las ventas disponibles; {hint}")
+    else:
+        print(orders.to_string(index=False, formatters={
+            'Weight': "{:.1%}".format, 'NewWeight': "{:.1%}".format, 'Target': "{:.1%}".format},
+            float_format=lambda v: f"{v:,.2f}"))
+    print()
+    print(f"Compras ${summary['bought']:,.2f}, ventas ${summary['sold']:,.2f}, "
+          f"efectivo restante ${summary['cash_left']:,.2f}")
+    print(f"Desvío máximo: {summary['max_drift_before']:.1%} -> {summary['max_drift_after']:.1%}")
+    if summary['untargeted']:
+        print(f"Sin objetivo (no se operan): {', '.join(summary['untargeted'])}")
+    if summary['missing']:
+        print(f"Sin precio (use --price SIMBOLO=PRECIO): {', '.join(summary['missing'])}")
+
+
+def cmd_backtest(args):
+    import backtest
+    from portfolio_db import iso_date
+
+    symbols = args.symbols or core.load_portfolio()['Symbol'].unique().tolist()
+    start, end = iso_date(args.start) if args.start else None, iso_date(args.end) if args.end else None
+    if args.backfill:
+        from price_history import DEFAULT_START, PriceHistory
+        PriceHistory.backfill(symbols, start=start or DEFAULT_START, end=end)
+    prices, dates, symbols = backtest.load_prices(symbols, start, end)
+    if len(dates) < 2:
+        print("Sin historia de precios (use --backfill)")
+        return
+    grid = {name: [float(v) if "." in v else int(v) for v in values.split(",")]
+            for name, values in parse_pairs(args.grid, str).items()}
+    results, _ = backtest.sweep(prices, args.strategy, grid, capital=args.capital, cost=args.cost,
+                                workers=args.workers)
+    print(f"{args.strategy}: {len(symbols)} símbolos, {dates[0]:%d/%m/%Y} a {dates[-1]:%d/%m/%Y}, "
+          f"{len(results)} combinaciones")
+    print(results.head(args.top).to_string(index=False, float_format=lambda v: f"{v:,.4f}"))
+    if args.fills:
+        best = {name: type(grid[name][0])(results.iloc[0][name]) for name in grid}
+        result = backtest.run(prices, args.strategy, best, args.capital, args.cost)
+        records = backtest.fills(prices, dates, symbols, result, args.cost)
+        records.to_csv(args.fills, index=False)
+        print(f"{len(records)} operaciones de {best} en {args.fills} (cli.py --db OTRA.db import {args.fills})")
+
+
+def cmd_feed_server(args):
+    # Random walk from the last known prices; the app connects with
+    # PRICE_FEED=127.0.0.1:PORT
+    portfolio = core.load_portfolio()
+    prices = portfolio.groupby('Symbol')['CurrentPrice'].max()
+    server = StandInFeedServer(args.host, args.port, rate=args.rate,
+                               start_prices={s: p for s, p in prices.items() if p > 0})
+    host, port = server.address
+    print(f"Streaming {args.rate} ticks/s on {host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Portafolio sin interfaz gráfica")
+    parser.add_argument("--db", help="SQLite file to use instead of portfolio.db")
+    parser.add_argument("--metrics", choices=["table", "json", "prometheus"],
+                        help="collect timings and counters and print them after the command")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    refresh = commands.add_parser("refresh", help="fetch current prices and USD/ARS")
+    refresh.add_argument("--history", action="store_true", help="also backfill daily price history")
+    refresh.set_defaults(func=cmd_refresh)
+
+    report = commands.add_parser("report", help="print the valuation")
+    report.add_argument("--json", action="store_true")
+    report.set_defaults(func=cmd_report)
+
+    imp = commands.add_parser("import", help="bulk import transactions from a CSV")
+    imp.add_argument("file")
+    imp.set_defaults(func=cmd_import)
+
+    rebuild = commands.add_parser("rebuild", help="recompute positions from the transactions ledger")
+    rebuild.add_argument("--full", action="store_true", help="replay the whole ledger instead of from the last snapshot")
+    rebuild.set_defaults(func=cmd_rebuild)
+
+    trades = commands.add_parser("trades", help="list transactions by date range and symbol")
+    trades.add_argument("--symbol")
+    trades.add_argument("--from", dest="start", help="first date, DD/MM/YYYY or YYYY-MM-DD")
+    trades.add_argument("--to", dest="end", help="last date (inclusive)")
+    trades.add_argument("--monthly", action="store_true", help="totals per month and action")
+    trades.set_defaults(func=cmd_trades)
+
+    lots = commands.add_parser("lots", help="open tax lots and realized P&L per sale")
+    lots.add_argument("--method", choices=["fifo", "lifo", "hifo"], default="fifo",
+                      help="lot matching for sells without a specific lot")
+    lots.add_argument("--symbol")
+    lots.add_argument("--realized", action="store_true", help="realized P&L per lot sold")
+    lots.add_argument("--by", choices=["year", "month", "symbol"], help="summarize realized P&L")
+    lots.add_argument("--from", dest="start", help="first sale date (DD/MM/YYYY or ISO)")
+    lots.add_argument("--to", dest="end", help="last sale date")
+    lots.add_argument("--csv", help="also write the table to a CSV file")
+    lots.set_defaults(func=cmd_lots)
+
+    schedule = commands.add_parser("schedule", help="show (or run) the automatic refresh schedule")
+    schedule.add_argument("--watch", action="store_true", help="keep refreshing and log every decision")
+    schedule.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="seconds before a price is stale")
+    schedule.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="symbols fetched per minute at most")
+    schedule.set_defaults(func=cmd_schedule)
+
+    export = commands.add_parser("export", help="export positions (or the ledger) to CSV")
+    export.add_argument("file")
+    export.add_argument("--transactions", action="store_true", help="export the transactions ledger")
+    export.set_defaults(func=cmd_export)
+
+    risk = commands.add_parser("risk", help="volatility, correlation, beta, VaR/CVaR and exposure")
+    risk.add_argument("--from", dest="start", help="first day of history to use, YYYY-MM-DD")
+    risk.add_argument("--benchmark", help="symbol for the beta (default ^MERV, '' for none)")
+    risk.add_argument("--confidence", type=float, help="VaR confidence level (default 0.95)")
+    risk.add_argument("--horizon", type=int, help="VaR horizon in days (default 1)")
+    risk.add_argument("--backfill", action="store_true", help="fetch missing daily history first")
+    risk.add_argument("--correlation", action="store_true", help="also print the correlation matrix")
+    risk.add_argument("--json", action="store_true")
+    risk.set_defaults(func=cmd_risk)
+
+    rebalance = commands.add_parser("rebalance", help="orders to reach the target allocation")
+    rebalance.add_argument("--set", nargs="+", metavar="TARGET=WEIGHT",
+                           help="store targets for symbols or classes (a weight of 0 sells it all)")
+    rebalance.add_argument("--remove", nargs="+", metavar="TARGET", help="delete stored targets")
+    rebalance.add_argument("--clear", action="store_true", help="replace all stored targets with --set")
+    rebalance.add_argument("--by", choices=["currency", "market"], help="asset classes the targets refer to")
+    rebalance.add_argument("--cash", type=float, default=0.0, help="cash available to invest")
+    rebalance.add_argument("--tolerance", type=float, help="weight drift left alone (default 0.02)")
+    rebalance.add_argument("--min-trade", type=float, help="smallest order amount")
+    rebalance.add_argument("--lot", nargs="+", metavar="SYMBOL=SIZE", help="lot sizes (default 1 share)")
+    rebalance.add_argument("--price", nargs="+", metavar="SYMBOL=PRICE", help="prices of targets not held")
+    rebalance.add_argument("--milp", action="store_true", help="solve with SciPy's MILP if installed")
+    rebalance.add_argument("--json", action="store_true")
+    rebalance.set_defaults(func=cmd_rebalance)
+
+    bt = commands.add_parser("backtest", help="run a trading strategy over the stored daily prices")
+    bt.add_argument("strategy", choices=["sma_cross", "ema_cross", "rsi_reversion"])
+    bt.add_argument("--grid", nargs="+", metavar="PARAM=V1,V2", help="parameter values to sweep")
+    bt.add_argument("--symbols", nargs="+", help="default: the current holdings")
+    bt.add_argument("--from", dest="start")
+    bt.add_argument("--to", dest="end")
+    bt.add_argument("--capital", type=float, default=1_000_000.0)
+    bt.add_argument("--cost", type=float, default=0.005, help="cost per fill, fraction of the amount")
+    bt.add_argument("--workers", type=int, help="processes for the sweep (default: one per CPU)")
+    bt.add_argument("--top", type=int, default=10, help="combinations shown")
+    bt.add_argument("--backfill", action="store_true", help="fetch missing daily history first")
+    bt.add_argument("--fills", help="write the best combination's trades as a transactions CSV")
+    bt.set_defaults(func=cmd_backtest)
+
+    feed = commands.add_parser("feed-server", help="run a local stand-in price feed for the app")
+    feed.add_argument("--host", default="127.0.0.1")
+    feed.add_argument("--port", type=int, default=8765)
+    feed.add_argument("--rate", type=int, default=100, help="ticks per second per client")
+    feed.set_defaults(func=cmd_feed_server)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    core.open_database(args.db)
+    args.func(args)
+    if args.metrics:
+        render = {'table': metrics.format_table, 'json': metrics.to_json, 'prometheus': metrics.to_prometheus}
+        print(render[args.metrics](), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# Headless portfolio engine shared by the desktop app and the CLI.
+# Never imports GUI modules; pandas, yfinance and requests are loaded by the
+# functions that need them, so importing this module is cheap.
+import metrics
+from portfolio_db import PortfolioDB
+
+
+def open_database(path=None):
+    if path:
+        PortfolioDB.use_database(path)
+    PortfolioDB.migrate_csv_if_needed()
+
+
+def load_portfolio():
+    return PortfolioDB.get_portfolio_df()
+
+
+def value_portfolio(portfolio=None):
+    # Returns (portfolio with valuation columns, per-symbol aggregate, totals).
+    # With a stored USD/ARS rate, positions are also valued in ARS and USD
+    # and totals['by_currency'] has both.
+    from aggregation import value_positions, aggregate_positions, portfolio_totals
+    from valuation import value_currencies
+
+    if portfolio is None:
+        portfolio = load_portfolio()
+    value_positions(portfolio)
+    fx_rate, converted_avg = currency_context()
+    if fx_rate and not portfolio.empty:
+        value_currencies(portfolio, fx_rate, converted_avg)
+    aggregate = aggregate_positions(portfolio)
+    return portfolio, aggregate, portfolio_totals(aggregate)
+
+
+_currency_cache = {'key': None, 'value': (None, None)}
+
+
+def currency_context():
+    # (latest USD/ARS rate, average cost of each position in its other
+    # currency). The ledger replay behind the second one is cached until a
+    # transaction or a new rate is recorded.
+    from price_history import PriceHistory
+    from valuation import FX_SYMBOL, converted_avg_prices
+
+    latest = PriceHistory.latest(FX_SYMBOL)
+    if not latest or not latest[1]:
+        return None, None
+    key = (PortfolioDB.db_file, PortfolioDB.ledger_version(), tuple(latest))
+    if _currency_cache['key'] != key:
+        with metrics.span("valuation.converted_cost"):
+            converted = converted_avg_prices(PortfolioDB.get_ledger(), PriceHistory.get_series(FX_SYMBOL))
+        _currency_cache['key'] = key
+        _currency_cache['value'] = (float(latest[1]), converted)
+    return _currency_cache['value']
+
+
+def refresh_prices(symbols=None):
+    # Blocking version of refresh_prices_async for the CLI and the scheduler
+    from fetch_engine import get_fetch_engine
+
+    if symbols is None:
+        symbols = load_portfolio()["Symbol"].unique().tolist()
+    return get_fetch_engine().run(refresh_prices_async(symbols))
+
+
+async def refresh_prices_async(symbols):
+    # Fetch quotes for the symbols (one batched request) and the USD/ARS rate
+    # at the same time on the fetch engine, then write the prices in one
+    # transaction. Returns {'prices': {symbol: price}, 'changed': {symbol:
+    # price}, 'fx_rate': FxRate or None}; 'changed' only has prices that moved.
+    # Cancelling it (a newer refresh) skips the DB write.
+    import asyncio
+    from fetch_engine import get_fetch_engine
+    from market_data import get_provider
+    from fx import get_fx_service
+    from price_history import PriceHistory
+    from valuation import FX_SYMBOL
+
+    if not symbols:
+        return {'prices': {}, 'changed': {}, 'fx_rate': None}
+
+    engine = get_fetch_engine()
+    with metrics.span("refresh.total"):
+        # FxService already races its sources against a deadline, no retries
+        quotes, fx_rate = await asyncio.gather(
+            engine.call(get_provider().get_quotes, symbols),
+            engine.call(get_fx_service().get_rate, retries=0),
+            return_exceptions=True)
+        if isinstance(quotes, BaseException):
+            print(f"Failed to fetch quotes: {quotes!r}")
+            metrics.incr("errors.quotes")
+            quotes = {}
+        if isinstance(fx_rate, BaseException):
+            print(f"Failed to fetch USD/ARS: {fx_rate!r}")
+            metrics.incr("errors.fx")
+            fx_rate = None
+
+        prices = {symbol: quotes[symbol].price if symbol in quotes else 0 for symbol in symbols}
+        metrics.incr("refresh.missing_prices", sum(1 for price in prices.values() if not price))
+        changed = await engine.offload(PortfolioDB.update_current_prices, prices)
+        if fx_rate and fx_rate.source == "Yahoo":
+            # Today's point of the USD/ARS series used for valuation. That
+            # series is Yahoo's ARS=X, so a rate from another source (blue,
+            # MEP, CCL...) is shown but not stored in it.
+            await engine.offload(PriceHistory.store_rate, FX_SYMBOL, fx_rate.rate)
+    return {'prices': prices, 'changed': changed, 'fx_rate': fx_rate}
+
+
+async def refresh_symbol_async(symbol):
+    # Price of one symbol (e.g. right after adding it): the quote, or the
+    # info lookup when the batch has nothing. Returns {symbol: price} if it
+    # changed.
+    from fetch_engine import get_fetch_engine
+    from market_data import get_provider
+
+    engine = get_fetch_engine()
+    provider = get_provider()
+    quote = await engine.call(provider.get_quote, symbol)
+    price = quote.price if quote else 0
+    if not price:
+        info = await engine.call(provider.get_info, symbol)
+        price = info['price'] if info else 0
+    if not price:
+        return {}
+    return await engine.offload(PortfolioDB.update_current_prices, {symbol: price})
+
+
+def risk_report(start=None, benchmark=None, confidence=None, horizon=None, backfill=False):
+    # risk.analyze over the current valuation. backfill=True first fetches
+    # the missing daily history of the holdings and the benchmark.
+    import risk
+
+    benchmark = risk.DEFAULT_BENCHMARK if benchmark is None else benchmark
+    portfolio, _, _ = value_portfolio()
+    if backfill:
+        from price_history import DEFAULT_START, PriceHistory
+        symbols = portfolio['Symbol'].unique().tolist() + ([benchmark] if benchmark else [])
+        PriceHistory.backfill(symbols, start=start or DEFAULT_START)
+    return risk.analyze(portfolio, start=start, benchmark=benchmark,
+                        confidence=confidence or risk.DEFAULT_CONFIDENCE, horizon=horizon or risk.DEFAULT_HORIZON)
+
+
+def rebalance_plan(cash=0.0, classify=None, tolerance=None, min_trade=None, lots=None, prices=None, solver=None):
+    # rebalance.rebalance over the current valuation and the stored targets
+    import rebalance
+
+    portfolio, _, _ = value_portfolio()
+    fx_rate, _ = currency_context()
+    return rebalance.rebalance(
+        portfolio, PortfolioDB.get_targets(), cash=cash, classify=classify,
+        tolerance=rebalance.DEFAULT_TOLERANCE if tolerance is None else tolerance,
+        min_trade=rebalance.DEFAULT_MIN_TRADE if min_trade is None else min_trade,
+        lots=lots, prices=prices, fx_rate=fx_rate, solver=solver)
+
+
+_lots_cache = {'key': None, 'value': None}
+
+
+def tax_lots(method=None):
+    # (open lots valued at the current prices, realized P&L per sale) from
+    # lots.match_lots. The matching is cached until a transaction is
+    # recorded; the unrealized view always uses the latest prices.
+    import lots
+
+    method = method or lots.DEFAULT_METHOD
+    key = (PortfolioDB.db_file, PortfolioDB.ledger_version(), method)
+    if _lots_cache['key'] != key:
+        _lots_cache['value'] = lots.match_lots(PortfolioDB.get_ledger(), method)
+        _lots_cache['key'] = key
+    open_lots, realized = _lots_cache['value']
+    portfolio = load_portfolio()
+    prices = dict(zip(portfolio['Symbol'], portfolio['CurrentPrice']))
+    return lots.unrealized(open_lots, prices), realized.copy()
+
+
+def rebuild_portfolio(full=False):
+    # Recompute positions from the ledger (from the last snapshot unless full)
+    return PortfolioDB.rebuild_portfolio(full=full)
+
+
+def trades(start=None, end=None, symbol=None):
+    return PortfolioDB.get_trades(start, end, symbol=symbol)
+
+
+def monthly_summary(start=None, end=None, symbol=None):
+    return PortfolioDB.get_monthly_summary(start, end, symbol=symbol)
+
+
+def import_csv(path):
+    return PortfolioDB.import_transactions_csv(path)
+
+
+def export_csv(path, transactions=False):
+    if transactions:
+        import pandas as pd
+        with PortfolioDB._lock:
+            # With the ids, so the lot_id of a specific-lot sale still points
+            # at its buy after an import (see PortfolioDB._insert_records)
+            df = pd.read_sql_query(
+                'SELECT id, date, symbol, company, action, quantity, price, lot_id FROM transactions ORDER BY id',
+                PortfolioDB.connection())
+            df['lot_id'] = df['lot_id'].astype('Int64')
+    else:
+        df, _, _ = value_portfolio()
+    df.to_csv(path, index=False)
+    return len(df)
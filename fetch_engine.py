@@ -0,0 +1,157 @@
+import asyncio
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+DEFAULT_CONCURRENCY = 4  # network calls in flight at once
+DEFAULT_TIMEOUT = 15.0  # seconds per attempt
+DEFAULT_RETRIES = 2  # attempts after the first one
+BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+BACKOFF_MAX = 8.0
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # Exponential backoff with full jitter: uniform in [0, base * 2^attempt]
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class FetchEngine:
+    # Runs network work on an asyncio loop in its own daemon thread.
+    #   call(func, ...)     awaitable: a blocking call (provider, requests) in
+    #                       the worker pool, limited by a semaphore, with a
+    #                       deadline per attempt and retries with backoff
+    #   offload(func, ...)  awaitable: a blocking call without those (DB writes)
+    #   submit(work, key)   schedule a coroutine (or plain callable) from any
+    #                       thread; a newer submit with the same key cancels
+    #                       the older one if it is still running
+    #   run(work)           submit and wait for the result (CLI, scheduler)
+    # A call whose deadline expires is abandoned, not interrupted: the worker
+    # thread finishes in the background and its result is dropped.
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=BACKOFF_BASE, max_backoff=BACKOFF_MAX):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._latest = {}  # key -> Future of the newest submit
+        self._lock = threading.Lock()
+        # Room for abandoned (timed out) calls on top of the concurrent ones
+        self._executor = ThreadPoolExecutor(max_workers=concurrency * 2 + 2, thread_name_prefix="fetch")
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._semaphore = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fetch-loop", daemon=True)
+        self._thread.start()
+
+    async def call(self, func, *args, timeout=None, retries=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        loop = asyncio.get_running_loop()
+        for attempt in range(retries + 1):
+            try:
+                async with self._semaphore:
+                    metrics.incr('fetch.calls')
+                    return await asyncio.wait_for(loop.run_in_executor(None, func, *args), timeout)
+            except asyncio.CancelledError:
+                metrics.incr('fetch.cancelled')
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.incr('fetch.timeouts')
+                if attempt == retries:
+                    metrics.incr('fetch.failures')
+                    raise
+                metrics.incr('fetch.retries')
+                await asyncio.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+
+    async def offload(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def submit(self, work, key=None, on_done=None, on_error=None):
+        # `work` is a coroutine or a callable (run through call()). on_done
+        # (result) / on_error(exception) run on the loop thread, and neither
+        # runs when the work was cancelled or superseded.
+        if not asyncio.iscoroutine(work):
+            work = self.call(work)
+        future = asyncio.run_coroutine_threadsafe(work, self._loop)
+        if key is not None:
+            with self._lock:
+                previous = self._latest.get(key)
+                self._latest[key] = future
+            if previous is not None:
+                previous.cancel()
+        future.add_done_callback(lambda f: self._finished(f, key, on_done, on_error))
+        return future
+
+    def run(self, work, key=None):
+        # Errors are raised here instead of printed
+        return self.submit(work, key, on_error=lambda e: None).result()
+
+    def _finished(self, future, key, on_done, on_error):
+        if key is not None:
+            with self._lock:
+                if self._latest.get(key) is future:
+                    del self._latest[key]
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if on_error:
+                on_error(error)
+            else:
+                print(f"Background fetch failed: {error!r}")
+                metrics.incr('errors.fetch')
+        elif on_done:
+            on_done(future.result())
+
+
+class TkDispatcher:
+    # Hands results from background threads to Tk. Callbacks are queued and
+    # drained by a single after(0) on the main loop, however many arrive in
+    # between; a callback posted with a key replaces a queued one with the
+    # same key (e.g. only the newest price update is applied).
+    def __init__(self, widget):
+        self.widget = widget
+        self._queue = OrderedDict()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._counter = 0
+
+    def post(self, callback, key=None):
+        with self._lock:
+            if key is None:
+                self._counter += 1
+                key = ('anonymous', self._counter)
+            self._queue[key] = callback
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.widget.after(0, self._drain)
+
+    def _drain(self):
+        with self._lock:
+            callbacks = list(self._queue.values())
+            self._queue.clear()
+            self._scheduled = False
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"UI update failed: {e}")
+                metrics.incr('errors.ui')
+
+
+_engine = None
+
+
+def get_fetch_engine():
+    global _engine
+    if _engine is None:
+        _engine = FetchEngine()
+    return _engine
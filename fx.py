@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import metrics
+from market_data import get_provider
+
+# USD/ARS rate as reported by one source, with the time it was obtained
+FxRate = namedtuple("FxRate", ["rate", "source", "time"])
+
+DOLARAPI_URL = "https://dolarapi.com/v1/dolares/{}"
+
+# Preferred order when several sources answer within the deadline.
+# Yahoo first and then Blue was the original fallback chain.
+DEFAULT_PRIORITY = ["Yahoo", "Blue", "MEP", "CCL", "Oficial"]
+DEFAULT_DEADLINE = 3.0  # seconds to wait for a better-ranked source
+DEFAULT_TTL = 300  # seconds a rate is reused without refetching
+
+
+def fetch_yahoo(timeout):
+    # Goes through the shared provider, so it benefits from the quote cache
+    quote = get_provider().get_quote("ARS=X", timeout)
+    return quote.price if quote else 0
+
+
+def dolarapi_source(kind):
+    def fetch(timeout):
+        import requests
+        data = requests.get(DOLARAPI_URL.format(kind), timeout=timeout).json()
+        return data['venta']
+    return fetch
+
+
+SOURCES = {
+    "Yahoo": fetch_yahoo,
+    "Oficial": dolarapi_source("oficial"),
+    "Blue": dolarapi_source("blue"),
+    "MEP": dolarapi_source("bolsa"),
+    "CCL": dolarapi_source("contadoconliqui"),
+}
+
+
+class FxService:
+    # Queries every source concurrently and answers with the best-ranked
+    # valid rate: as soon as no better-ranked source is still pending, or
+    # with whatever arrived when the deadline expires. priority=None takes
+    # the first valid answer. Rates are cached per source with timestamps.
+    def __init__(self, sources=None, priority=DEFAULT_PRIORITY, deadline=DEFAULT_DEADLINE, ttl=DEFAULT_TTL):
+        self.sources = sources or SOURCES
+        self.priority = priority
+        self.deadline = deadline
+        self.ttl = ttl
+        self._rates = {}  # source -> FxRate
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix="fx")
+
+    def rates(self):
+        # Every cached rate, fresh or not (e.g. to show oficial/blue/MEP side by side)
+        with self._lock:
+            return dict(self._rates)
+
+    @metrics.timed("fx.get_rate")
+    def get_rate(self, force=False):
+        if not force:
+            cached = self._best(self._fresh_rates())
+            if cached:
+                return cached
+
+        start = time.monotonic()
+        pending = {self._executor.submit(self._fetch, name): name for name in self.sources}
+        answered = {}
+        while pending:
+            remaining = self.deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                rate = future.result()
+                if rate:
+                    answered[name] = rate
+            best = self._best(answered)
+            if best and not any(self._ranks_before(name, best.source) for name in pending.values()):
+                return best
+
+        # Deadline hit: best of what arrived, else the last known rate
+        return self._best(answered) or self._best(self.rates())
+
+    def _fetch(self, name):
+        try:
+            with metrics.span(f"fx.source.{name}"):
+                rate = float(self.sources[name](self.deadline))
+        except Exception as e:
+            print(f"Failed to fetch USD/ARS from {name}: {e}")
+            metrics.incr("errors.fx")
+            return None
+        if rate <= 0:
+            return None
+        fx_rate = FxRate(rate, name, datetime.now())
+        with self._lock:
+            self._rates[name] = fx_rate
+        return fx_rate
+
+    def _fresh_rates(self):
+        now = datetime.now()
+        return {name: r for name, r in self.rates().items() if (now - r.time).total_seconds() <= self.ttl}
+
+    def _rank(self, name):
+        if self.priority is None:
+            return 0
+        return self.priority.index(name) if name in self.priority else len(self.priority)
+
+    def _ranks_before(self, name, other):
+        return self.priority is not None and self._rank(name) < self._rank(other)
+
+    def _best(self, rates):
+        if not rates:
+            return None
+        return min(rates.values(), key=lambda r: (self._rank(r.source), -r.time.timestamp()))
+
+
+_service = None
+
+
+def get_fx_service():
+    global _service
+    if _service is None:
+        _service = FxService()
+    return _service
+
+
+def set_fx_service(service):
+    global _service
+    _service = service
@@ -0,0 +1,272 @@
+import heapq
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from portfolio_db import RESET_ACTIONS
+
+# Tax lots replayed from the transactions ledger in trade date order (same
+# day trades in the order they were recorded, so a backdated import lands
+# where it belongs). Every BUY opens a lot (its
+# transaction id is the lot id) and every SELL consumes open lots of the
+# symbol: FIFO, LIFO or HIFO (highest cost first), or the lot named in the
+# transaction's lot_id before falling back to the method. Each match is a
+# realized P&L row. Quantities follow add_transaction: a SELL never takes
+# more than is held, ADJUST replaces the symbol's lots with one lot at the
+# adjusted average (an edit, not a sale) and CLOSE drops them.
+#
+# FIFO is vectorized: every sale finds its lots with a binary search over
+# the cumulative lot quantities (O(log n) per sale). The other methods keep
+# the open lots per symbol in a deque (LIFO, O(1) per match) or a heap keyed
+# by cost (HIFO, O(log n)); a specific-lot sale empties the lot in place
+# through a lot id index, and emptied lots are skipped when they reach the
+# end of the queue.
+METHODS = ('fifo', 'lifo', 'hifo')
+DEFAULT_METHOD = 'fifo'
+EPSILON = 1e-9
+
+LOT_COLUMNS = ['LotId', 'Symbol', 'Company', 'Date', 'Quantity', 'BuyPrice', 'Cost']
+REALIZED_COLUMNS = ['SaleId', 'Date', 'Symbol', 'LotId', 'LotDate', 'Quantity', 'BuyPrice', 'SellPrice',
+                    'Cost', 'Proceeds', 'Gain', 'HoldingDays']
+
+# Lot fields, kept as lists so a partial sale updates the quantity in place
+ID, SYMBOL, COMPANY, DATE, QUANTITY, PRICE = range(6)
+
+
+class LotBook:
+    # Open lots of one symbol in matching order
+    def __init__(self, method):
+        self.method = method
+        self.lots = [] if method == 'hifo' else deque()
+        self.held = 0.0
+
+    def add(self, lot):
+        if self.method == 'hifo':
+            heapq.heappush(self.lots, (-lot[PRICE], lot[ID], lot))
+        else:
+            self.lots.append(lot)
+        self.held += lot[QUANTITY]
+
+    def next(self):
+        # Next lot to sell, dropping the ones a specific-lot sale emptied
+        lots = self.lots
+        while lots:
+            if self.method == 'hifo':
+                lot = lots[0][2]
+            else:
+                lot = lots[0] if self.method == 'fifo' else lots[-1]
+            if lot[QUANTITY] > EPSILON:
+                return lot
+            self.pop()
+        return None
+
+    def pop(self):
+        if self.method == 'hifo':
+            heapq.heappop(self.lots)
+        elif self.method == 'fifo':
+            self.lots.popleft()
+        else:
+            self.lots.pop()
+
+    def open_lots(self):
+        lots = (entry[2] for entry in self.lots) if self.method == 'hifo' else self.lots
+        return [lot for lot in lots if lot[QUANTITY] > EPSILON]
+
+
+@metrics.timed("lots.match")
+def match_lots(ledger, method=DEFAULT_METHOD):
+    # `ledger` as PortfolioDB.get_ledger returns it (id, symbol, company,
+    # action, quantity, price, trade_date, lot_id), replayed by (trade_date,
+    # id); rows without a trade date go last. Returns (open lots frame with
+    # LOT_COLUMNS, realized frame with REALIZED_COLUMNS), both in that
+    # order. FIFO is matched in one
+    # vectorized pass except for symbols with specific-lot sales, which are
+    # replayed with the other methods.
+    if method not in METHODS:
+        raise ValueError(f"Unknown lot method {method!r}, expected one of {', '.join(METHODS)}")
+    if 'lot_id' not in ledger:
+        ledger = ledger.assign(lot_id=np.nan)
+    ledger = ledger.sort_values(['trade_date', 'id'], kind='stable', na_position='last')
+    if method == 'fifo':
+        specific = (ledger['action'] == 'SELL') & ledger['lot_id'].notna()
+        replayed = ledger['symbol'].isin(ledger.loc[specific, 'symbol'].unique())
+        parts = [_fifo_matches(ledger[~replayed])]
+        if replayed.any():
+            parts.append(_replay(ledger[replayed], method))
+    else:
+        parts = [_replay(ledger, method)]
+
+    lots = pd.concat([part[0] for part in parts], ignore_index=True)
+    lots = lots.sort_values(['Date', 'LotId'], kind='stable', na_position='last')
+    lots = lots.reset_index(drop=True)
+    lots['Quantity'] = lots['Quantity'].astype(float)
+    lots['Cost'] = lots['Quantity'] * lots['BuyPrice']
+
+    sales = pd.concat([part[1] for part in parts], ignore_index=True)
+    sales = sales.sort_values(['Date', 'SaleId'], kind='stable', na_position='last')
+    sales = sales.reset_index(drop=True)
+    sales['Cost'] = sales['Quantity'] * sales['BuyPrice']
+    sales['Proceeds'] = sales['Quantity'] * sales['SellPrice']
+    sales['Gain'] = sales['Proceeds'] - sales['Cost']
+    held_for = pd.to_datetime(sales['Date'], errors='coerce') - pd.to_datetime(sales['LotDate'], errors='coerce')
+    sales['HoldingDays'] = held_for.dt.days.astype('Int64')
+    return lots, sales[REALIZED_COLUMNS]
+
+
+def _fifo_matches(ledger):
+    # FIFO without loops. Per symbol and reset segment (as in
+    # positions_from_ledger), lots are consecutive ranges on the cumulative
+    # bought quantity and each SELL takes the next range of the cumulative
+    # sold quantity (clamped to what is held), so a sale matches the lots
+    # its range overlaps. Segments get disjoint offsets on one number line
+    # and every sale finds its first and last lot with a binary search.
+    df = ledger.reset_index(drop=True)
+    action = df['action'].to_numpy()
+    qty = df['quantity'].to_numpy(dtype=float)
+    price = df['price'].to_numpy(dtype=float)
+    ids = df['id'].to_numpy()
+    dates = df['trade_date'].to_numpy(dtype=object)
+    symbols = df['symbol'].to_numpy(dtype=object)
+
+    opens = (action == 'BUY') | ((action == 'ADJUST') & (qty > 0))
+    is_sell = action == 'SELL'
+    segment = pd.Series(np.isin(action, RESET_ACTIONS)).groupby(df['symbol'], sort=False).cumsum().to_numpy()
+    group = pd.Series(qty).groupby([df['symbol'], segment], sort=False).ngroup().to_numpy()
+
+    # Held quantity with add_transaction's floor at zero, and what each
+    # SELL actually took
+    by_group = pd.Series(np.where(opens, qty, np.where(is_sell, -qty, 0.0))).groupby(group)
+    raw = by_group.cumsum()
+    held = (raw - raw.groupby(group).cummin().clip(upper=0)).to_numpy()
+    held_before = pd.Series(held).groupby(group).shift(fill_value=0).to_numpy()
+    bought = np.where(opens, qty, 0.0)
+    sold = np.where(is_sell, np.clip(held_before - held, 0, None), 0.0)
+    buy_end = pd.Series(bought).groupby(group).cumsum().to_numpy()
+    sell_end = pd.Series(sold).groupby(group).cumsum().to_numpy()
+
+    n_groups = group.max() + 1 if len(group) else 0
+    offset = np.concatenate([[0.0], np.cumsum(np.bincount(group, bought, n_groups))[:-1]])
+    lot_rows = np.flatnonzero(opens)
+    lot_rows = lot_rows[np.lexsort((lot_rows, group[lot_rows]))]
+    lot_keys = offset[group[lot_rows]] + buy_end[lot_rows]
+
+    sale_rows = np.flatnonzero(sold > EPSILON)
+    lo, hi = sell_end[sale_rows] - sold[sale_rows], sell_end[sale_rows]
+    sale_offset = offset[group[sale_rows]]
+    # One lot of slack on each side absorbs rounding at the range ends;
+    # pieces from other segments or of zero length are dropped below
+    last = max(len(lot_rows) - 1, 0)
+    first_lot = np.clip(np.searchsorted(lot_keys, sale_offset + lo, 'right') - 1, 0, last)
+    last_lot = np.clip(np.searchsorted(lot_keys, sale_offset + hi, 'left') + 1, 0, last)
+    counts = np.where(len(lot_rows) > 0, last_lot - first_lot + 1, 0)
+    sale = np.repeat(np.arange(len(sale_rows)), counts)
+    lot = lot_rows[np.repeat(first_lot, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+    sale_row = sale_rows[sale]
+    piece = (np.minimum(hi[sale], buy_end[lot]) - np.maximum(lo[sale], buy_end[lot] - bought[lot]))
+    keep = (group[lot] == group[sale_row]) & (piece > EPSILON)
+    sale_row, lot, piece = sale_row[keep], lot[keep], piece[keep]
+    realized = pd.DataFrame({
+        'SaleId': ids[sale_row], 'Date': dates[sale_row], 'Symbol': symbols[sale_row],
+        'LotId': ids[lot], 'LotDate': dates[lot], 'Quantity': piece,
+        'BuyPrice': price[lot], 'SellPrice': price[sale_row],
+    })
+
+    # Open lots: the last segment of each symbol, minus what was sold
+    sold_total = np.bincount(group, sold, n_groups)
+    last_group = pd.Series(group).groupby(df['symbol'], sort=False).transform('max').to_numpy()
+    lot_rows = np.flatnonzero(opens & (group == last_group))
+    start = buy_end[lot_rows] - bought[lot_rows]
+    remaining = buy_end[lot_rows] - np.maximum(start, sold_total[group[lot_rows]])
+    lot_rows, remaining = lot_rows[remaining > EPSILON], remaining[remaining > EPSILON]
+    lots = pd.DataFrame({
+        'LotId': ids[lot_rows], 'Symbol': symbols[lot_rows], 'Company': df['company'].to_numpy(dtype=object)[lot_rows],
+        'Date': dates[lot_rows], 'Quantity': remaining, 'BuyPrice': price[lot_rows],
+    })
+    return lots, realized
+
+
+def _replay(ledger, method):
+    # Lot by lot, for LIFO/HIFO and specific-lot sales
+    books = {}
+    by_id = {}
+    realized = []
+    rows = zip(ledger['id'].tolist(), ledger['symbol'].tolist(), ledger['company'].tolist(),
+               ledger['action'].tolist(), ledger['quantity'].tolist(), ledger['price'].tolist(),
+               ledger['trade_date'].tolist(), ledger['lot_id'].tolist())
+
+    for txn_id, symbol, company, action, quantity, price, date, lot_id in rows:
+        book = books.get(symbol)
+        if action == 'BUY':
+            if book is None:
+                book = books[symbol] = LotBook(method)
+            lot = [txn_id, symbol, company, date, quantity, price]
+            book.add(lot)
+            by_id[txn_id] = (book, lot)
+        elif action == 'SELL':
+            if book is None or book.held <= EPSILON:
+                continue
+            left = min(quantity, book.held)
+            book.held -= left
+            # The named lot first, if it is still open in this symbol's book
+            # (an ADJUST or CLOSE since then discarded it: method order)
+            named = int(lot_id) if lot_id is not None and lot_id == lot_id else None
+            owner, lot = by_id.get(named, (None, None))
+            if owner is book and lot[QUANTITY] > EPSILON:
+                taken = min(left, lot[QUANTITY])
+                lot[QUANTITY] -= taken
+                left -= taken
+                realized.append((txn_id, date, symbol, lot[ID], lot[DATE], taken, lot[PRICE], price))
+            while left > EPSILON:
+                lot = book.next()
+                if lot is None:
+                    break
+                taken = min(left, lot[QUANTITY])
+                lot[QUANTITY] -= taken
+                left -= taken
+                realized.append((txn_id, date, symbol, lot[ID], lot[DATE], taken, lot[PRICE], price))
+                if lot[QUANTITY] <= EPSILON:
+                    book.pop()
+            if book.held <= EPSILON:
+                book.held = 0.0
+        elif action in RESET_ACTIONS:
+            book = books[symbol] = LotBook(method)
+            if action == 'ADJUST' and quantity > 0:
+                lot = [txn_id, symbol, company, date, quantity, price]
+                book.add(lot)
+                by_id[txn_id] = (book, lot)
+
+    open_lots = [lot for book in books.values() for lot in book.open_lots()]
+    return (pd.DataFrame(open_lots, columns=LOT_COLUMNS[:-1]),
+            pd.DataFrame(realized, columns=REALIZED_COLUMNS[:8]))
+
+
+def unrealized(lots, prices, today=None):
+    # Open lots valued at {symbol: current price}; lots without a price are
+    # valued at cost. Adds CurrentPrice, Value, Unrealized, UnrealizedPct and
+    # HoldingDays.
+    lots = lots.copy()
+    current = lots['Symbol'].map(prices).astype(float)
+    current = current.where(current > 0, lots['BuyPrice'])
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    lots['CurrentPrice'] = current
+    lots['Value'] = lots['Quantity'] * current
+    lots['Unrealized'] = lots['Value'] - lots['Cost']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lots['UnrealizedPct'] = np.where(lots['Cost'] > 0, lots['Unrealized'] / lots['Cost'] * 100, 0.0)
+    lots['HoldingDays'] = (today - pd.to_datetime(lots['Date'], errors='coerce')).dt.days.astype('Int64')
+    return lots
+
+
+def realized_summary(realized, by='year'):
+    # Realized P&L grouped by 'year' (of the sale), 'symbol' or 'month'
+    keys = {
+        'year': realized['Date'].str[:4],
+        'month': realized['Date'].str[:7],
+        'symbol': realized['Symbol'],
+    }[by].rename(by.capitalize())
+    summary = realized.groupby(keys).agg(
+        Sales=('SaleId', 'nunique'), Quantity=('Quantity', 'sum'),
+        Cost=('Cost', 'sum'), Proceeds=('Proceeds', 'sum'), Gain=('Gain', 'sum'))
+    return summary.reset_index()
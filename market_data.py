@@ -0,0 +1,180 @@
+import json
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# One quote per symbol. `time` is a datetime (market time when known).
+Quote = namedtuple("Quote", ["symbol", "price", "time", "name"])
+
+# Columns of the long-format frame returned by get_history
+HISTORY_COLUMNS = ["symbol", "date", "open", "high", "low", "close", "volume"]
+
+# Set PRICE_SOURCE to a JSON file or http(s) URL to run without Yahoo
+PRICE_SOURCE_ENV = "PRICE_SOURCE"
+
+
+class PriceProvider:
+    # Interface for market data. get_quotes is the batched call every refresh
+    # goes through: implementations should fetch all symbols in a single
+    # request and return {symbol: Quote}, leaving out symbols with no price.
+    # `timeout` bounds the request in seconds (None: the source's default).
+    def get_quotes(self, symbols, timeout=None):
+        raise NotImplementedError
+
+    def get_quote(self, symbol, timeout=None):
+        return self.get_quotes([symbol], timeout).get(symbol)
+
+    def get_info(self, symbol):
+        # Name + price for the sidebar lookup. None if the symbol is unknown.
+        quote = self.get_quote(symbol)
+        if not quote:
+            return None
+        return {'symbol': symbol, 'name': quote.name or "", 'price': quote.price, 'time': quote.time}
+
+    def get_history(self, symbols, start, end):
+        # Daily OHLCV for every symbol between two dates (inclusive), in one
+        # request, as a long frame with HISTORY_COLUMNS and ISO date strings.
+        raise NotImplementedError
+
+
+class YFinanceProvider(PriceProvider):
+    def __init__(self, period="5d"):
+        # A few days back so symbols that did not trade today still have a close
+        self.period = period
+
+    def get_quotes(self, symbols, timeout=None):
+        import yfinance as yf  # slow to import, load on first use
+
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+
+        # One multi-symbol download instead of a history() call per ticker
+        data = yf.download(symbols, period=self.period, progress=False, threads=True, timeout=timeout or 10)
+        if data is None or data.empty:
+            return {}
+
+        close = data["Close"]
+        if not hasattr(close, "columns"):
+            close = close.to_frame(symbols[0])
+
+        quotes = {}
+        for symbol in symbols:
+            if symbol not in close.columns:
+                continue
+            series = close[symbol].dropna()
+            if series.empty:
+                continue
+            quotes[symbol] = Quote(symbol, float(series.iloc[-1]), series.index[-1].to_pydatetime(), None)
+        return quotes
+
+    def get_history(self, symbols, start, end):
+        import yfinance as yf
+
+        symbols = list(dict.fromkeys(symbols))
+        data = yf.download(symbols, start=start.isoformat(), end=(end + timedelta(days=1)).isoformat(),
+                           progress=False, threads=True)
+        if data is None or data.empty:
+            return _empty_history()
+
+        import pandas as pd
+        fields = {}
+        for field in ("Open", "High", "Low", "Close", "Volume"):
+            part = data[field]
+            if not hasattr(part, "columns"):
+                part = part.to_frame(symbols[0])
+            fields[field.lower()] = part.stack()
+        history = pd.DataFrame(fields).dropna(subset=["close"])
+        history.index.names = ["date", "symbol"]
+        history = history.reset_index()
+        history["date"] = pd.to_datetime(history["date"]).dt.strftime("%Y-%m-%d")
+        return history[HISTORY_COLUMNS]
+
+    def get_info(self, symbol):
+        import yfinance as yf
+
+        info = yf.Ticker(symbol).info
+        price = info.get('currentPrice') or info.get('regularMarketPrice') or info.get('previousClose')
+        if not price:
+            return None
+
+        market_time = info.get('regularMarketTime')
+        return {
+            'symbol': symbol,
+            'name': info.get('longName') or info.get('shortName') or "",
+            'price': price,
+            'time': datetime.fromtimestamp(market_time) if market_time else datetime.now(),
+        }
+
+
+class StaticPriceProvider(PriceProvider):
+    # Offline stand-in: quotes come from a JSON document, either a local file
+    # or an http(s) URL, shaped like
+    #   {"VIST.BA": {"price": 29640, "name": "Vista Energy", "time": "2025-12-04T17:00:00"}}
+    # Each get_quotes call reads the document once, like one batched request.
+    def __init__(self, source, timeout=5):
+        self.source = source
+        self.timeout = timeout
+
+    def _load(self, timeout=None):
+        if self.source.startswith(("http://", "https://")):
+            import requests
+            response = requests.get(self.source, timeout=timeout or self.timeout)
+            response.raise_for_status()
+            return response.json()
+        with open(self.source, encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_quotes(self, symbols, timeout=None):
+        document = self._load(timeout)
+        quotes = {}
+        for symbol in symbols:
+            entry = document.get(symbol)
+            if not entry or not entry.get('price'):
+                continue
+            time = datetime.fromisoformat(entry['time']) if entry.get('time') else datetime.now()
+            quotes[symbol] = Quote(symbol, float(entry['price']), time, entry.get('name'))
+        return quotes
+
+    def get_history(self, symbols, start, end):
+        # Optional "history": [[date, open, high, low, close, volume], ...] per symbol
+        import pandas as pd
+
+        document = self._load()
+        rows = []
+        for symbol in symbols:
+            for bar in (document.get(symbol) or {}).get('history', []):
+                if start.isoformat() <= bar[0] <= end.isoformat():
+                    rows.append([symbol] + list(bar))
+        return pd.DataFrame(rows, columns=HISTORY_COLUMNS) if rows else _empty_history()
+
+
+def _empty_history():
+    import pandas as pd
+    return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+
+_provider = None
+
+
+def get_provider():
+    # Shared provider: the configured source behind the quote cache
+    global _provider
+    if _provider is None:
+        from quote_cache import CachedPriceProvider, DBQuoteStore, QuoteCache
+
+        cache = QuoteCache(store=DBQuoteStore())
+        cache.load_persisted()
+        _provider = CachedPriceProvider(base_provider(), cache)
+    return _provider
+
+
+def base_provider():
+    # The configured source without any cache: PRICE_SOURCE or Yahoo
+    source = os.environ.get(PRICE_SOURCE_ENV)
+    return StaticPriceProvider(source) if source else YFinanceProvider()
+
+
+def set_provider(provider):
+    global _provider
+    _provider = provider
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+# Timing spans and event counters for the hot paths (provider calls,
+# PortfolioDB operations, UI rebuilds, FX lookups). Off by default: set
+# PORTFOLIO_METRICS=1 or call enable(). While disabled, span() hands back a
+# shared no-op and timed()/incr() return after one flag check.
+METRICS_ENV = "PORTFOLIO_METRICS"
+WINDOW = 1024  # recent durations kept per span for the percentiles
+PROMETHEUS_PREFIX = "portfolio"
+
+
+class MetricsStore:
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.started = time.time()
+        self._spans = {}  # name -> [count, errors, total seconds, max seconds, deque of recent seconds]
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = [0, 0, 0.0, 0.0, deque(maxlen=self.window)]
+            stats[0] += 1
+            stats[1] += error
+            stats[2] += seconds
+            stats[3] = max(stats[3], seconds)
+            stats[4].append(seconds)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        # {'spans': {name: {...}}, 'counters': {name: n}}; times in ms except total_s
+        with self._lock:
+            spans = {name: (count, errors, total, peak, sorted(recent))
+                     for name, (count, errors, total, peak, recent) in self._spans.items()}
+            counters = dict(self._counters)
+        result = {}
+        for name, (count, errors, total, peak, recent) in sorted(spans.items()):
+            result[name] = {
+                'count': count,
+                'errors': errors,
+                'total_s': round(total, 6),
+                'mean_ms': round(total / count * 1000, 3),
+                'p50_ms': round(_percentile(recent, 0.50) * 1000, 3),
+                'p95_ms': round(_percentile(recent, 0.95) * 1000, 3),
+                'max_ms': round(peak * 1000, 3),
+            }
+        return {'uptime_s': round(time.time() - self.started, 1), 'spans': result,
+                'counters': dict(sorted(counters.items()))}
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _store.record(self.name, time.perf_counter() - self.start, exc_type is not None)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+_store = MetricsStore(enabled=os.environ.get(METRICS_ENV, "") not in ("", "0"))
+
+
+def enable(on=True):
+    _store.enabled = on
+
+
+def is_enabled():
+    return _store.enabled
+
+
+def span(name):
+    # with span("db.add_transaction"): ...
+    return _Span(name) if _store.enabled else _NO_SPAN
+
+
+def timed(name):
+    # Decorator form of span()
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _store.enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def incr(name, amount=1):
+    if _store.enabled:
+        _store.incr(name, amount)
+
+
+def snapshot():
+    return _store.snapshot()
+
+
+def reset():
+    _store.reset()
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+
+def to_prometheus():
+    # Prometheus text exposition format
+    data = snapshot()
+    seconds = f"{PROMETHEUS_PREFIX}_span_seconds"
+    lines = [f"# TYPE {seconds} summary"]
+    for name, s in data['spans'].items():
+        label = f'span="{name}"'
+        lines.append(f'{seconds}{{{label},quantile="0.5"}} {s["p50_ms"] / 1000:.6f}')
+        lines.append(f'{seconds}{{{label},quantile="0.95"}} {s["p95_ms"] / 1000:.6f}')
+        lines.append(f'{seconds}_sum{{{label}}} {s["total_s"]:.6f}')
+        lines.append(f'{seconds}_count{{{label}}} {s["count"]}')
+    errors = f"{PROMETHEUS_PREFIX}_span_errors_total"
+    lines.append(f"# TYPE {errors} counter")
+    for name, s in data['spans'].items():
+        lines.append(f'{errors}{{span="{name}"}} {s["errors"]}')
+    events = f"{PROMETHEUS_PREFIX}_events_total"
+    lines.append(f"# TYPE {events} counter")
+    for name, value in data['counters'].items():
+        lines.append(f'{events}{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def format_table():
+    # Plain text view for the CLI and the debug panel
+    data = snapshot()
+    lines = [f"{'span':32} {'count':>7} {'err':>4} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+    for name, s in data['spans'].items():
+        lines.append(f"{name:32} {s['count']:>7} {s['errors']:>4} {s['mean_ms']:>9.2f} "
+                     f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['max_ms']:>9.2f}")
+    if data['counters']:
+        lines.append("")
+        lines.append(f"{'counter':32} {'value':>7}")
+        for name, value in data['counters'].items():
+            lines.append(f"{name:32} {value:>7}")
+    return "\n".join(lines)
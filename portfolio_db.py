@@ -0,0 +1,869 @@
+import atexit
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from metrics import timed
+
+# pandas and numpy are imported inside the functions that need them, so the
+# CLI and other headless tools start without paying for them.
+
+DB_FILE = "portfolio.db"
+CSV_FILE = "cartera.csv"
+
+# Statements are kept as constants so sqlite3's per-connection statement cache
+# (cached_statements) reuses the prepared versions instead of re-parsing them.
+SQL_INSERT_TRANSACTION = '''
+    INSERT INTO transactions (date, trade_date, symbol, company, action, quantity, price)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+# A SELL of a specific tax lot: lot_id is the id of the BUY it sells from
+SQL_INSERT_LOT_TRANSACTION = '''
+    INSERT INTO transactions (date, trade_date, symbol, company, action, quantity, price, lot_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_SELECT_POSITION = 'SELECT quantity, avg_price FROM portfolio WHERE symbol = ?'
+SQL_INSERT_POSITION = 'INSERT INTO portfolio (symbol, company, quantity, avg_price) VALUES (?, ?, ?, ?)'
+SQL_UPDATE_POSITION = 'UPDATE portfolio SET quantity = ?, avg_price = ? WHERE symbol = ?'
+SQL_UPDATE_QUANTITY = 'UPDATE portfolio SET quantity = ? WHERE symbol = ?'
+SQL_DELETE_POSITION = 'DELETE FROM portfolio WHERE symbol = ?'
+SQL_UPDATE_PRICE = 'UPDATE portfolio SET current_price = ? WHERE symbol = ?'
+SQL_SELECT_QUANTITY = 'SELECT quantity FROM portfolio WHERE symbol = ?'
+SQL_INSERT_FULL_POSITION = '''
+    INSERT INTO portfolio (symbol, company, quantity, avg_price, current_price, price_updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SQL_ADJUST_POSITION = '''
+    INSERT INTO portfolio (symbol, company, quantity, avg_price) VALUES (?, ?, ?, ?)
+    ON CONFLICT(symbol) DO UPDATE SET
+        company = excluded.company, quantity = excluded.quantity, avg_price = excluded.avg_price
+'''
+SQL_LAST_CHECKPOINT = '''
+    SELECT COALESCE(MAX(checkpoint_id), 0) FROM snapshots
+    WHERE checkpoint_id <= (SELECT COALESCE(MAX(id), 0) FROM transactions)
+'''
+SQL_SELECT_TRADES = '''
+    SELECT id as Id, trade_date as Date, symbol as Symbol, company as Company,
+           action as Action, quantity as Quantity, price as Price
+    FROM transactions
+'''
+SQL_MONTHLY_SUMMARY = '''
+    SELECT substr(trade_date, 1, 7) as Month, action as Action, COUNT(*) as Trades,
+           SUM(quantity) as Quantity, SUM(quantity * price) as Amount
+    FROM transactions
+    WHERE {where}
+    GROUP BY Month, Action
+    ORDER BY Month, Action
+'''
+SQL_SAVE_QUOTE = '''
+    INSERT OR REPLACE INTO quote_cache (symbol, price, time, name, fetched_at)
+    VALUES (?, ?, ?, COALESCE(?, (SELECT name FROM quote_cache WHERE symbol = ?)), ?)
+'''
+SQL_SELECT_PORTFOLIO = '''
+    SELECT symbol as Symbol, company as Company, quantity as Quantity,
+           avg_price as BuyPrice, current_price as CurrentPrice,
+           price_updated_at as PriceUpdatedAt
+    FROM portfolio
+'''
+SQL_SELECT_CHANGED_POSITIONS = SQL_SELECT_PORTFOLIO + '''
+    WHERE symbol IN (SELECT symbol FROM transactions WHERE id > ?)
+'''
+SQL_STAGE_PRICE = 'INSERT OR REPLACE INTO temp.price_updates (symbol, price) VALUES (?, ?)'
+SQL_CHANGED_PRICES = '''
+    SELECT u.symbol, u.price FROM temp.price_updates u
+    JOIN portfolio p ON p.symbol = u.symbol
+    WHERE p.current_price IS NOT u.price
+'''
+SQL_APPLY_PRICES = '''
+    UPDATE portfolio
+    SET current_price = (SELECT price FROM temp.price_updates u WHERE u.symbol = portfolio.symbol),
+        price_updated_at = ?
+    WHERE symbol IN (SELECT symbol FROM temp.price_updates)
+'''
+
+IMPORT_CHUNK_ROWS = 50_000
+
+# Accepted formats for transaction dates, tried in order. The dialogs and
+# cartera.csv use DD/MM/YYYY; trade_date always stores the ISO form.
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%y")
+
+# Ledger events that replace the position instead of adding to it:
+# ADJUST sets quantity and average price (edits), CLOSE removes it (deletes)
+RESET_ACTIONS = ('ADJUST', 'CLOSE')
+SNAPSHOT_INTERVAL = 1000  # transactions between portfolio snapshots
+SNAPSHOTS_KEPT = 3
+
+# Column names accepted by the CSV import, mapped to the ledger columns.
+# Covers the old cartera.csv export and the usual broker statement headers.
+IMPORT_COLUMNS = {
+    'Symbol': 'symbol',
+    'Company': 'company',
+    'Action': 'action',
+    'Quantity': 'quantity',
+    'Price': 'price',
+    'BuyPrice': 'price',
+    'Date': 'date',
+    'BuyDate': 'date',
+    'Lot': 'lot_id',
+    'LotId': 'lot_id',
+    # accion.py's cartera.csv
+    'Símbolo': 'symbol',
+    'Empresa': 'company',
+    'Cantidad': 'quantity',
+    'Precio Compra': 'price',
+}
+
+
+def iso_date(value):
+    # 'DD/MM/YYYY' (or another DATE_FORMATS entry, optionally with a time)
+    # -> 'YYYY-MM-DD'; None when it cannot be parsed
+    if value is None:
+        return None
+    text = str(value).strip().split(' ')[0].split('T')[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def iso_dates(values):
+    # iso_date over a pandas Series, parsing each distinct value once
+    mapping = {value: iso_date(value) for value in values.unique()}
+    return values.map(mapping)
+
+
+def positions_from_ledger(ledger):
+    # Replays add_transaction's rules over a whole ledger in one vectorized
+    # pass. `ledger` needs symbol, company, action, quantity, price, sorted
+    # in execution order. Returns symbol, company, quantity, avg_price.
+    #
+    # add_transaction clamps the quantity at zero on every SELL (overselling
+    # or selling an unknown symbol just leaves nothing). A running sum with a
+    # floor at zero is cumsum - min(0, cummin(cumsum)), so no loop is needed.
+    # ADJUST (set quantity and average) and CLOSE events discard everything
+    # before them, so each one starts a new segment that is summed on its own;
+    # an ADJUST then acts as the BUY that opens the segment.
+    import numpy as np
+    import pandas as pd
+
+    if ledger.empty:
+        return pd.DataFrame(columns=['symbol', 'company', 'quantity', 'avg_price'])
+
+    df = ledger.reset_index(drop=True)
+    action = df['action'].to_numpy()
+    reset = np.isin(action, RESET_ACTIONS)
+    is_buy = (action == 'BUY') | (action == 'ADJUST')
+    qty = df['quantity'].to_numpy(dtype=float)
+    signed = np.where(is_buy, qty, np.where(action == 'SELL', -qty, 0.0))
+
+    segment = pd.Series(reset).groupby(df['symbol'], sort=False).cumsum().to_numpy()
+    keys = [df['symbol'], segment]
+    raw = pd.Series(signed).groupby(keys, sort=False).cumsum()
+    floor = raw.groupby(keys, sort=False).cummin().clip(upper=0)
+    held = (raw - floor).to_numpy()
+
+    # The position row is deleted whenever it reaches zero, so only the rows
+    # since the symbol was last flat matter for the final average cost.
+    # A reset row opens a new episode even if the symbol was not flat.
+    flat = held <= 1e-9
+    episode = pd.Series(flat).groupby(df['symbol'], sort=False).cumsum().to_numpy() - flat + segment
+    last_episode = pd.Series(episode).groupby(df['symbol'], sort=False).transform('last').to_numpy()
+    final_held = pd.Series(held).groupby(df['symbol'], sort=False).transform('last').to_numpy()
+    live = (episode == last_episode) & (final_held > 1e-9)
+
+    # Cost basis follows C = r * C_prev + q * p, where a SELL keeps the average
+    # and scales C by r = held_after / held_before. Unrolled, each buy's cost
+    # reaches the end multiplied by the product of later ratios, which in log
+    # space is exp(logR_end - logR_at_buy) <= 1, so nothing can overflow.
+    held_before = pd.Series(held).groupby(keys, sort=False).shift(fill_value=0).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_r = np.where(is_buy | (held_before <= 0), 0.0, np.log(held / held_before))
+    log_r = np.where(live, log_r, 0.0)
+
+    live_df = pd.DataFrame({
+        'symbol': df['symbol'][live].to_numpy(),
+        'company': df['company'][live].to_numpy(),
+        'log_r': log_r[live],
+        'cost': (qty * df['price'].to_numpy(dtype=float))[live],
+        'is_buy': is_buy[live],
+        'held': held[live],
+    })
+    by_symbol = live_df.groupby('symbol', sort=False)
+    log_total = by_symbol['log_r'].cumsum()
+    live_df['weighted_cost'] = np.where(
+        live_df['is_buy'],
+        live_df['cost'] * np.exp(by_symbol['log_r'].transform('sum') - log_total),
+        0.0)
+
+    # add_transaction keeps the company of the BUY that opened the position
+    live_df['opening_company'] = live_df['company'].where(live_df['is_buy'])
+    agg = live_df.groupby('symbol', sort=False).agg(
+        company=('opening_company', 'first'),
+        cost=('weighted_cost', 'sum'),
+        quantity=('held', 'last'))
+    return pd.DataFrame({
+        'symbol': agg.index,
+        'company': agg['company'].to_numpy(),
+        'quantity': agg['quantity'].to_numpy(),
+        'avg_price': (agg['cost'] / agg['quantity']).to_numpy(),
+    })
+
+
+class PortfolioDB:
+    # A single long-lived connection is shared by the UI thread and the fetch
+    # threads. sqlite3 connections must not be used concurrently, so every
+    # access goes through _lock (re-entrant, so a transaction() block can call
+    # the other methods and they join the open transaction).
+    db_file = DB_FILE
+    _conn = None
+    _lock = threading.RLock()
+
+    @staticmethod
+    def use_database(path):
+        # Point the data-access layer at another file (benchmarks, tools)
+        with PortfolioDB._lock:
+            PortfolioDB.close()
+            PortfolioDB.db_file = path
+
+    @staticmethod
+    def connection():
+        with PortfolioDB._lock:
+            if PortfolioDB._conn is None:
+                conn = sqlite3.connect(PortfolioDB.db_file, check_same_thread=False,
+                                       isolation_level=None, cached_statements=256)
+                # WAL lets readers run while a writer commits, and NORMAL
+                # synchronous only fsyncs at checkpoints instead of every commit.
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute('PRAGMA cache_size=-8000')  # ~8 MB page cache
+                conn.execute('PRAGMA temp_store=MEMORY')
+                conn.execute('PRAGMA busy_timeout=5000')
+                PortfolioDB._conn = conn
+                if PortfolioDB._create_schema(conn):
+                    PortfolioDB.reconcile_ledger()
+            return PortfolioDB._conn
+
+    @staticmethod
+    def close():
+        with PortfolioDB._lock:
+            if PortfolioDB._conn is not None:
+                PortfolioDB._conn.close()
+                PortfolioDB._conn = None
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+        # Explicit transaction scope: BEGIN IMMEDIATE takes the write lock up
+        # front so a read-modify-write cannot interleave with another writer.
+        with PortfolioDB._lock:
+            conn = PortfolioDB.connection()
+            if conn.in_transaction:
+                # Nested scope, the outer block commits
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @staticmethod
+    def _create_schema(conn):
+        # Returns True when the snapshot tables are new on a database that
+        # already has data, i.e. the ledger has to be reconciled once.
+        is_new_snapshots = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snapshots'").fetchone() is None
+
+        # Transactions table (History)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT, -- as entered, DD/MM/YYYY
+                trade_date TEXT, -- YYYY-MM-DD, sortable
+                symbol TEXT,
+                company TEXT,
+                action TEXT, -- 'BUY', 'SELL', 'ADJUST', 'CLOSE'
+                quantity REAL,
+                price REAL,
+                lot_id INTEGER -- SELL of a specific lot: id of its BUY
+            )
+        ''')
+
+        # Portfolio table (Current State - Optimized for read)
+        # A materialized view of the transactions ledger: add_transaction
+        # keeps it in sync and rebuild_portfolio() recomputes it.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio (
+                symbol TEXT PRIMARY KEY,
+                company TEXT,
+                quantity REAL,
+                avg_price REAL,
+                current_price REAL DEFAULT 0
+            )
+        ''')
+
+        # ISO copy of the date for range queries (migration for existing DBs)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(transactions)')]
+        if 'trade_date' not in columns:
+            conn.execute('ALTER TABLE transactions ADD COLUMN trade_date TEXT')
+            PortfolioDB._backfill_trade_dates(conn)
+        if 'lot_id' not in columns:
+            conn.execute('ALTER TABLE transactions ADD COLUMN lot_id INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_symbol_date ON transactions (symbol, trade_date)')
+        # Covers the columns of range queries and monthly summaries, so
+        # those are answered from the index without touching the table
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_date
+            ON transactions (trade_date, symbol, action, quantity, price)
+        ''')
+
+        # Check if column exists (migration for existing DBs)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(portfolio)')]
+        if 'current_price' not in columns:
+            conn.execute('ALTER TABLE portfolio ADD COLUMN current_price REAL DEFAULT 0')
+        if 'price_updated_at' not in columns:
+            conn.execute('ALTER TABLE portfolio ADD COLUMN price_updated_at TEXT')
+
+        # Daily OHLCV history. WITHOUT ROWID stores the rows in the
+        # (symbol, date) primary key b-tree itself, so per-symbol range scans
+        # read one contiguous run; the date index covers cross-symbol closes.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS prices (
+                symbol TEXT NOT NULL,
+                date TEXT NOT NULL, -- YYYY-MM-DD
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                PRIMARY KEY (symbol, date)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_prices_date ON prices (date, symbol, close)')
+
+        # Date ranges already fetched per symbol, so backfills only ask for
+        # real gaps (weekends and holidays have no rows but are covered)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS price_coverage (
+                symbol TEXT NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                PRIMARY KEY (symbol, start)
+            ) WITHOUT ROWID
+        ''')
+
+        # Symbol index for local search (seeded from lookups and holdings)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY,
+                shortname TEXT,
+                longname TEXT,
+                exchange TEXT,
+                quote_type TEXT
+            )
+        ''')
+
+        # Last known quote per symbol (persistent tier of the quote cache)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS quote_cache (
+                symbol TEXT PRIMARY KEY,
+                price REAL,
+                time TEXT,
+                name TEXT,
+                fetched_at TEXT
+            )
+        ''')
+
+        # Portfolio state as of a transaction id (checkpoint), so a rebuild
+        # only replays the transactions after the latest snapshot
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                checkpoint_id INTEGER PRIMARY KEY, -- last transactions.id included
+                created_at TEXT,
+                positions INTEGER
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS snapshot_positions (
+                checkpoint_id INTEGER NOT NULL,
+                symbol TEXT NOT NULL,
+                company TEXT,
+                quantity REAL,
+                avg_price REAL,
+                PRIMARY KEY (checkpoint_id, symbol)
+            ) WITHOUT ROWID
+        ''')
+
+        # Target allocation for rebalancing: a symbol or an asset class
+        # (e.g. 'ARS', 'USD', 'BYMA') and its weight
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS targets (
+                target TEXT PRIMARY KEY,
+                weight REAL NOT NULL
+            )
+        ''')
+
+        if not is_new_snapshots:
+            return False
+        has_data = conn.execute(
+            'SELECT EXISTS (SELECT 1 FROM transactions) OR EXISTS (SELECT 1 FROM portfolio)').fetchone()[0]
+        return bool(has_data)
+
+    @staticmethod
+    def _backfill_trade_dates(conn):
+        # Well-formed DD/MM/YYYY and ISO dates are converted in SQL; anything
+        # else (single digit days, two digit years...) is parsed in Python.
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''
+            UPDATE transactions SET trade_date = CASE
+                WHEN date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+                    THEN substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+                WHEN date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+                    THEN substr(date, 1, 10)
+            END
+        ''')
+        rest = conn.execute('SELECT id, date FROM transactions WHERE trade_date IS NULL').fetchall()
+        conn.executemany('UPDATE transactions SET trade_date = ? WHERE id = ?',
+                         [(iso_date(date), id) for id, date in rest])
+        conn.commit()
+
+    @staticmethod
+    def init_db():
+        PortfolioDB.connection()
+
+    @staticmethod
+    def migrate_csv_if_needed(path=CSV_FILE):
+        # A cartera.csv (the desktop app's or the dashboard's) is imported
+        # into the ledger and then renamed so it is imported only once. Only
+        # into the default portfolio.db or a database with no ledger yet:
+        # another database (--db) takes it with `cli.py import`.
+        PortfolioDB.init_db()
+        if not os.path.exists(path):
+            return
+        default = os.path.abspath(PortfolioDB.db_file) == os.path.abspath(DB_FILE)
+        if not default and PortfolioDB.ledger_version():
+            print(f"{path} not imported into {PortfolioDB.db_file}: use cli.py --db {PortfolioDB.db_file} import {path}")
+            return
+        print("Migrating CSV to DB...")
+        try:
+            PortfolioDB.import_transactions_csv(path)
+        except Exception as e:
+            print(f"Migration failed: {e}")
+            return
+        # Backup CSV, without overwriting an earlier backup
+        backup = path + ".bak"
+        n = 1
+        while os.path.exists(backup):
+            backup = f"{path}.bak.{n}"
+            n += 1
+        shutil.move(path, backup)
+        print(f"Migration complete. CSV backed up to {backup}.")
+
+    @staticmethod
+    @timed("db.add_transaction")
+    def add_transaction(symbol, company, action, quantity, price, date, lot=None):
+        # lot: for a SELL, id of the BUY transaction whose lot is sold first
+        # (see lots.py); the portfolio table itself keeps the average cost
+        with PortfolioDB.transaction() as conn:
+            # 1. Log transaction
+            record = (date, iso_date(date), symbol, company, action, quantity, price)
+            if lot is None:
+                txn_id = conn.execute(SQL_INSERT_TRANSACTION, record).lastrowid
+            else:
+                txn_id = conn.execute(SQL_INSERT_LOT_TRANSACTION, record + (int(lot),)).lastrowid
+
+            # 2. Update Portfolio State
+            row = None if action in RESET_ACTIONS else conn.execute(SQL_SELECT_POSITION, (symbol,)).fetchone()
+            if action in RESET_ACTIONS:
+                # Edits and deletes replace the position outright
+                if action == 'ADJUST' and quantity > 0:
+                    conn.execute(SQL_ADJUST_POSITION, (symbol, company, quantity, price))
+                else:
+                    conn.execute(SQL_DELETE_POSITION, (symbol,))
+            elif row:
+                current_qty, current_avg = row
+                if action == 'BUY':
+                    new_qty = current_qty + quantity
+                    # Weighted Average
+                    new_avg = ((current_qty * current_avg) + (quantity * price)) / new_qty
+                    conn.execute(SQL_UPDATE_POSITION, (new_qty, new_avg, symbol))
+                elif action == 'SELL':
+                    new_qty = max(0, current_qty - quantity)
+                    if new_qty == 0:
+                        conn.execute(SQL_DELETE_POSITION, (symbol,))
+                    else:
+                        # Selling doesn't change average cost basis usually
+                        conn.execute(SQL_UPDATE_QUANTITY, (new_qty, symbol))
+            else:
+                if action == 'BUY':
+                    conn.execute(SQL_INSERT_POSITION, (symbol, company, quantity, price))
+
+            # 3. Snapshot every SNAPSHOT_INTERVAL transactions
+            if txn_id - conn.execute(SQL_LAST_CHECKPOINT).fetchone()[0] >= SNAPSHOT_INTERVAL:
+                PortfolioDB.rebuild_portfolio()
+
+    @staticmethod
+    @timed("db.import_transactions_csv")
+    def import_transactions_csv(path, chunksize=IMPORT_CHUNK_ROWS):
+        # Bulk import for CSV migration and broker statements. The file is
+        # streamed in chunks, every row goes in with executemany and the
+        # portfolio table is rebuilt once at the end, all in one transaction.
+        import pandas as pd
+
+        start = time.perf_counter()
+        rows = 0
+        ids = {}  # the file's transaction ids -> the ids given here
+        with PortfolioDB.transaction() as conn:
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                rows += PortfolioDB._insert_records(conn, chunk, ids)
+            PortfolioDB.rebuild_portfolio()
+
+        elapsed = time.perf_counter() - start
+        rate = rows / elapsed if elapsed > 0 else 0
+        print(f"Imported {rows} transactions in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+        return {'rows': rows, 'seconds': elapsed, 'rows_per_sec': rate}
+
+    @staticmethod
+    @timed("db.add_transactions")
+    def add_transactions(records):
+        # Bulk version of add_transaction for a DataFrame with the CSV import
+        # columns (e.g. simulated fills): one insert, one rebuild
+        with PortfolioDB.transaction() as conn:
+            rows = PortfolioDB._insert_records(conn, records)
+            PortfolioDB.rebuild_portfolio()
+        return rows
+
+    @staticmethod
+    def _insert_records(conn, chunk, ids=None):
+        # A file with an `id` column (core.export_csv's ledger) has its
+        # lot_ids pointing at those ids: they are mapped to the ids the rows
+        # get here, through `ids`, which carries over between chunks.
+        # Without one, lot_ids are ids already in this database.
+        import pandas as pd
+
+        today = datetime.now().strftime("%d/%m/%Y")
+        chunk = chunk.rename(columns=IMPORT_COLUMNS)
+        chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+        if 'action' not in chunk:
+            chunk['action'] = 'BUY'
+        if 'company' not in chunk:
+            chunk['company'] = chunk['symbol']
+        if 'date' not in chunk:
+            chunk['date'] = today
+        chunk['symbol'] = chunk['symbol'].astype(str).str.strip().str.upper()
+        chunk['action'] = chunk['action'].astype(str).str.strip().str.upper()
+        chunk['company'] = chunk['company'].fillna(chunk['symbol'])
+        chunk['date'] = chunk['date'].fillna(today).astype(str)
+        chunk['trade_date'] = iso_dates(chunk['date'])
+
+        columns = ['date', 'trade_date', 'symbol', 'company', 'action', 'quantity', 'price']
+        records = chunk[columns]
+        if records.empty:
+            return 0
+        conn.executemany(SQL_INSERT_TRANSACTION, records.itertuples(index=False, name=None))
+        # The rows of one executemany get consecutive ids
+        last = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        new_ids = range(last - len(records) + 1, last + 1)
+        if 'id' in chunk:
+            ids = {} if ids is None else ids
+            ids.update(zip(chunk['id'].astype(int), new_ids))
+        if 'lot_id' in chunk and chunk['lot_id'].notna().any():
+            lots = [(ids.get(int(lot), int(lot)) if 'id' in chunk else int(lot), new_id)
+                    for lot, new_id in zip(chunk['lot_id'], new_ids) if pd.notna(lot)]
+            conn.executemany('UPDATE transactions SET lot_id = ? WHERE id = ?', lots)
+        return len(records)
+
+    @staticmethod
+    @timed("db.rebuild_portfolio")
+    def rebuild_portfolio(full=False):
+        # Recompute the portfolio table from the ledger in one vectorized
+        # pass, keeping the last known market prices. Starts from the latest
+        # snapshot (its positions replayed as ADJUST events) and only reads
+        # the transactions after its checkpoint; full=True replays everything.
+        # Records a new snapshot when there were transactions to replay.
+        import pandas as pd
+
+        with PortfolioDB.transaction() as conn:
+            checkpoint = 0 if full else conn.execute(SQL_LAST_CHECKPOINT).fetchone()[0]
+            seed = pd.read_sql_query(
+                "SELECT symbol, company, 'ADJUST' AS action, quantity, avg_price AS price "
+                "FROM snapshot_positions WHERE checkpoint_id = ?", conn, params=(checkpoint,))
+            ledger = pd.read_sql_query(
+                'SELECT id, symbol, company, action, quantity, price FROM transactions WHERE id > ? ORDER BY id',
+                conn, params=(checkpoint,))
+            last_id = int(ledger['id'].iloc[-1]) if len(ledger) else checkpoint
+            ledger = ledger.drop(columns='id')
+            if len(seed):
+                ledger = pd.concat([seed, ledger], ignore_index=True)
+            # Market prices and when they were fetched, so the scheduler
+            # does not see every symbol as never fetched after a rebuild
+            prices = {symbol: (price, updated_at) for symbol, price, updated_at in
+                      conn.execute('SELECT symbol, current_price, price_updated_at FROM portfolio')}
+            positions = positions_from_ledger(ledger)
+
+            conn.execute('DELETE FROM portfolio')
+            conn.executemany(SQL_INSERT_FULL_POSITION, (
+                (symbol, company, float(quantity), float(avg_price), *prices.get(symbol, (0, None)))
+                for symbol, company, quantity, avg_price in positions.itertuples(index=False, name=None)
+            ))
+            if last_id > checkpoint:
+                PortfolioDB._save_snapshot(conn, last_id, positions)
+        return len(positions)
+
+    @staticmethod
+    def _save_snapshot(conn, checkpoint_id, positions):
+        now = datetime.now().isoformat(timespec='seconds')
+        conn.execute('INSERT OR REPLACE INTO snapshots (checkpoint_id, created_at, positions) VALUES (?, ?, ?)',
+                     (checkpoint_id, now, len(positions)))
+        conn.execute('DELETE FROM snapshot_positions WHERE checkpoint_id = ?', (checkpoint_id,))
+        conn.executemany(
+            'INSERT INTO snapshot_positions (checkpoint_id, symbol, company, quantity, avg_price) VALUES (?, ?, ?, ?, ?)',
+            ((checkpoint_id, symbol, company, float(quantity), float(avg_price))
+             for symbol, company, quantity, avg_price in positions.itertuples(index=False, name=None)))
+
+        # Keep only the latest few
+        conn.execute(
+            'DELETE FROM snapshots WHERE checkpoint_id NOT IN '
+            '(SELECT checkpoint_id FROM snapshots ORDER BY checkpoint_id DESC LIMIT ?)', (SNAPSHOTS_KEPT,))
+        conn.execute('DELETE FROM snapshot_positions WHERE checkpoint_id NOT IN (SELECT checkpoint_id FROM snapshots)')
+
+    @staticmethod
+    @timed("db.reconcile_ledger")
+    def reconcile_ledger():
+        # One-off migration for databases from before edits and deletes were
+        # ledger events: the portfolio table may have drifted from the
+        # transactions. Records ADJUST/CLOSE events so replaying the ledger
+        # gives exactly the current positions, then takes a first snapshot.
+        import pandas as pd
+
+        now = datetime.now()
+        today, today_iso = now.strftime("%d/%m/%Y"), now.date().isoformat()
+        with PortfolioDB.transaction() as conn:
+            ledger = pd.read_sql_query(
+                'SELECT symbol, company, action, quantity, price FROM transactions ORDER BY id', conn)
+            replayed = positions_from_ledger(ledger).set_index('symbol')
+            current = pd.read_sql_query(
+                'SELECT symbol, company, quantity, avg_price FROM portfolio', conn).set_index('symbol')
+
+            events = []
+            for symbol, company, quantity, avg_price in current.itertuples(name=None):
+                if symbol in replayed.index:
+                    expected = replayed.loc[symbol]
+                    if (expected['company'] == company and abs(expected['quantity'] - quantity) <= 1e-9
+                            and abs(expected['avg_price'] - avg_price) <= 1e-9 * max(1.0, abs(avg_price))):
+                        continue
+                events.append((today, today_iso, symbol, company, 'ADJUST', quantity, avg_price))
+            for symbol in replayed.index.difference(current.index):
+                events.append((today, today_iso, symbol, replayed.loc[symbol, 'company'], 'CLOSE', 0, 0))
+            conn.executemany(SQL_INSERT_TRANSACTION, events)
+            if events:
+                print(f"Reconciled ledger with the portfolio: {len(events)} adjustment(s)")
+            PortfolioDB.rebuild_portfolio(full=True)
+
+    @staticmethod
+    @timed("db.get_ledger")
+    def get_ledger():
+        # Every transaction in execution order, as positions_from_ledger takes
+        # it, plus the id, the ISO trade date and the lot sold (lots.py)
+        import pandas as pd
+
+        with PortfolioDB._lock:
+            return pd.read_sql_query(
+                'SELECT id, symbol, company, action, quantity, price, trade_date, lot_id '
+                'FROM transactions ORDER BY id',
+                PortfolioDB.connection())
+
+    @staticmethod
+    def get_targets():
+        with PortfolioDB._lock:
+            return dict(PortfolioDB.connection().execute('SELECT target, weight FROM targets ORDER BY target'))
+
+    @staticmethod
+    @timed("db.set_targets")
+    def set_targets(targets, replace=False):
+        # Upsert {target: weight}; a weight of None removes the target (0 is
+        # a target: sell it all). replace=True drops every target not in
+        # `targets`.
+        with PortfolioDB.transaction() as conn:
+            if replace:
+                conn.execute('DELETE FROM targets')
+            for target, weight in targets.items():
+                if weight is not None:
+                    conn.execute('INSERT OR REPLACE INTO targets (target, weight) VALUES (?, ?)',
+                                 (target, float(weight)))
+                else:
+                    conn.execute('DELETE FROM targets WHERE target = ?', (target,))
+
+    @staticmethod
+    def ledger_version():
+        # Id of the last transaction: changes whenever the ledger does
+        with PortfolioDB._lock:
+            return PortfolioDB.connection().execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+
+    @staticmethod
+    @timed("db.get_changed_positions")
+    def get_changed_positions(since):
+        # Positions touched by transactions recorded after ledger version
+        # `since` (see ledger_version), for readers that keep a copy of the
+        # portfolio. Returns (version, rows of those symbols still held,
+        # every symbol touched): a touched symbol without a row was closed.
+        # Read in one snapshot, so a concurrent writer (the other app) is
+        # either entirely in or entirely out.
+        import pandas as pd
+
+        with PortfolioDB._lock:
+            conn = PortfolioDB.connection()
+            nested = conn.in_transaction
+            if not nested:
+                conn.execute('BEGIN')
+            try:
+                version = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+                touched = [row[0] for row in conn.execute(
+                    'SELECT DISTINCT symbol FROM transactions WHERE id > ?', (since,))]
+                rows = pd.read_sql_query(SQL_SELECT_CHANGED_POSITIONS, conn, params=(since,))
+            finally:
+                if not nested:
+                    conn.commit()
+        return version, rows, touched
+
+    @staticmethod
+    @timed("db.get_portfolio_df")
+    def get_portfolio_df():
+        import pandas as pd
+
+        with PortfolioDB._lock:
+            # We read 'current_price' as CurrentPrice
+            return pd.read_sql_query(SQL_SELECT_PORTFOLIO, PortfolioDB.connection())
+
+    @staticmethod
+    @timed("db.update_current_price")
+    def update_current_price(symbol, price):
+        with PortfolioDB.transaction() as conn:
+            conn.execute(SQL_UPDATE_PRICE, (price, symbol))
+
+    @staticmethod
+    @timed("db.update_current_prices")
+    def update_current_prices(prices):
+        # Bulk write-back after a refresh, in one transaction: the prices are
+        # staged in a temp table and applied with a single UPDATE, stamping
+        # price_updated_at. Missing prices (0/None, i.e. failed fetches) are
+        # skipped so the last known price stays. Returns {symbol: new_price}
+        # for the rows whose price actually changed.
+        valid = [(symbol, float(price)) for symbol, price in prices.items() if price and price > 0]
+        if not valid:
+            return {}
+        now = datetime.now().isoformat(timespec='seconds')
+        with PortfolioDB.transaction() as conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS price_updates (symbol TEXT PRIMARY KEY, price REAL)')
+            conn.execute('DELETE FROM temp.price_updates')
+            conn.executemany(SQL_STAGE_PRICE, valid)
+            changed = dict(conn.execute(SQL_CHANGED_PRICES).fetchall())
+            conn.execute(SQL_APPLY_PRICES, (now,))
+            conn.execute('DELETE FROM temp.price_updates')
+        return changed
+
+    @staticmethod
+    @timed("db.load_cached_quotes")
+    def load_cached_quotes():
+        from market_data import Quote
+        with PortfolioDB._lock:
+            rows = PortfolioDB.connection().execute(
+                'SELECT symbol, price, time, name FROM quote_cache').fetchall()
+        return [Quote(symbol, price, datetime.fromisoformat(time) if time else None, name)
+                for symbol, price, time, name in rows]
+
+    @staticmethod
+    @timed("db.save_cached_quotes")
+    def save_cached_quotes(quotes):
+        now = datetime.now().isoformat(timespec='seconds')
+        with PortfolioDB.transaction() as conn:
+            conn.executemany(SQL_SAVE_QUOTE, (
+                (q.symbol, q.price, q.time.isoformat() if q.time else None, q.name, q.symbol, now)
+                for q in quotes
+            ))
+
+    @staticmethod
+    @timed("db.get_trades")
+    def get_trades(start=None, end=None, symbol=None, actions=None):
+        # Transactions between two dates (inclusive, ISO or DD/MM/YYYY; open
+        # ended when None), optionally for one symbol and some actions, in
+        # date order. Served by the (trade_date) or (symbol, trade_date) index.
+        import pandas as pd
+
+        where, params = PortfolioDB._trade_filter(start, end, symbol, actions)
+        query = f'{SQL_SELECT_TRADES} WHERE {where} ORDER BY trade_date, id'
+        with PortfolioDB._lock:
+            return pd.read_sql_query(query, PortfolioDB.connection(), params=params)
+
+    @staticmethod
+    def get_symbol_history(symbol, start=None, end=None):
+        return PortfolioDB.get_trades(start, end, symbol=symbol)
+
+    @staticmethod
+    @timed("db.get_monthly_summary")
+    def get_monthly_summary(start=None, end=None, symbol=None):
+        # Trades, quantity and amount (quantity * price) per month and action
+        import pandas as pd
+
+        where, params = PortfolioDB._trade_filter(start, end, symbol)
+        with PortfolioDB._lock:
+            return pd.read_sql_query(SQL_MONTHLY_SUMMARY.format(where=where), PortfolioDB.connection(),
+                                     params=params)
+
+    @staticmethod
+    def _trade_filter(start=None, end=None, symbol=None, actions=None):
+        clauses, params = ['trade_date IS NOT NULL'], []
+        if symbol:
+            clauses.append('symbol = ?')
+            params.append(symbol)
+        if start:
+            clauses.append('trade_date >= ?')
+            params.append(iso_date(start) or start)
+        if end:
+            clauses.append('trade_date <= ?')
+            params.append(iso_date(end) or end)
+        if actions:
+            clauses.append(f"action IN ({', '.join('?' * len(actions))})")
+            params.extend(actions)
+        return ' AND '.join(clauses), params
+
+    @staticmethod
+    @timed("db.get_symbol_quantity")
+    def get_symbol_quantity(symbol):
+        with PortfolioDB._lock:
+            row = PortfolioDB.connection().execute(SQL_SELECT_QUANTITY, (symbol,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    @timed("db.delete_symbol")
+    def delete_symbol(symbol, date=None):
+        # Recorded as a CLOSE event; earlier transactions stay as history
+        with PortfolioDB.transaction() as conn:
+            row = conn.execute('SELECT company, quantity, avg_price FROM portfolio WHERE symbol = ?', (symbol,)).fetchone()
+            if row:
+                company, quantity, avg_price = row
+                PortfolioDB.add_transaction(symbol, company, 'CLOSE', quantity, avg_price,
+                                            date or datetime.now().strftime("%d/%m/%Y"))
+
+    @staticmethod
+    @timed("db.update_symbol")
+    def update_symbol(symbol, quantity, price, date=None, company=None):
+        # Recorded as an ADJUST event that sets quantity and average price
+        # (and the company name, if given)
+        with PortfolioDB.transaction() as conn:
+            row = conn.execute('SELECT company FROM portfolio WHERE symbol = ?', (symbol,)).fetchone()
+            if row:
+                PortfolioDB.add_transaction(symbol, company or row[0], 'ADJUST', quantity, price,
+                                            date or datetime.now().strftime("%d/%m/%Y"))
+
+
+# Checkpoint the WAL and release the file on interpreter exit
+atexit.register(PortfolioDB.close)
@@ -0,0 +1,216 @@
+from collections import deque
+from datetime import date, timedelta
+
+import pandas as pd
+
+import metrics
+from portfolio_db import PortfolioDB
+
+SQL_UPSERT_PRICE = '''
+    INSERT OR REPLACE INTO prices (symbol, date, open, high, low, close, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+FIELDS = ("open", "high", "low", "close", "volume")
+DEFAULT_START = date(2015, 1, 1)
+WRITE_LOG_SIZE = 256
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def merge_ranges(ranges):
+    # Merge overlapping or adjacent (start, end) date ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(covered, start, end):
+    # Pieces of [start, end] not inside any of the merged `covered` ranges
+    gaps = []
+    cursor = start
+    for cov_start, cov_end in covered:
+        if cov_end < cursor:
+            continue
+        if cov_start > end:
+            break
+        if cov_start > cursor:
+            gaps.append((cursor, cov_start - timedelta(days=1)))
+        cursor = max(cursor, cov_end + timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class PriceHistory:
+    # Local daily OHLCV store in portfolio.db (tables `prices` and
+    # `price_coverage`), filled incrementally from the price provider.
+    # `version` goes up on every write made by this process, and the write
+    # log keeps the oldest date each write touched, so caches built from the
+    # store (risk.ReturnsCache) can reload only what changed.
+    version = 0
+    _writes = deque(maxlen=WRITE_LOG_SIZE)  # (version, oldest date written)
+
+    @staticmethod
+    def _record_write(oldest):
+        PriceHistory.version += 1
+        PriceHistory._writes.append((PriceHistory.version, str(oldest)[:10]))
+
+    @staticmethod
+    def oldest_change_since(version):
+        # Oldest date written after `version` (None if nothing was), or
+        # date.min when the log no longer reaches back that far
+        if version >= PriceHistory.version:
+            return None
+        writes = [day for v, day in PriceHistory._writes if v > version]
+        if not PriceHistory._writes or PriceHistory._writes[0][0] > version + 1:
+            return date.min.isoformat()
+        return min(writes)
+
+    @staticmethod
+    def coverage(symbols):
+        placeholders = ",".join("?" * len(symbols))
+        with PortfolioDB._lock:
+            rows = PortfolioDB.connection().execute(
+                f'SELECT symbol, start, end FROM price_coverage WHERE symbol IN ({placeholders})',
+                list(symbols)).fetchall()
+        ranges = {symbol: [] for symbol in symbols}
+        for symbol, start, end in rows:
+            ranges[symbol].append((_as_date(start), _as_date(end)))
+        return {symbol: merge_ranges(r) for symbol, r in ranges.items()}
+
+    @staticmethod
+    def gaps(symbols, start=DEFAULT_START, end=None):
+        start, end = _as_date(start), _as_date(end) or date.today()
+        covered = PriceHistory.coverage(symbols)
+        return {symbol: missing_ranges(covered[symbol], start, end) for symbol in symbols}
+
+    @staticmethod
+    def backfill(symbols, start=DEFAULT_START, end=None, provider=None):
+        # Fetch only the date ranges not fetched before. Symbols sharing the
+        # same gap (the usual "since last refresh" case) go in one request.
+        if provider is None:
+            from market_data import get_provider
+            provider = get_provider()
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return 0
+
+        batches = {}
+        for symbol, gaps in PriceHistory.gaps(symbols, start, end).items():
+            for gap in gaps:
+                batches.setdefault(gap, []).append(symbol)
+
+        # Today's bar is still moving: store it but don't mark it covered,
+        # so the next backfill fetches the final close.
+        last_final_day = date.today() - timedelta(days=1)
+        stored = 0
+        for (gap_start, gap_end), batch in batches.items():
+            try:
+                history = provider.get_history(batch, gap_start, gap_end)
+            except Exception as e:
+                print(f"Failed to backfill {len(batch)} symbols {gap_start}..{gap_end}: {e}")
+                metrics.incr("errors.backfill")
+                continue
+            # Only symbols that got bars are marked covered, so one the
+            # provider had nothing for is asked again next time. A gap with
+            # no weekdays has nothing to fetch and is covered for all.
+            covered_end = min(gap_end, last_final_day)
+            got = set() if history is None or history.empty else set(history["symbol"])
+            if gap_start <= covered_end and pd.bdate_range(gap_start, covered_end).empty:
+                got = set(batch)
+            with PortfolioDB.transaction() as conn:
+                stored += PriceHistory.store(history)
+                if gap_start <= covered_end:
+                    for symbol in batch:
+                        if symbol in got:
+                            PriceHistory._mark_covered(conn, symbol, gap_start, covered_end)
+        return stored
+
+    @staticmethod
+    def store(history):
+        if history is None or history.empty:
+            return 0
+        rows = history[["symbol", "date", *FIELDS]].astype({f: float for f in FIELDS})
+        with PortfolioDB.transaction() as conn:
+            conn.executemany(SQL_UPSERT_PRICE, rows.itertuples(index=False, name=None))
+        PriceHistory._record_write(rows["date"].min())
+        return len(rows)
+
+    @staticmethod
+    def store_rate(symbol, rate, day=None):
+        # One close-only bar (e.g. the USD/ARS rate of a refresh). Not marked
+        # covered, so a later backfill still fetches the full bar.
+        day = (_as_date(day) or date.today()).isoformat()
+        with PortfolioDB.transaction() as conn:
+            conn.execute(SQL_UPSERT_PRICE, (symbol, day, rate, rate, rate, rate, 0.0))
+        PriceHistory._record_write(day)
+
+    @staticmethod
+    def _mark_covered(conn, symbol, start, end):
+        rows = conn.execute('SELECT start, end FROM price_coverage WHERE symbol = ?', (symbol,)).fetchall()
+        ranges = merge_ranges([(_as_date(s), _as_date(e)) for s, e in rows] + [(start, end)])
+        conn.execute('DELETE FROM price_coverage WHERE symbol = ?', (symbol,))
+        conn.executemany('INSERT INTO price_coverage (symbol, start, end) VALUES (?, ?, ?)',
+                         [(symbol, s.isoformat(), e.isoformat()) for s, e in ranges])
+
+    # Queries
+
+    @staticmethod
+    def get_history(symbol, start=None, end=None):
+        # OHLCV frame for one symbol, indexed by date
+        start, end = _as_date(start) or date.min, _as_date(end) or date.max
+        with PortfolioDB._lock:
+            df = pd.read_sql_query(
+                'SELECT date, open, high, low, close, volume FROM prices '
+                'WHERE symbol = ? AND date BETWEEN ? AND ? ORDER BY date',
+                PortfolioDB.connection(), params=(symbol, start.isoformat(), end.isoformat()))
+        df["date"] = pd.to_datetime(df["date"])
+        return df.set_index("date")
+
+    @staticmethod
+    def get_series(symbol, start=None, end=None, field="close"):
+        # One field of one symbol as a Series indexed by date
+        return PriceHistory.get_history(symbol, start, end)[field].dropna()
+
+    @staticmethod
+    def latest(symbol):
+        # (date, close) of the newest bar, or None
+        with PortfolioDB._lock:
+            return PortfolioDB.connection().execute(
+                'SELECT date, close FROM prices WHERE symbol = ? ORDER BY date DESC LIMIT 1', (symbol,)).fetchone()
+
+    @staticmethod
+    def get_matrix(symbols, start=None, end=None, field="close", fill=True):
+        # Dates x symbols frame of one field, aligned on the union of trading
+        # days. fill=True carries the last value over days a market was shut
+        # (BYMA and NYSE holidays differ).
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field {field}")
+        symbols = list(dict.fromkeys(symbols))
+        start, end = _as_date(start) or date.min, _as_date(end) or date.max
+        placeholders = ",".join("?" * len(symbols))
+        with PortfolioDB._lock:
+            long = pd.read_sql_query(
+                f'SELECT date, symbol, {field} FROM prices '
+                f'WHERE symbol IN ({placeholders}) AND date BETWEEN ? AND ?',
+                PortfolioDB.connection(), params=[*symbols, start.isoformat(), end.isoformat()])
+        matrix = long.pivot(index="date", columns="symbol", values=field).reindex(columns=symbols)
+        matrix.index = pd.to_datetime(matrix.index)
+        matrix = matrix.sort_index()
+        if fill:
+            matrix = matrix.ffill()
+        return matrix
+
+    @staticmethod
+    def get_array(symbols, start=None, end=None, field="close", fill=True):
+        # Same as get_matrix as plain NumPy: (dates, symbols, values[date, symbol])
+        matrix = PriceHistory.get_matrix(symbols, start, end, field, fill)
+        return matrix.index.to_numpy(), list(matrix.columns), matrix.to_numpy(dtype=float)
@@ -0,0 +1,306 @@
+import json
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+import metrics
+from fetch_engine import backoff_delay
+
+# One streamed price. `time` is a datetime.
+Tick = namedtuple("Tick", ["symbol", "price", "time"])
+
+# Set PRICE_FEED to host:port to stream prices from a feed server
+PRICE_FEED_ENV = "PRICE_FEED"
+DEFAULT_CAPACITY = 512  # ticks kept per symbol
+DEFAULT_FRAME_MS = 100  # at most one UI update per frame
+CONNECT_TIMEOUT = 5
+
+
+class TickBuffer:
+    # Ring buffer of recent ticks per symbol (deque with maxlen), plus the
+    # set of symbols that ticked since the last drain. Feed threads push,
+    # the UI drains.
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._ticks = {}  # symbol -> deque of Tick
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.received = 0
+
+    def push(self, tick):
+        with self._lock:
+            ring = self._ticks.get(tick.symbol)
+            if ring is None:
+                ring = self._ticks[tick.symbol] = deque(maxlen=self.capacity)
+            ring.append(tick)
+            self._dirty.add(tick.symbol)
+            self.received += 1
+
+    def last(self, symbol):
+        with self._lock:
+            ring = self._ticks.get(symbol)
+            return ring[-1] if ring else None
+
+    def history(self, symbol):
+        with self._lock:
+            return list(self._ticks.get(symbol, ()))
+
+    def drain_latest(self):
+        # {symbol: latest price} for every symbol that ticked since last call
+        with self._lock:
+            latest = {symbol: self._ticks[symbol][-1].price for symbol in self._dirty}
+            self._dirty.clear()
+        return latest
+
+
+class FrameCoalescer:
+    # Applies buffered ticks at most once per frame: every `frame_ms` it
+    # drains the buffer and calls apply({symbol: price}) only if something
+    # ticked, however many ticks arrived in between. `schedule` is Tk's
+    # after(), so apply always runs on the UI thread.
+    def __init__(self, buffer, apply, schedule, frame_ms=DEFAULT_FRAME_MS):
+        self.buffer = buffer
+        self.apply = apply
+        self.schedule = schedule
+        self.frame_ms = frame_ms
+        self.frames = 0
+        self._running = False
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self.schedule(self.frame_ms, self._frame)
+
+    def stop(self):
+        self._running = False
+
+    def _frame(self):
+        if not self._running:
+            return
+        latest = self.buffer.drain_latest()
+        if latest:
+            self.frames += 1
+            metrics.incr("stream.frames")
+            try:
+                self.apply(latest)
+            except Exception as e:
+                print(f"Failed to apply streamed prices: {e}")
+                metrics.incr("errors.stream")
+        self.schedule(self.frame_ms, self._frame)
+
+
+class PriceFeed:
+    # Interface for pushed prices. start() begins delivering Tick objects to
+    # on_tick from a background thread until stop().
+    def subscribe(self, symbols):
+        raise NotImplementedError
+
+    def start(self, on_tick):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+
+class TcpPriceFeed(PriceFeed):
+    # Newline-delimited JSON over TCP. The client sends
+    #   {"subscribe": ["VIST.BA", ...]}
+    # and receives {"symbol": ..., "price": ..., "time": "ISO"} lines.
+    # Reconnects with backoff after errors and after the server closes the
+    # stream; changing the subscription reconnects at once. Nothing is
+    # connected while the subscription is empty.
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._symbols = set()
+        self._sock = None
+        self._resubscribed = False  # the last hang-up was subscribe()'s
+        self._changed = threading.Event()  # subscription changed or stop()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbols):
+        with self._lock:
+            if set(symbols) == self._symbols:
+                return
+            self._symbols = set(symbols)
+            sock = self._sock
+            self._resubscribed = sock is not None
+        self._changed.set()
+        if sock:
+            # The reader loop reconnects with the new subscription
+            _hang_up(sock)
+
+    def start(self, on_tick):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_tick,), name="price-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._changed.set()
+        with self._lock:
+            sock = self._sock
+        if sock:
+            _hang_up(sock)
+
+    def _run(self, on_tick):
+        attempt = 0
+        while not self._stop.is_set():
+            with self._lock:
+                symbols = sorted(self._symbols)
+            if not symbols:
+                # Nothing to stream until subscribe() gives symbols
+                self._changed.wait()
+                self._changed.clear()
+                continue
+            error = None
+            try:
+                ticks = self._stream(on_tick)
+            except OSError as e:
+                ticks, error = 0, e
+            if self._stop.is_set():
+                break
+            with self._lock:
+                resubscribed, self._resubscribed = self._resubscribed, False
+            if resubscribed:
+                attempt = 0
+                continue
+            # Closed by the server or failed: back off, starting over only
+            # after a connection that delivered ticks
+            if ticks:
+                attempt = 0
+            print(f"Price feed {self.host}:{self.port} disconnected: {error or 'closed by the server'}")
+            metrics.incr("stream.reconnects")
+            self._stop.wait(backoff_delay(attempt))
+            attempt += 1
+
+    def _stream(self, on_tick):
+        # Returns the number of ticks delivered before the stream ended
+        ticks = 0
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        with self._lock:
+            # The symbols are read as the socket is published: a subscribe()
+            # from here on hangs this connection up, and one made while it
+            # was connecting is already in the set sent
+            symbols = sorted(self._symbols)
+            # Emptied or stopped while connecting: the reader loop decides again
+            cancelled = not symbols or self._stop.is_set()
+            self._resubscribed = self._resubscribed or cancelled
+            self._sock = None if cancelled else sock
+        if cancelled:
+            sock.close()
+            return ticks
+        try:
+            sock.sendall((json.dumps({'subscribe': symbols}) + "\n").encode())
+            for line in sock.makefile("r", encoding="utf-8"):
+                try:
+                    message = json.loads(line)
+                    tick = Tick(message['symbol'], float(message['price']),
+                                datetime.fromisoformat(message['time']) if message.get('time') else datetime.now())
+                except (ValueError, KeyError, TypeError):
+                    metrics.incr("errors.stream")
+                    continue
+                metrics.incr("stream.ticks")
+                ticks += 1
+                on_tick(tick)
+        finally:
+            with self._lock:
+                self._sock = None
+            sock.close()
+        return ticks
+
+
+class StandInFeedServer:
+    # Local stand-in for a real feed, for development and benchmarks: sends
+    # random-walk ticks for the subscribed symbols at `rate` ticks per second
+    # to every client, in small batches.
+    def __init__(self, host="127.0.0.1", port=0, rate=100, start_prices=None, batch_ms=10):
+        self.rate = rate
+        self.start_prices = start_prices or {}
+        self.batch_ms = batch_ms
+        self._clients = set()
+        self._lock = threading.Lock()
+        feed = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with feed._lock:
+                    feed._clients.add(self.connection)
+                try:
+                    request = json.loads(self.rfile.readline() or "{}")
+                    symbols = request.get('subscribe') or []
+                    if symbols:
+                        feed._serve(self.wfile, symbols)
+                    else:
+                        # Nothing to send: hold the connection until the
+                        # client leaves instead of closing it at once
+                        self.rfile.read()
+                finally:
+                    with feed._lock:
+                        feed._clients.discard(self.connection)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((host, port), Handler)
+        self.address = self._server.server_address
+
+    def _serve(self, out, symbols):
+        rng = random.Random()
+        prices = {s: float(self.start_prices.get(s, 100.0)) for s in symbols}
+        per_batch = max(1, round(self.rate * self.batch_ms / 1000))
+        interval = per_batch / self.rate
+        next_batch = time.monotonic()
+        while True:
+            now = datetime.now().isoformat()
+            lines = []
+            for _ in range(per_batch):
+                symbol = rng.choice(symbols)
+                prices[symbol] *= 1 + rng.gauss(0, 0.0005)
+                lines.append(json.dumps({'symbol': symbol, 'price': round(prices[symbol], 4), 'time': now}))
+            try:
+                out.write(("\n".join(lines) + "\n").encode())
+                out.flush()
+            except OSError:
+                return
+            next_batch += interval
+            time.sleep(max(0.0, next_batch - time.monotonic()))
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="feed-server", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            clients = list(self._clients)
+        for sock in clients:
+            _hang_up(sock)
+
+
+def _hang_up(sock):
+    # shutdown() wakes a thread blocked reading the socket, close() alone
+    # does not while a makefile() still references it
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+def feed_from_env(value):
+    # "host:port" -> TcpPriceFeed
+    host, _, port = value.rpartition(":")
+    return TcpPriceFeed(host or "127.0.0.1", int(port))
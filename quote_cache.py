@@ -0,0 +1,249 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from market_data import PriceProvider, Quote
+
+DEFAULT_TTL = 60  # seconds a quote is served without refetching
+DEFAULT_MAX_ENTRIES = 2048
+RETRY_SECONDS = 15  # wait after a failed background refresh of a symbol
+
+
+class DBQuoteStore:
+    # Persistent tier: last known quotes in portfolio.db, so a restart can
+    # show prices before the first fetch completes.
+    def load(self):
+        from portfolio_db import PortfolioDB
+        return PortfolioDB.load_cached_quotes()
+
+    def save(self, quotes):
+        from portfolio_db import PortfolioDB
+        PortfolioDB.save_cached_quotes(quotes)
+
+
+class QuoteCache:
+    # In-process quote cache shared by the sidebar lookup, the single price
+    # refresh and the full refresh.
+    #   - every entry expires `ttl` seconds after it was fetched
+    #   - LRU eviction once max_entries is reached
+    #   - concurrent misses for the same symbol wait for the one in-flight
+    #     fetch instead of each going to the network
+    #   - expired entries are kept as "last known" values until evicted
+    # Hits, misses and coalesced misses are counted in metrics (quote_cache.*).
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, store=None, wait_timeout=30):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()  # symbol -> (Quote, fetched_at monotonic)
+        self._inflight = {}  # symbol -> threading.Event
+        self._lock = threading.Lock()
+
+    def load_persisted(self):
+        # Seed from the persistent tier. Entries come in already expired:
+        # they are shown as last known values but still trigger a fetch.
+        if not self.store:
+            return 0
+        quotes = self.store.load()
+        with self._lock:
+            for quote in quotes:
+                if quote.symbol not in self._entries:
+                    self._entries[quote.symbol] = (quote, float('-inf'))
+            self._evict()
+        return len(quotes)
+
+    def get(self, symbol):
+        # Fresh quote or None
+        with self._lock:
+            return self._fresh(symbol)
+
+    def last_known(self, symbol):
+        # Any cached quote, fresh or expired
+        with self._lock:
+            entry = self._entries.get(symbol)
+            return entry[0] if entry else None
+
+    def put_many(self, quotes):
+        quotes = list(quotes)
+        if not quotes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for quote in quotes:
+                previous = self._entries.get(quote.symbol)
+                # Batched quotes carry no name; keep one learned from get_info
+                if previous and quote.name is None and previous[0].name:
+                    quote = quote._replace(name=previous[0].name)
+                self._entries[quote.symbol] = (quote, now)
+                self._entries.move_to_end(quote.symbol)
+            self._evict()
+        if self.store:
+            try:
+                self.store.save(quotes)
+            except Exception as e:
+                print(f"Failed to persist quotes: {e}")
+                metrics.incr("errors.quote_store")
+
+    def get_many(self, symbols, fetch, timeout=None):
+        # Return {symbol: Quote}, calling fetch(missing_symbols) at most once
+        # for the symbols that are neither fresh nor already being fetched.
+        # Waits for another caller's fetch up to `timeout` (or wait_timeout).
+        result = {}
+        to_fetch = []
+        waits = []
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                quote = self._fresh(symbol)
+                if quote:
+                    result[symbol] = quote
+                elif symbol in self._inflight:
+                    waits.append((symbol, self._inflight[symbol]))
+                else:
+                    self._inflight[symbol] = threading.Event()
+                    to_fetch.append(symbol)
+        metrics.incr('quote_cache.hits', len(result))
+        metrics.incr('quote_cache.coalesced', len(waits))
+        metrics.incr('quote_cache.misses', len(to_fetch))
+
+        if to_fetch:
+            try:
+                fetched = fetch(to_fetch)
+                self.put_many(fetched.values())
+                result.update(fetched)
+            finally:
+                with self._lock:
+                    for symbol in to_fetch:
+                        self._inflight.pop(symbol).set()
+
+        for symbol, event in waits:
+            event.wait(timeout or self.wait_timeout)
+            quote = self.get(symbol)
+            if quote:
+                result[symbol] = quote
+        return result
+
+    def _fresh(self, symbol):
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        quote, fetched_at = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            return None
+        self._entries.move_to_end(symbol)
+        return quote
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class CachedPriceProvider(PriceProvider):
+    # PriceProvider decorator that answers from a QuoteCache first
+    def __init__(self, provider, cache):
+        self.provider = provider
+        self.cache = cache
+
+    def get_quotes(self, symbols, timeout=None):
+        return self.cache.get_many(symbols, lambda missing: self._fetch_quotes(missing, timeout), timeout)
+
+    def _fetch_quotes(self, symbols, timeout=None):
+        with metrics.span("provider.get_quotes"):
+            return self.provider.get_quotes(symbols, timeout)
+
+    def _fetch_info(self, symbol):
+        with metrics.span("provider.get_info"):
+            return self.provider.get_info(symbol)
+
+    def get_info(self, symbol):
+        quote = self.cache.get(symbol)
+        if quote and quote.name:
+            return {'symbol': symbol, 'name': quote.name, 'price': quote.price, 'time': quote.time}
+        if quote:
+            # Fresh price from a batch, but the name was never looked up
+            info = self._fetch_info(symbol)
+            if info:
+                self.cache.put_many([Quote(symbol, info['price'], info['time'], info['name'])])
+            return info
+
+        def fetch(symbols):
+            info = self._fetch_info(symbols[0])
+            if not info:
+                return {}
+            return {symbol: Quote(symbol, info['price'], info['time'], info['name'])}
+
+        quote = self.cache.get_many([symbol], fetch).get(symbol)
+        if not quote:
+            return None
+        return {'symbol': symbol, 'name': quote.name or "", 'price': quote.price, 'time': quote.time}
+
+    def get_history(self, symbols, start, end):
+        with metrics.span("provider.get_history"):
+            return self.provider.get_history(symbols, start, end)
+
+
+class BackgroundQuotes:
+    # Stale-while-refreshing reads for pages that must render at once (the
+    # Streamlit dashboard). snapshot() only reads the cache and, for the
+    # symbols that are missing or expired, starts one batched refresh on
+    # the fetch engine. A symbol the refresh could not price keeps its last
+    # known quote (reported as stale) and is retried after RETRY_SECONDS.
+    # `version` goes up whenever a refresh brings quotes, so a page can tell
+    # when to read them again.
+    def __init__(self, provider, engine, retry=RETRY_SECONDS):
+        self.provider = provider  # a CachedPriceProvider
+        self.engine = engine
+        self.retry = retry
+        self.last_error = None
+        self.version = 0
+        self._refreshing = set()
+        self._attempted = {}  # symbol -> monotonic time of the last refresh
+        self._lock = threading.Lock()
+
+    def snapshot(self, symbols):
+        # ({symbol: last known Quote}, set of symbols without a fresh quote,
+        # whether a refresh is running)
+        cache = self.provider.cache
+        symbols = list(dict.fromkeys(symbols))
+        quotes = {}
+        stale = set()
+        for symbol in symbols:
+            quote = cache.get(symbol)
+            if quote is None:
+                stale.add(symbol)
+                quote = cache.last_known(symbol)
+            if quote is not None:
+                quotes[symbol] = quote
+        self.refresh(stale)
+        with self._lock:
+            return quotes, stale, bool(self._refreshing & set(symbols))
+
+    def refresh(self, symbols):
+        # Start a background fetch for the symbols not already being fetched
+        # or retried too recently; returns the symbols submitted
+        now = time.monotonic()
+        with self._lock:
+            due = [s for s in symbols if s not in self._refreshing
+                   and now - self._attempted.get(s, float('-inf')) >= self.retry]
+            self._refreshing.update(due)
+            self._attempted.update((s, now) for s in due)
+        if due:
+            self.engine.submit(self.engine.call(self.provider.get_quotes, due), key=("background_quotes", tuple(sorted(due))),
+                               on_done=lambda quotes: self._finished(due, quotes, None),
+                               on_error=lambda error: self._finished(due, {}, error))
+        return due
+
+    def _finished(self, symbols, quotes, error):
+        missing = [s for s in symbols if s not in quotes]
+        if error is not None:
+            self.last_error = f"{error!r}"
+            metrics.incr("errors.background_quotes")
+        elif missing:
+            self.last_error = f"Sin cotización para {', '.join(missing)}"
+        else:
+            self.last_error = None
+        metrics.incr("background_quotes.stale", len(missing))
+        with self._lock:
+            if quotes:
+                self.version += 1
+            self._refreshing.difference_update(symbols)
@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+from scheduler import market_for
+from valuation import currency_for
+
+# Orders that bring the holdings back to target weights. Targets are per
+# symbol or per asset class (see CLASSIFIERS); symbols with no target are
+# left alone, and a target of 0 sells the position. Orders are whole lots,
+# fit in the cash available (the budget plus what the sells raise), skip
+# symbols whose weight is within the tolerance band of its target and drop
+# anything smaller than the minimum trade. The default solver is a few
+# vectorized NumPy passes over an accounts x symbols matrix, so it can run
+# on every price refresh; solver="milp" uses SciPy's MILP instead, if
+# installed.
+DEFAULT_TOLERANCE = 0.02  # absolute weight drift that is left alone
+DEFAULT_MIN_TRADE = 0.0  # smallest order, in the valuation currency
+ORDER_COLUMNS = ['Symbol', 'Action', 'Quantity', 'Price', 'Amount', 'Weight', 'NewWeight', 'Target']
+
+CLASSIFIERS = {
+    'currency': currency_for,
+    'market': lambda symbol: market_for(symbol) or "-",
+}
+
+
+def expand_targets(targets, symbols, values, classify=None):
+    # {symbol or class: weight} -> target weight per symbol, NaN when the
+    # symbol is not targeted. A class weight is shared by the symbols of the
+    # class without a target of their own, in proportion to their value
+    # (equally when none has value yet). Weights adding up to more than 1
+    # are scaled down.
+    symbols = list(symbols)
+    values = np.asarray(values, dtype=float)
+    weights = np.array([targets.get(s, np.nan) for s in symbols], dtype=float)
+    direct = ~np.isnan(weights)
+    if classify:
+        classes = pd.Series([classify(s) for s in symbols])
+        class_weight = classes.map(lambda c: targets.get(c, np.nan)).to_numpy(dtype=float)
+        # The symbol targets inside a class come out of the class weight
+        taken = pd.Series(np.where(direct, weights, 0.0)).groupby(classes).transform('sum').to_numpy()
+        members = ~direct & ~np.isnan(class_weight)
+        member = pd.Series(members.astype(float))
+        class_value = pd.Series(np.where(members, values, 0.0)).groupby(classes).transform('sum').to_numpy()
+        class_count = member.groupby(classes).transform('sum').to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.where(class_value > 0, values / class_value, 1.0 / class_count)
+        weights = np.where(members, np.clip(class_weight - taken, 0, None) * share, weights)
+    total = np.nansum(weights)
+    if total > 1:
+        weights = weights / total
+    return weights
+
+
+def rebalance_matrix(values, prices, weights, cash=0.0, lots=1, tolerance=DEFAULT_TOLERANCE,
+                     min_trade=DEFAULT_MIN_TRADE):
+    # Signed share quantities (accounts x symbols) for current `values` and
+    # `prices` in one currency. `weights` are the targets (NaN: not managed),
+    # `cash` the budget per account and `lots` the lot size per symbol.
+    # Every account is solved in the same array operations.
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    prices = np.broadcast_to(np.asarray(prices, dtype=float), values.shape)
+    weights = np.broadcast_to(np.asarray(weights, dtype=float), values.shape)
+    lots = np.broadcast_to(np.asarray(lots, dtype=float), values.shape)
+    cash = np.broadcast_to(np.asarray(cash, dtype=float), values.shape[:1])
+    priced = prices > 0
+    lot_value = np.where(priced, prices * lots, np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        held = np.where(priced, values / prices, 0.0)
+
+    total = values.sum(axis=1) + cash
+    managed = ~np.isnan(weights) & priced & (total > 0)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        target = np.where(managed, weights * total[:, None], values)
+        drift = np.where(managed, np.abs(values / total[:, None] - weights), 0.0)
+    wanted = np.where(managed & (drift > tolerance), target - values, 0.0)
+    wanted = np.where(np.abs(wanted) >= max(min_trade, 1e-9), wanted, 0.0)
+
+    # Whole lots toward zero; a target of 0 sells everything held
+    shares = np.trunc(wanted / lot_value) * lots
+    shares = np.where(managed & (weights == 0) & (wanted < 0), -held, np.maximum(shares, -held))
+    shares = np.where(np.abs(shares * prices) >= min_trade, shares, 0.0)
+
+    # Buys must fit in the cash plus the proceeds of the sells
+    buys = np.where(shares > 0, shares * prices, 0.0)
+    budget = cash + np.where(shares < 0, -shares * prices, 0.0).sum(axis=1)
+    spend = buys.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(spend > budget, np.clip(budget, 0, None) / spend, 1.0)
+    scaled = np.floor(np.where(shares > 0, shares * scale[:, None], 0.0) / lots) * lots
+    shares = np.where(shares > 0, scaled, shares)
+    shares = np.where((shares > 0) & (shares * prices < min_trade), 0.0, shares)
+
+    # Spend what is left one lot at a time on the largest shortfalls, where
+    # one more lot gets closer to the target than none
+    left = budget - np.where(shares > 0, shares * prices, 0.0).sum(axis=1)
+    shortfall = np.where(managed & (drift > tolerance) & (target > values), target - values - shares * prices, 0.0)
+    eligible = (shortfall > lot_value / 2) & ((shares > 0) | (lot_value >= min_trade))
+    order = np.argsort(np.where(eligible, -shortfall, np.inf), axis=1)
+    cost = np.take_along_axis(np.where(eligible, lot_value, np.inf), order, axis=1)
+    take_sorted = np.cumsum(np.where(np.isinf(cost), 0.0, cost), axis=1) <= left[:, None]
+    take_sorted &= np.isfinite(cost)
+    take = np.zeros_like(take_sorted)
+    np.put_along_axis(take, order, take_sorted, axis=1)
+    return shares + np.where(take, lots, 0.0)
+
+
+def solve_milp(values, prices, weights, cash=0.0, lots=1, tolerance=DEFAULT_TOLERANCE):
+    # Same problem for one account as a mixed-integer program: integer lots
+    # minimizing the total distance to the target values, within the cash.
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    values = np.asarray(values, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    lots = np.broadcast_to(np.asarray(lots, dtype=float), values.shape)
+    total = values.sum() + cash
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drift = np.abs(values / total - weights)
+    active = np.flatnonzero(~np.isnan(weights) & (prices > 0) & (drift > tolerance))
+    shares = np.zeros_like(values)
+    if not len(active) or total <= 0:
+        return shares
+
+    n = len(active)
+    lot_value = prices[active] * lots[active]
+    gap = weights[active] * total - values[active]
+    held_lots = np.floor(values[active] / lot_value)
+    # x: lots traded (integer), t: |gap - x * lot_value|
+    objective = np.concatenate([np.zeros(n), np.ones(n)])
+    eye = np.eye(n)
+    constraints = [
+        LinearConstraint(np.hstack([eye * lot_value, eye]), gap, np.inf),
+        LinearConstraint(np.hstack([-eye * lot_value, eye]), -gap, np.inf),
+        LinearConstraint(np.concatenate([lot_value, np.zeros(n)])[None, :], -np.inf, cash),
+    ]
+    bounds = Bounds(np.concatenate([-held_lots, np.zeros(n)]), np.full(2 * n, np.inf))
+    result = milp(objective, constraints=constraints, bounds=bounds,
+                  integrality=np.concatenate([np.ones(n), np.zeros(n)]))
+    if result.x is None:
+        raise ValueError(f"No rebalancing solution: {result.message}")
+    shares[active] = np.round(result.x[:n]) * lots[active]
+    return shares
+
+
+@metrics.timed("rebalance.plan")
+def rebalance(portfolio, targets, cash=0.0, classify=None, tolerance=DEFAULT_TOLERANCE,
+              min_trade=DEFAULT_MIN_TRADE, lots=None, prices=None, fx_rate=None, solver=None):
+    # Orders for a portfolio from core.value_portfolio. Amounts are in ARS
+    # when it has ValueARS (USD symbols converted at the rate implied by
+    # their valuation), else in the price currency. `classify` is a
+    # CLASSIFIERS key or a function symbol -> class; `lots` {symbol: lot
+    # size}; `prices` {symbol: price} for targeted symbols not held yet,
+    # converted with `fx_rate` when they are in USD.
+    # Returns (orders frame with ORDER_COLUMNS, summary dict).
+    if isinstance(classify, str):
+        classify = CLASSIFIERS[classify]
+    value_column = 'ValueARS' if 'ValueARS' in portfolio.columns else 'Value'
+    held = portfolio.groupby('Symbol').agg(
+        Quantity=('Quantity', 'sum'), Price=('CurrentPrice', 'first'),
+        Value=('Value', 'sum'), Base=(value_column, 'sum'))
+    # Price in the valuation currency
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(held['Value'] > 0, held['Base'] / held['Value'], 1.0)
+    base_prices = held['Price'].to_numpy(dtype=float) * factor
+
+    new = [s for s in targets if s not in held.index and (prices or {}).get(s)]
+    symbols = list(held.index) + new
+    new_prices = np.array([prices[s] * (fx_rate if fx_rate and value_column == 'ValueARS'
+                                        and currency_for(s) == 'USD' else 1.0) for s in new], dtype=float)
+    price = np.concatenate([base_prices, new_prices])
+    values = np.concatenate([held['Base'].to_numpy(dtype=float), np.zeros(len(new))])
+    lot_sizes = np.array([(lots or {}).get(s, 1) for s in symbols], dtype=float)
+    weights = expand_targets(targets, symbols, values, classify)
+
+    if solver == "milp":
+        try:
+            shares = solve_milp(values, price, weights, cash, lot_sizes, tolerance)
+            shares = np.where(np.abs(shares * price) >= min_trade, shares, 0.0)
+        except ImportError:
+            print("SciPy is not installed, using the vectorized solver")
+            solver = None
+    if solver != "milp":
+        shares = rebalance_matrix(values, price, weights, cash, lot_sizes, tolerance, min_trade)[0]
+
+    total = values.sum() + cash
+    after = values + shares * price
+    amount = shares * price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_before = values / total if total > 0 else np.zeros_like(values)
+        weight_after = after / total if total > 0 else np.zeros_like(values)
+    traded = shares != 0
+    orders = pd.DataFrame({
+        'Symbol': np.array(symbols, dtype=object)[traded],
+        'Action': np.where(shares[traded] > 0, 'BUY', 'SELL'),
+        'Quantity': np.abs(shares[traded]),
+        'Price': price[traded],
+        'Amount': np.abs(amount[traded]),
+        'Weight': weight_before[traded],
+        'NewWeight': weight_after[traded],
+        'Target': weights[traded],
+    }, columns=ORDER_COLUMNS)
+
+    managed = ~np.isnan(weights)
+    drift_before = np.abs(weight_before - weights)[managed]
+    drift_after = np.abs(weight_after - weights)[managed]
+    cash_used = float(amount.sum())
+    known = set(symbols) | ({classify(s) for s in symbols} if classify else set())
+    return orders, {
+        'total': float(total),
+        'cash': float(cash),
+        'cash_left': float(cash - cash_used),
+        'bought': float(amount[amount > 0].sum()),
+        'sold': float(np.abs(amount[amount < 0]).sum()),
+        'max_drift_before': float(drift_before.max()) if len(drift_before) else 0.0,
+        'max_drift_after': float(drift_after.max()) if len(drift_after) else 0.0,
+        'tolerance': float(tolerance),
+        'untargeted': [s for s, m in zip(symbols, managed) if not m],
+        'missing': [t for t in targets if t not in known],
+        'solver': solver or "vectorized",
+    }
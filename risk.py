@@ -0,0 +1,204 @@
+import threading
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from portfolio_db import PortfolioDB
+from price_history import PriceHistory
+from scheduler import market_for
+from valuation import currency_for
+
+# Risk figures for the current holdings from the daily closes in `prices`:
+# annualized volatility, covariance and correlation matrices, beta against a
+# benchmark, historical and parametric VaR/CVaR, and exposure by currency,
+# market and symbol. Everything after loading the closes is NumPy matrix
+# algebra over a dates x symbols returns matrix.
+TRADING_DAYS = 252
+DEFAULT_BENCHMARK = "^MERV"
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_HORIZON = 1  # days
+TOP_POSITIONS = 5
+
+
+def simple_returns(closes):
+    # Daily returns of a dates x symbols array of closes. Closes are carried
+    # over missing days (a return of 0 on the other market's holidays); days
+    # before a symbol's first close stay NaN.
+    filled = pd.DataFrame(closes).ffill().to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return filled[1:] / filled[:-1] - 1.0
+
+
+def covariance(returns):
+    # Sample covariance that tolerates NaN (symbols with shorter histories):
+    # every pair uses the days both have, means included, like
+    # DataFrame.cov(), in three matrix products. Values are centered on each
+    # symbol's own mean first, which the result does not depend on, to keep
+    # the sums small.
+    valid = ~np.isnan(returns)
+    counts = valid.sum(axis=0)
+    means = np.where(counts > 0, np.nansum(returns, axis=0) / np.maximum(counts, 1), 0.0)
+    centered = np.where(valid, returns - means, 0.0)
+    mask = valid.astype(float)
+    pairs = mask.T @ mask
+    sums = centered.T @ mask  # [i, j]: sum of i over the days both have
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = (centered.T @ centered - sums * sums.T / pairs) / (pairs - 1)
+    cov[pairs < 2] = np.nan
+    return cov
+
+
+def correlation(cov):
+    sd = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov / np.outer(sd, sd)
+
+
+def value_at_risk(returns, confidence=DEFAULT_CONFIDENCE, horizon=DEFAULT_HORIZON):
+    # Historical and parametric (normal) VaR and CVaR of a daily return
+    # series, as positive fractions of the value lost over `horizon` days
+    returns = returns[~np.isnan(returns)]
+    if len(returns) < 2:
+        return None
+    scale = np.sqrt(horizon)
+    cutoff = np.quantile(returns, 1 - confidence)
+    tail = returns[returns <= cutoff]
+    mu, sigma = returns.mean() * horizon, returns.std(ddof=1) * scale
+    z = NormalDist().inv_cdf(confidence)
+    return {
+        'historical_var': float(-cutoff * scale),
+        'historical_cvar': float(-tail.mean() * scale),
+        'parametric_var': float(z * sigma - mu),
+        'parametric_cvar': float(sigma * NormalDist().pdf(z) / (1 - confidence) - mu),
+    }
+
+
+class ReturnsCache:
+    # Raw closes (dates x symbols) of the last symbol set asked for, kept in
+    # memory. When PriceHistory records new writes, only the dates from the
+    # oldest one on are read again; the covariance is recomputed only then.
+    def __init__(self):
+        self.key = None
+        self.closes = None
+        self.version = -1
+        self.model = None
+        self._lock = threading.Lock()
+
+    def get(self, symbols, start=None):
+        # (closes frame, {'returns', 'covariance', 'dates'}) for the symbols
+        with self._lock:
+            key = (PortfolioDB.db_file, tuple(symbols), start)
+            version = PriceHistory.version
+            if key != self.key:
+                with metrics.span("risk.load_closes"):
+                    self.closes = PriceHistory.get_matrix(symbols, start=start, fill=False)
+                self.key, self.model = key, None
+            elif version != self.version:
+                oldest = PriceHistory.oldest_change_since(self.version)
+                if oldest:
+                    since = max(oldest, str(start)) if start else oldest
+                    with metrics.span("risk.load_closes"):
+                        tail = PriceHistory.get_matrix(symbols, start=since, fill=False)
+                    kept = self.closes[self.closes.index < pd.Timestamp(since)]
+                    self.closes = pd.concat([kept, tail]).reindex(columns=list(symbols))
+                    self.model = None
+            self.version = version
+            if self.model is None:
+                with metrics.span("risk.covariance"):
+                    returns = simple_returns(self.closes.to_numpy(dtype=float))
+                    self.model = {
+                        'returns': returns,
+                        'covariance': covariance(returns),
+                        'dates': self.closes.index[1:],
+                    }
+            return self.closes, self.model
+
+
+_cache = ReturnsCache()
+
+
+@metrics.timed("risk.analyze")
+def analyze(portfolio, start=None, benchmark=DEFAULT_BENCHMARK, confidence=DEFAULT_CONFIDENCE,
+            horizon=DEFAULT_HORIZON, cache=None):
+    # `portfolio` as returned by core.value_portfolio. Weights are market
+    # values in ARS when the USD/ARS conversion is available, else the plain
+    # Value column. Symbols without stored closes are left out of the
+    # return-based figures and listed in 'missing'.
+    cache = cache or _cache
+    value_column = 'ValueARS' if 'ValueARS' in portfolio.columns else 'Value'
+    values = portfolio.groupby('Symbol')[value_column].sum()
+    values = values[values > 0]
+    total = float(values.sum())
+    if total <= 0:
+        return None
+
+    symbols = list(values.index)
+    loaded = symbols + ([benchmark] if benchmark and benchmark not in symbols else [])
+    closes, model = cache.get(loaded, start)
+    cov_all = model['covariance']
+    returns_all = model['returns']
+
+    held = np.arange(len(symbols))
+    has_history = (~np.isnan(returns_all[:, held])).sum(axis=0) >= 2
+    missing = [s for s, ok in zip(symbols, has_history) if not ok]
+    idx = held[has_history]
+    names = [symbols[i] for i in idx]
+    weights = values.to_numpy(dtype=float)[idx]
+    weights = weights / weights.sum() if weights.sum() > 0 else weights
+
+    returns = returns_all[:, idx]
+    cov = np.nan_to_num(cov_all[np.ix_(idx, idx)])
+    volatility = np.sqrt(np.diag(cov) * TRADING_DAYS)
+
+    # Portfolio: daily returns for the historical figures, w'Σw for the
+    # parametric volatility and each symbol's share of the variance
+    active = ~np.isnan(returns).all(axis=1)
+    portfolio_returns = np.where(np.isnan(returns), 0.0, returns)[active] @ weights
+    marginal = cov @ weights
+    variance = float(weights @ marginal)
+    contribution = weights * marginal / variance if variance > 0 else np.zeros_like(weights)
+
+    beta = None
+    if benchmark:
+        bench = returns_all[:, loaded.index(benchmark)][active]
+        both = ~np.isnan(bench)
+        if both.sum() >= 2 and np.var(bench[both]) > 0:
+            beta = float(np.cov(portfolio_returns[both], bench[both])[0, 1] / np.var(bench[both], ddof=1))
+
+    var = value_at_risk(portfolio_returns, confidence, horizon)
+    if var:
+        var.update({f"{k}_amount": v * total for k, v in list(var.items())})
+
+    weights_all = values / total
+    currency = weights_all.groupby(lambda s: currency_for(s)).sum()
+    market = weights_all.groupby(lambda s: market_for(s) or "-").sum()
+    top = weights_all.sort_values(ascending=False)
+
+    return {
+        'symbols': names,
+        'missing': missing,
+        'start': str(closes.index[0].date()) if len(closes.index) else None,
+        'end': str(closes.index[-1].date()) if len(closes.index) else None,
+        'days': int(active.sum()),
+        'volatility': pd.Series(volatility, index=names),
+        'covariance': pd.DataFrame(cov * TRADING_DAYS, index=names, columns=names),
+        'correlation': pd.DataFrame(correlation(cov), index=names, columns=names),
+        'risk_contribution': pd.Series(contribution, index=names),
+        'portfolio': {
+            'value': total,
+            'volatility': float(np.sqrt(variance * TRADING_DAYS)),
+            'beta': beta,
+            'benchmark': benchmark,
+            'confidence': confidence,
+            'horizon': horizon,
+            'var': var,
+        },
+        'exposure': {
+            'currency': currency.to_dict(),
+            'market': market.to_dict(),
+            'top': top.head(TOP_POSITIONS).to_dict(),
+            'herfindahl': float((weights_all ** 2).sum()),
+        },
+    }
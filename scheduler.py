@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, time as clock_time, timedelta, timezone
+
+import core
+
+# Regular session of an exchange in its local time zone. `utc_offset` (hours)
+# is only used when the tz database is missing (Windows without tzdata).
+Market = namedtuple("Market", ["name", "tz", "opens", "closes", "weekdays", "utc_offset"])
+
+MARKETS = {
+    "BYMA": Market("BYMA", "America/Argentina/Buenos_Aires", clock_time(11, 0), clock_time(17, 0), range(5), -3),
+    "NYSE": Market("NYSE", "America/New_York", clock_time(9, 30), clock_time(16, 0), range(5), -5),
+}
+
+DEFAULT_INTERVAL = 60  # seconds before a symbol's price is considered stale
+DEFAULT_BUDGET = 30  # symbols fetched per minute, across all refreshes
+DEFAULT_TICK = 15  # seconds between scheduling decisions
+LOG_SIZE = 200  # scheduling decisions kept for inspection
+
+
+def market_for(symbol):
+    # BYMA for .BA tickers, NYSE for plain US tickers. Anything else (FX
+    # pairs, crypto, other exchanges) has no known hours and is always polled.
+    if symbol.endswith(".BA"):
+        return "BYMA"
+    if "." not in symbol and "=" not in symbol and "-" not in symbol:
+        return "NYSE"
+    return None
+
+
+def market_timezone(market):
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(market.tz)
+    except Exception:
+        return timezone(timedelta(hours=market.utc_offset))
+
+
+def is_market_open(name, now=None, markets=MARKETS):
+    # `now` is an aware datetime (defaults to the current time)
+    if name is None:
+        return True
+    market = markets[name]
+    local = (now or datetime.now(timezone.utc)).astimezone(market_timezone(market))
+    return local.weekday() in market.weekdays and market.opens <= local.time() < market.closes
+
+
+class RefreshScheduler:
+    # Automatic price refresh in a background thread. Every `tick` seconds it
+    # picks the symbols that are due: their market is open (or they have no
+    # price yet) and their last price is older than `interval`. The stalest
+    # and largest positions go first, and no more than `budget` symbols are
+    # fetched in any 60 second window. Each decision and its outcome is
+    # appended to `log`; status() shows the per-symbol view.
+    def __init__(self, interval=DEFAULT_INTERVAL, budget=DEFAULT_BUDGET, tick=DEFAULT_TICK,
+                 markets=MARKETS, refresh=core.refresh_prices, on_result=None):
+        self.interval = interval
+        self.budget = budget
+        self.tick = tick
+        self.markets = markets
+        self.refresh = refresh
+        self.on_result = on_result
+        self.log = deque(maxlen=LOG_SIZE)
+        self._fetches = deque()  # monotonic time of each symbol fetched
+        self._attempts = {}  # symbol -> datetime of the last fetch attempt
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="refresh-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Scheduled refresh failed: {e}")
+
+    def remaining_budget(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._fetches and now - self._fetches[0] >= 60:
+                self._fetches.popleft()
+            return max(0, self.budget - len(self._fetches))
+
+    def status(self, portfolio=None, now=None):
+        # One row per held symbol: market, whether it is open, age of its
+        # price, priority score and whether it is due for a refresh
+        if portfolio is None:
+            portfolio = core.load_portfolio()
+        now = now or datetime.now()
+        aware_now = now.astimezone(timezone.utc)
+        total_value = float((portfolio['Quantity'] * portfolio['CurrentPrice']).sum())
+
+        rows = []
+        for symbol, group in portfolio.groupby('Symbol', sort=False):
+            market = market_for(symbol)
+            is_open = is_market_open(market, aware_now, self.markets)
+            value = float((group['Quantity'] * group['CurrentPrice']).sum())
+            has_price = bool((group['CurrentPrice'] > 0).any())
+            updated = group['PriceUpdatedAt'].dropna()
+            age = (now - datetime.fromisoformat(updated.max())).total_seconds() if len(updated) else None
+            attempted = self._attempts.get(symbol)
+            since_attempt = (now - attempted).total_seconds() if attempted else None
+
+            stale = age is None or age >= self.interval
+            retry_ok = since_attempt is None or since_attempt >= self.interval
+            due = stale and retry_ok and (is_open or not has_price)
+            # Never fetched counts as one day old; bigger positions weigh more
+            staleness = age if age is not None else 86400
+            score = staleness * (1 + (value / total_value if total_value > 0 else 0))
+            rows.append({
+                'symbol': symbol,
+                'market': market or "-",
+                'open': is_open,
+                'age': age,
+                'value': value,
+                'score': score,
+                'due': due,
+            })
+        rows.sort(key=lambda r: r['score'], reverse=True)
+        return rows
+
+    def plan(self, portfolio=None, now=None):
+        # (selected, due but over budget, held back by closed markets)
+        rows = self.status(portfolio, now)
+        due = [r['symbol'] for r in rows if r['due']]
+        closed = [r['symbol'] for r in rows if not r['open'] and not r['due']]
+        allowed = self.remaining_budget()
+        return due[:allowed], due[allowed:], closed
+
+    def run_once(self, now=None):
+        now = now or datetime.now()
+        selected, deferred, closed = self.plan(now=now)
+        entry = {
+            'time': now.isoformat(timespec='seconds'),
+            'selected': selected,
+            'deferred': deferred,
+            'closed': closed,
+            'budget': self.remaining_budget(),
+        }
+        if selected:
+            start = time.perf_counter()
+            with self._lock:
+                self._fetches.extend([time.monotonic()] * len(selected))
+            for symbol in selected:
+                self._attempts[symbol] = now
+            result = self.refresh(selected)
+            entry['elapsed'] = round(time.perf_counter() - start, 3)
+            entry['failed'] = [s for s, price in result['prices'].items() if not price]
+            entry['changed'] = sorted(result['changed'])
+            if self.on_result:
+                self.on_result(result)
+        self.log.append(entry)
+        return entry
@@ -1,164 +1,23 @@
 import customtkinter as ctk
-import pandas as pd
-import yfinance as yf
 import os
 import threading
+import time
 from tkinter import messagebox
-import requests
-import sqlite3
 from datetime import datetime
-import shutil
 
-DB_FILE = "portfolio.db"
-CSV_FILE = "cartera.csv"
+import core
+import metrics
+from fetch_engine import TkDispatcher, get_fetch_engine
+from portfolio_db import PortfolioDB
+from price_stream import PRICE_FEED_ENV, FrameCoalescer, TickBuffer, feed_from_env
+from scheduler import RefreshScheduler
+from table_view import VirtualTable, configure_if_changed
+from market_data import get_provider
+from symbol_index import get_symbol_index
 
-class PortfolioDB:
-    @staticmethod
-    def init_db():
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Transactions table (History)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT,
-                symbol TEXT,
-                company TEXT,
-                action TEXT, -- 'BUY', 'SELL'
-                quantity REAL,
-                price REAL
-            )
-        ''')
-        
-        # Portfolio table (Current State - Optimized for read)
-        # Note: We can either derive this from transactions or keep it sync.
-        # For simplicity and performance, we'll keep it sync.
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS portfolio (
-                symbol TEXT PRIMARY KEY,
-                company TEXT,
-                quantity REAL,
-                avg_price REAL,
-                current_price REAL DEFAULT 0
-            )
-        ''')
-        
-        # Check if column exists (migration for existing DBs)
-        try:
-            cursor.execute('ALTER TABLE portfolio ADD COLUMN current_price REAL DEFAULT 0')
-        except:
-            pass
-        
-        conn.commit()
-        conn.close()
-
-    @staticmethod
-    def migrate_csv_if_needed():
-        if os.path.exists(CSV_FILE) and not os.path.exists(DB_FILE):
-            print("Migrating CSV to DB...")
-            PortfolioDB.init_db()
-            try:
-                df = pd.read_csv(CSV_FILE)
-                for _, row in df.iterrows():
-                    PortfolioDB.add_transaction(
-                        row['Symbol'], 
-                        row['Company'], 
-                        'BUY', 
-                        row['Quantity'], 
-                        row['BuyPrice'], 
-                        row.get('BuyDate', datetime.now().strftime("%d/%m/%Y"))
-                    )
-                # Backup CSV
-                shutil.move(CSV_FILE, CSV_FILE + ".bak")
-                print("Migration complete. CSV backed up.")
-            except Exception as e:
-                print(f"Migration failed: {e}")
-        elif not os.path.exists(DB_FILE):
-             PortfolioDB.init_db()
-
-    @staticmethod
-    def add_transaction(symbol, company, action, quantity, price, date):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # 1. Log transaction
-        cursor.execute('''
-            INSERT INTO transactions (date, symbol, company, action, quantity, price)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (date, symbol, company, action, quantity, price))
-        
-        # 2. Update Portfolio State
-        cursor.execute('SELECT quantity, avg_price FROM portfolio WHERE symbol = ?', (symbol,))
-        row = cursor.fetchone()
-        
-        if row:
-            current_qty, current_avg = row
-            if action == 'BUY':
-                new_qty = current_qty + quantity
-                # Weighted Average
-                new_avg = ((current_qty * current_avg) + (quantity * price)) / new_qty
-                cursor.execute('UPDATE portfolio SET quantity = ?, avg_price = ? WHERE symbol = ?', 
-                               (new_qty, new_avg, symbol))
-            elif action == 'SELL':
-                new_qty = max(0, current_qty - quantity)
-                if new_qty == 0:
-                    cursor.execute('DELETE FROM portfolio WHERE symbol = ?', (symbol,))
-                else:
-                    # Selling doesn't change average cost basis usually
-                    cursor.execute('UPDATE portfolio SET quantity = ? WHERE symbol = ?', 
-                                   (new_qty, symbol))
-        else:
-            if action == 'BUY':
-                cursor.execute('INSERT INTO portfolio (symbol, company, quantity, avg_price) VALUES (?, ?, ?, ?)',
-                               (symbol, company, quantity, price))
-        
-        conn.commit()
-        conn.close()
-
-    @staticmethod
-    def get_portfolio_df():
-        conn = sqlite3.connect(DB_FILE)
-        # We read 'current_price' as CurrentPrice
-        df = pd.read_sql_query("SELECT symbol as Symbol, company as Company, quantity as Quantity, avg_price as BuyPrice, current_price as CurrentPrice FROM portfolio", conn)
-        conn.close()
-        return df
-
-    @staticmethod
-    def update_current_price(symbol, price):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE portfolio SET current_price = ? WHERE symbol = ?', (price, symbol))
-        conn.commit()
-        conn.close()
-    
-    @staticmethod
-    def get_symbol_quantity(symbol):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('SELECT quantity FROM portfolio WHERE symbol = ?', (symbol,))
-        row = cursor.fetchone()
-        conn.close()
-        return row[0] if row else 0
-
-    @staticmethod
-    def delete_symbol(symbol):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM portfolio WHERE symbol = ?', (symbol,))
-        # Also maybe delete transactions? Or keep history?
-        # For now, let's keep history but remove from active portfolio.
-        conn.commit()
-        conn.close()
-
-    @staticmethod
-    def update_symbol(symbol, quantity, price):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE portfolio SET quantity = ?, avg_price = ? WHERE symbol = ?', 
-                       (quantity, price, symbol))
-        conn.commit()
-        conn.close()
+SYMBOL_DEBOUNCE_MS = 400
+LOOKUP_RETRIES = 1  # an unknown symbol also fails, so retry only once before suggesting
+STREAM_SAVE_SECONDS = 5  # streamed prices are written to the DB this often
 
 class SellDialog(ctk.CTkToplevel):
     def __init__(self, parent, symbol, current_qty, current_price, callback):
@@ -280,9 +139,49 @@ class EditPositionDialog(ctk.CTkToplevel):
         except ValueError:
             messagebox.showerror("Error", "Cantidad y Precio deben ser numéricos")
 
+class MetricsDialog(ctk.CTkToplevel):
+    # Hidden debug panel (Ctrl+Shift+D): timing spans and counters, refreshed
+    # every second, with JSON / Prometheus export
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Métricas")
+        self.geometry("760x480")
+
+        buttons = ctk.CTkFrame(self, fg_color="transparent")
+        buttons.pack(fill="x", padx=10, pady=(10, 0))
+        self.toggle_button = ctk.CTkButton(buttons, width=120, command=self.toggle)
+        self.toggle_button.pack(side="left", padx=5)
+        ctk.CTkButton(buttons, text="Reiniciar", width=100, command=metrics.reset).pack(side="left", padx=5)
+        ctk.CTkButton(buttons, text="Exportar JSON", width=120,
+                      command=lambda: self.export("metrics.json", metrics.to_json)).pack(side="left", padx=5)
+        ctk.CTkButton(buttons, text="Exportar Prometheus", width=150,
+                      command=lambda: self.export("metrics.prom", metrics.to_prometheus)).pack(side="left", padx=5)
+
+        self.text = ctk.CTkTextbox(self, font=ctk.CTkFont(family="Courier", size=12), wrap="none")
+        self.text.pack(fill="both", expand=True, padx=10, pady=10)
+        self.refresh()
+
+    def toggle(self):
+        metrics.enable(not metrics.is_enabled())
+        self.refresh()
+
+    def export(self, path, render):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render())
+        messagebox.showinfo("Métricas", f"Exportado a {os.path.abspath(path)}", parent=self)
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        self.toggle_button.configure(text="Desactivar" if metrics.is_enabled() else "Activar")
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", metrics.format_table() if metrics.is_enabled()
+                         else "Métricas desactivadas (PORTFOLIO_METRICS=1 o \"Activar\")")
+        self.text.configure(state="disabled")
+        self.after(1000, self.refresh)
+
 # Configuration
-ctk.set_appearance_mode("Dark")  # Modes: "System" (standard), "Dark", "Light"
-ctk.set_default_color_theme("blue")  # Themes: "blue" (standard), "green", "dark-blue"
 DATA_FILE = "cartera.csv"
 
 class StockTrackerApp(ctk.CTk):
@@ -298,7 +197,7 @@ class StockTrackerApp(ctk.CTk):
         self.grid_rowconfigure(0, weight=1)
 
         # Data
-        PortfolioDB.migrate_csv_if_needed()
+        core.open_database()
         self.portfolio = self.load_portfolio()
         
         # UI Components
@@ -308,18 +207,42 @@ class StockTrackerApp(ctk.CTk):
         # State
         self.active_search_symbol = None
         self.suggestion_dialog = None
-        self.row_widgets = {} # Stores references to row labels for hover effect
 
-        # Initial Update
+        # Network work runs on the fetch engine's loop thread; its results
+        # come back through one coalesced after() callback
+        self.fetch_engine = get_fetch_engine()
+        self.dispatcher = TkDispatcher(self)
+        # Load the symbol index from SQLite now, off the Tk thread
+        self.fetch_engine.submit(self.fetch_engine.offload(get_symbol_index().ensure_loaded), key="symbol_index")
+        self.pending_prices = {}
+        self.pending_prices_lock = threading.Lock()
+
+        # Initial Update: last known prices from the DB, then fresh ones
         self.update_ui()
+        self.after(500, self.start_market_update)
+
+        # Then keep prices fresh while the markets are open
+        self.scheduler = RefreshScheduler(on_result=lambda result: self.dispatcher.post(
+            lambda: self.apply_refresh_result(result)))
+        self.scheduler.start()
+
+        # Optional streamed prices (PRICE_FEED=host:port)
+        self.price_feed = None
+        if os.environ.get(PRICE_FEED_ENV):
+            self.start_price_feed(os.environ[PRICE_FEED_ENV])
+
+        self.metrics_dialog = None
+        self.bind_all("<Control-D>", self.open_metrics_dialog)
 
     def load_portfolio(self):
-        return PortfolioDB.get_portfolio_df()
+        return core.load_portfolio()
 
     def save_portfolio(self):
         # DB handles persistence, just refresh UI
         self.portfolio = self.load_portfolio()
         self.update_ui()
+        if self.price_feed:
+            self.price_feed.subscribe(self.portfolio["Symbol"].unique().tolist())
 
     def create_sidebar(self):
         self.sidebar_frame = ctk.CTkFrame(self, width=200, corner_radius=0)
@@ -369,11 +292,42 @@ class StockTrackerApp(ctk.CTk):
         self.exchange_rate_label = ctk.CTkLabel(self.sidebar_frame, text="USD/ARS: ---", font=ctk.CTkFont(size=12, weight="bold"))
         self.exchange_rate_label.grid(row=11, column=0, padx=20, pady=(0, 20))
 
-        # Bindings for auto-lookup
+        # Bindings for auto-lookup. Typing only consults the local index
+        # (debounced); the network lookup runs on FocusOut/Return.
+        self.symbol_key_job = None
+        self.symbol_entry.bind("<KeyRelease>", self.on_symbol_key)
         self.symbol_entry.bind("<FocusOut>", self.on_symbol_focus_out)
         self.symbol_entry.bind("<Return>", self.on_symbol_focus_out)
 
+    def on_symbol_key(self, event=None):
+        if self.symbol_key_job:
+            self.after_cancel(self.symbol_key_job)
+        self.symbol_key_job = self.after(SYMBOL_DEBOUNCE_MS, self.on_symbol_typed)
+
+    def on_symbol_typed(self):
+        # The index lookup runs on the fetch engine (the first one may still
+        # be loading the index); a newer keystroke supersedes it
+        self.symbol_key_job = None
+        symbol = self.symbol_entry.get().strip().upper()
+        if not symbol:
+            return
+        self.fetch_engine.submit(self.fetch_engine.offload(get_symbol_index().get, symbol), key="symbol_typed",
+                                 on_done=lambda entry: self.dispatcher.post(
+                                     lambda: self.show_typed_symbol(symbol, entry), key="symbol_typed"))
+
+    def show_typed_symbol(self, symbol, entry):
+        if not entry or self.symbol_entry.get().strip().upper() != symbol:
+            return
+        cache = getattr(get_provider(), "cache", None)
+        last = cache.last_known(symbol) if cache else None
+        name = entry.get('longname') or entry.get('shortname') or ""
+        if last:
+            self.update_sidebar_info(name, last.price, last.time.strftime('%d/%m/%Y %H:%M') if last.time else "")
+
     def on_symbol_focus_out(self, event=None):
+        if self.symbol_key_job:
+            self.after_cancel(self.symbol_key_job)
+            self.symbol_key_job = None
         symbol = self.symbol_entry.get().strip().upper()
         # Prevent re-fetching if we are already dealing with this symbol or a dialog is open
         if symbol and symbol != self.active_search_symbol:
@@ -381,53 +335,53 @@ class StockTrackerApp(ctk.CTk):
                 return
                 
             self.active_search_symbol = symbol
-            threading.Thread(target=self.fetch_stock_info_sidebar, args=(symbol,), daemon=True).start()
-
-    def fetch_stock_info_sidebar(self, symbol):
+            # Show the last known quote right away while the fresh one loads
+            cache = getattr(get_provider(), "cache", None)
+            last = cache.last_known(symbol) if cache else None
+            if last:
+                self.update_sidebar_info(last.name or "", last.price, last.time.strftime('%d/%m/%Y %H:%M') if last.time else "")
+            self.start_symbol_lookup(symbol)
+
+    def start_symbol_lookup(self, symbol):
+        # A newer lookup (another symbol typed) cancels this one
+        self.fetch_engine.submit(self.lookup_symbol(symbol), key="sidebar",
+                                 on_done=lambda result: self.dispatcher.post(
+                                     lambda: self.show_lookup_result(symbol, result), key="sidebar"))
+
+    async def lookup_symbol(self, symbol):
+        # ('info', info) for a known symbol, else ('suggestions', [...])
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            
-            # Check if valid
-            price = info.get('currentPrice') or info.get('regularMarketPrice') or info.get('previousClose')
-            
-            if not price:
-                raise ValueError("No price found")
+            info = await self.fetch_engine.call(get_provider().get_info, symbol, retries=LOOKUP_RETRIES)
+        except Exception as e:
+            print(f"Lookup failed for {symbol}: {e!r}")
+            info = None
+        if info:
+            # Off the loop thread: add() writes to the DB
+            await self.fetch_engine.offload(get_symbol_index().add, [{'symbol': symbol, 'longname': info['name'] or None}])
+            return 'info', info
+        return 'suggestions', await self.search_symbols(symbol)
+
+    async def search_symbols(self, query):
+        # Local index first (typos on known symbols cost no network),
+        # Yahoo search (cached) only when it has nothing
+        index = get_symbol_index()
+        # Off the loop thread: the first search loads the index from the DB,
+        # and fuzzy matching is CPU work
+        suggestions = await self.fetch_engine.offload(index.search, query)
+        if not suggestions:
+            try:
+                suggestions = await self.fetch_engine.call(index.search_remote, query)
+            except Exception as e:
+                print(f"Search failed: {e!r}")
+        return suggestions
 
-            name = info.get('longName') or info.get('shortName') or ""
-            
-            # Time
-            market_time = info.get('regularMarketTime')
-            if market_time:
-                time_str = datetime.fromtimestamp(market_time).strftime('%d/%m/%Y %H:%M')
-            else:
-                time_str = datetime.now().strftime('%d/%m/%Y %H:%M')
-
-            # Update UI in main thread
-            self.after(0, lambda: self.update_sidebar_info(name, price, time_str))
+    def show_lookup_result(self, symbol, result):
+        kind, value = result
+        if kind == 'info':
+            self.update_sidebar_info(value['name'], value['price'], value['time'].strftime('%d/%m/%Y %H:%M'))
             self.active_search_symbol = None # Reset
-            
-        except Exception:
-            # If fetch fails, try to search for suggestions
-            self.search_symbols(symbol)
-
-    def search_symbols(self, query):
-        try:
-            url = f"https://query2.finance.yahoo.com/v1/finance/search?q={query}"
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers)
-            data = response.json()
-            
-            suggestions = []
-            if 'quotes' in data:
-                for q in data['quotes']:
-                    if q.get('quoteType') == 'EQUITY' or q.get('quoteType') == 'ETF':
-                         suggestions.append(q)
-            
-            if suggestions:
-                self.after(0, lambda: self.show_suggestions(suggestions))
-        except Exception as e:
-            print(f"Search failed: {e}")
+        elif value:
+            self.show_suggestions(value)
 
     def show_suggestions(self, suggestions):
         if self.suggestion_dialog and self.suggestion_dialog.winfo_exists():
@@ -439,7 +393,7 @@ class StockTrackerApp(ctk.CTk):
         self.symbol_entry.delete(0, 'end')
         self.symbol_entry.insert(0, symbol)
         # Trigger fetch again
-        threading.Thread(target=self.fetch_stock_info_sidebar, args=(symbol,), daemon=True).start()
+        self.start_symbol_lookup(symbol)
 
     def update_sidebar_info(self, name, price, time_str=""):
         # Update Company Name
@@ -475,24 +429,21 @@ class StockTrackerApp(ctk.CTk):
         self.card_profit_loss = self.create_summary_card(self.summary_frame, "G/P Total", "$0.00 (0.00%)", 2)
 
         # Aggregated Summary Area (Replaces Chart)
-        self.agg_frame = ctk.CTkScrollableFrame(self.main_frame, label_text="Resumen por Acción", height=150)
-        self.agg_frame.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
-        self.agg_frame.grid_columnconfigure((0, 1, 2, 3, 4), weight=1)
-
-        # Headers for Aggregated Table
-        agg_headers = ["Acción", "Cant. Total", "P. Prom. Compra", "Precio Actual", "Total General"]
-        for i, header in enumerate(agg_headers):
-            ctk.CTkLabel(self.agg_frame, text=header, font=ctk.CTkFont(weight="bold")).grid(row=0, column=i, padx=5, pady=5)
-
-        # Table Area (Scrollable Frame mimicking a table)
-        self.table_frame = ctk.CTkScrollableFrame(self.main_frame, label_text="Tus Posiciones")
-        self.table_frame.grid(row=2, column=0, padx=20, pady=20, sticky="nsew")
-        self.table_frame.grid_columnconfigure((0, 1, 2, 3, 4, 5, 6, 7, 8), weight=1)
-
-        # Table Headers
-        headers = ["Símbolo", "Empresa", "Cant.", "P. Compra", "P. Actual", "Valor", "G/P", "Vender", "Eliminar"]
-        for i, header in enumerate(headers):
-            ctk.CTkLabel(self.table_frame, text=header, font=ctk.CTkFont(weight="bold")).grid(row=0, column=i, padx=5, pady=5)
+        self.summary_table = VirtualTable(
+            self.main_frame, "Resumen por Acción",
+            ["Acción", "Cant. Total", "P. Prom. Compra", "Precio Actual", "Total General"],
+            key_column="Symbol", format_row=self.format_summary_row, height=150)
+        self.summary_table.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
+
+        # Table Area (only the visible rows are materialized)
+        self.positions_table = VirtualTable(
+            self.main_frame, "Tus Posiciones",
+            ["Símbolo", "Empresa", "Cant.", "P. Compra", "P. Actual", "Valor", "G/P"],
+            key_column="Symbol", format_row=self.format_position_row,
+            buttons=[("Vender", "$", "orange", "darkorange", self.open_sell_dialog),
+                     ("Eliminar", "X", "red", "darkred", self.delete_row)],
+            on_click=self.edit_position)
+        self.positions_table.grid(row=2, column=0, padx=20, pady=20, sticky="nsew")
 
     def create_summary_card(self, parent, title, value, col):
         frame = ctk.CTkFrame(parent)
@@ -527,9 +478,8 @@ class StockTrackerApp(ctk.CTk):
         if not company:
              # Basic sync fetch if missing
              try:
-                 ticker = yf.Ticker(symbol)
-                 current_info = ticker.info
-                 company = current_info.get('longName') or current_info.get('shortName') or symbol
+                 current_info = get_provider().get_info(symbol)
+                 company = (current_info and current_info['name']) or symbol
              except:
                  company = symbol
         
@@ -538,7 +488,8 @@ class StockTrackerApp(ctk.CTk):
         self.save_portfolio()
 
         # Auto-fetch current market price in background
-        threading.Thread(target=self.fetch_single_price_update, args=(symbol,), daemon=True).start()
+        self.fetch_engine.submit(core.refresh_symbol_async(symbol), key=f"price:{symbol}",
+                                 on_done=self.queue_price_changes)
         
         # Clear inputs
         self.symbol_entry.delete(0, 'end')
@@ -551,25 +502,22 @@ class StockTrackerApp(ctk.CTk):
         self.price_entry.delete(0, 'end')
         self.buy_date_entry.delete(0, 'end')
 
-    def delete_row(self, index):
+    def delete_row(self, symbol):
         if messagebox.askyesno("Eliminar", "¿Seguro que deseas eliminar esta posición?"):
-            symbol = self.portfolio.iloc[index]['Symbol']
             PortfolioDB.delete_symbol(symbol)
             self.save_portfolio()
             
-    def edit_position(self, index):
-        row = self.portfolio.iloc[index]
-        EditPositionDialog(self, row, lambda q, p, d: self.save_edited_position(index, q, p, d))
+    def edit_position(self, symbol):
+        row = self.positions_table.row_for_key(symbol)
+        EditPositionDialog(self, row, lambda q, p, d: self.save_edited_position(symbol, q, p, d))
         
-    def save_edited_position(self, index, quantity, price, date):
-        # Note: Editing ignores date for now in portfolio view (since it's avg), 
-        # but we could update if we wanted. For now just update qty/price.
-        symbol = self.portfolio.iloc[index]['Symbol']
-        PortfolioDB.update_symbol(symbol, quantity, price)
+    def save_edited_position(self, symbol, quantity, price, date):
+        # Recorded in the ledger as an adjustment on that date
+        PortfolioDB.update_symbol(symbol, quantity, price, date)
         self.save_portfolio()
 
-    def open_sell_dialog(self, index):
-        row = self.portfolio.iloc[index]
+    def open_sell_dialog(self, symbol):
+        row = self.positions_table.row_for_key(symbol)
         # Current price fallback
         price = row['CurrentPrice'] if row['CurrentPrice'] > 0 else row['BuyPrice']
         SellDialog(self, row['Symbol'], row['Quantity'], price, 
@@ -588,223 +536,151 @@ class StockTrackerApp(ctk.CTk):
         
         self.update_button.configure(state="disabled", text="Actualizando...")
         self.exchange_rate_label.configure(text="USD/ARS: Calculando...")
-        thread = threading.Thread(target=self.fetch_market_data)
-        thread.start()
-
-    def fetch_market_data(self):
-        try:
-            symbols = self.portfolio["Symbol"].unique().tolist()
-            if not symbols:
-                return
+        # Batched quotes + USD/ARS, written to the DB in one transaction.
+        # A newer refresh supersedes one still in flight.
+        symbols = self.portfolio["Symbol"].unique().tolist()
+        self.fetch_engine.submit(core.refresh_prices_async(symbols), key="refresh",
+                                 on_done=lambda result: self.dispatcher.post(
+                                     lambda: self.update_ui_after_fetch(result), key="refresh"),
+                                 on_error=lambda e: self.dispatcher.post(
+                                     lambda: self.update_ui_after_fetch(None), key="refresh"))
+
+    def queue_price_changes(self, changed):
+        # Any thread: merge into the pending changes, applied in one go
+        with self.pending_prices_lock:
+            self.pending_prices.update(changed)
+        self.dispatcher.post(self.flush_price_changes, key="prices")
+
+    def flush_price_changes(self):
+        with self.pending_prices_lock:
+            changed, self.pending_prices = self.pending_prices, {}
+        self.apply_price_changes(changed)
+
+    def apply_price_changes(self, changed):
+        # Patch the in-memory portfolio instead of reloading it from the DB
+        if not changed:
+            return
+        new_prices = self.portfolio["Symbol"].map(changed)
+        self.portfolio["CurrentPrice"] = new_prices.fillna(self.portfolio["CurrentPrice"])
+        self.update_ui()
 
-            tickers = yf.Tickers(" ".join(symbols))
-            current_prices = {}
-            
-            for symbol in symbols:
-                try:
-                    # Access the ticker securely
-                    ticker = tickers.tickers[symbol] if len(symbols) > 1 else tickers
-                    # Fast fetch
-                    hist = ticker.history(period="1d")
-                    if not hist.empty:
-                        current_prices[symbol] = hist["Close"].iloc[-1]
-                    else:
-                        current_prices[symbol] = 0
-                except Exception as e:
-                    print(f"Failed to fetch {symbol}: {e}")
-                    current_prices[symbol] = 0
-
-            # Fetch USD/ARS exchange rate
-            self.ars_rate = 0
-            self.rate_source = ""
-            
-            # Try 1: yfinance
-            try:
-                ars_ticker = yf.Ticker("ARS=X")
-                ars_hist = ars_ticker.history(period="1d")
-                if not ars_hist.empty:
-                    self.ars_rate = ars_hist["Close"].iloc[-1]
-                    self.rate_source = "Yahoo"
-            except:
-                pass
-
-            # Try 2: DolarAPI (Blue) if Yahoo failed
-            if self.ars_rate == 0:
-                try:
-                    r = requests.get("https://dolarapi.com/v1/dolares/blue", timeout=5)
-                    data = r.json()
-                    self.ars_rate = data['venta']
-                    self.rate_source = "Blue"
-                except Exception as e:
-                    print(f"Failed to fetch from DolarAPI: {e}")
-                    self.ars_rate = 0
-
-            # Update dataframe safely
-            self.portfolio["CurrentPrice"] = self.portfolio["Symbol"].map(current_prices).fillna(0)
-            
-            # Update DB with new prices
-            for symbol, price in current_prices.items():
-                PortfolioDB.update_current_price(symbol, price)
+    def start_price_feed(self, address):
+        # Ticks land in a per-symbol ring buffer from the feed thread; the
+        # coalescer applies the latest prices at most once per frame, and
+        # they are written to the DB every STREAM_SAVE_SECONDS
+        self.tick_buffer = TickBuffer()
+        self.unsaved_prices = {}
+        self.last_price_save = time.monotonic()
+        self.price_feed = feed_from_env(address)
+        self.price_feed.subscribe(self.portfolio["Symbol"].unique().tolist())
+        self.price_feed.start(self.tick_buffer.push)
+        self.frame_coalescer = FrameCoalescer(self.tick_buffer, self.apply_streamed_prices, self.after)
+        self.frame_coalescer.start()
+
+    def apply_streamed_prices(self, latest):
+        self.apply_price_changes(latest)
+        self.unsaved_prices.update(latest)
+        if time.monotonic() - self.last_price_save >= STREAM_SAVE_SECONDS:
+            prices, self.unsaved_prices = self.unsaved_prices, {}
+            self.last_price_save = time.monotonic()
+            self.fetch_engine.submit(self.fetch_engine.offload(PortfolioDB.update_current_prices, prices))
+
+    def apply_refresh_result(self, result):
+        # Every fetched price, not only the changed ones: if a superseded
+        # refresh wrote some of them, its changes never reached the screen
+        self.apply_price_changes({symbol: price for symbol, price in result['prices'].items() if price})
+        fx_rate = result['fx_rate']
+        if fx_rate:
+            self.exchange_rate_label.configure(text=f"USD/ARS ({fx_rate.source}): ${fx_rate.rate:,.2f}")
+        else:
+            self.exchange_rate_label.configure(text="USD/ARS: No disponible")
 
-            # Schedule UI update on main thread
-            self.after(0, self.update_ui_after_fetch)
-            
-        except Exception as e:
-            print(f"Error fetching data: {e}")
-        finally:
-            self.after(0, lambda: self.update_button.configure(state="normal", text="Actualizar Datos"))
-
-    def update_ui_after_fetch(self):
-        self.save_portfolio() # Save the fetched prices too if we want, or just re-render
-        if hasattr(self, 'ars_rate') and self.ars_rate > 0:
-            source_text = f" ({self.rate_source})" if self.rate_source else ""
-            self.exchange_rate_label.configure(text=f"USD/ARS{source_text}: ${self.ars_rate:,.2f}")
+    def update_ui_after_fetch(self, result):
+        if result:
+            self.apply_refresh_result(result)
         else:
             self.exchange_rate_label.configure(text="USD/ARS: No disponible")
-        self.update_ui()
+        self.update_button.configure(state="normal", text="Actualizar Datos")
 
-    def fetch_single_price_update(self, symbol):
-        try:
-            ticker = yf.Ticker(symbol)
-            # Try fast history first
-            hist = ticker.history(period="1d")
-            price = 0
-            if not hist.empty:
-                price = hist["Close"].iloc[-1]
-            else:
-                # Fallback to info
-                info = ticker.info
-                price = info.get('currentPrice') or info.get('regularMarketPrice') or info.get('previousClose') or 0
-            
-            if price > 0:
-                PortfolioDB.update_current_price(symbol, price)
-                # Refresh UI
-                self.after(0, self.update_ui)
-        except Exception as e:
-            print(f"Auto-fetch error for {symbol}: {e}")
+    def open_metrics_dialog(self, event=None):
+        if self.metrics_dialog and self.metrics_dialog.winfo_exists():
+            self.metrics_dialog.focus()
+            return
+        self.metrics_dialog = MetricsDialog(self)
 
+    @metrics.timed("ui.update_ui")
     def update_ui(self):
-        # Calculation
-        if "CurrentPrice" not in self.portfolio.columns:
-            self.portfolio["CurrentPrice"] = 0.0
-
-        self.portfolio["Value"] = self.portfolio["Quantity"] * self.portfolio["CurrentPrice"]
-        self.portfolio["Invested"] = self.portfolio["Quantity"] * self.portfolio["BuyPrice"]
-        self.portfolio["ProfitLoss"] = self.portfolio["Value"] - self.portfolio["Invested"]
-
-        total_invested = self.portfolio["Invested"].sum()
-        total_value = self.portfolio["Value"].sum()
-        total_pl = self.portfolio["ProfitLoss"].sum()
-        total_pl_pct = (total_pl / total_invested * 100) if total_invested > 0 else 0
-
-        # Update Cards
-        self.card_total_invested.configure(text=f"${total_invested:,.2f}")
-        self.card_current_value.configure(text=f"${total_value:,.2f}")
-        color = "green" if total_pl >= 0 else "red"
-        self.card_profit_loss.configure(text=f"${total_pl:,.2f} ({total_pl_pct:.2f}%)", text_color=color)
-
-        # Update Table
-        # clear existing rows and widget cache
-        self.row_widgets = {}
-        for widget in self.table_frame.winfo_children():
-            if int(widget.grid_info()["row"]) > 0: # Skip header
-                widget.destroy()
-
-        for index, row in self.portfolio.iterrows():
-            r = index + 1
-            self.row_widgets[index] = []
-            
-            # Helper to bind click event
-            def open_edit(event, i=index):
-                self.edit_position(i)
-            
-            # Helper for hover
-            def on_enter(event, i=index):
-                self.on_row_hover(i, True)
-            
-            def on_leave(event, i=index):
-                self.on_row_hover(i, False)
-            
-            # Create labels and bind click/hover
-            # List of (text, color) tuples to make loop cleaner
-            pl_color = "green" if row['ProfitLoss'] >= 0 else "red"
-            comp_name = str(row.get("Company", ""))
-            if len(comp_name) > 20: comp_name = comp_name[:20] + "..."
-            
-            lbl_configs = [
-                (str(row["Symbol"]), "white"),
-                (comp_name, "white"),
-                (f"{row['Quantity']:.2f}", "white"),
-                (f"${row['BuyPrice']:.2f}", "white"),
-                # Removed Date column as it's less relevant for aggregated view
-                (f"${row['CurrentPrice']:.2f}", "white"),
-                (f"${row['Value']:.2f}", "white"),
-                (f"${row['ProfitLoss']:.2f}", pl_color)
-            ]
-
-            for col_idx, (text_val, txt_color) in enumerate(lbl_configs):
-                lbl = ctk.CTkLabel(self.table_frame, text=text_val, text_color=txt_color, corner_radius=5)
-                lbl.grid(row=r, column=col_idx, padx=5, pady=2, sticky="ew")
-                
-                # Bindings
-                lbl.bind("<Button-1>", open_edit)
-                lbl.bind("<Enter>", on_enter)
-                lbl.bind("<Leave>", on_leave)
-                
-                self.row_widgets[index].append(lbl)
-
-            # Sell Button
-            sell_btn = ctk.CTkButton(self.table_frame, text="$", width=30, fg_color="orange", hover_color="darkorange",
-                                    command=lambda i=index: self.open_sell_dialog(i))
-            sell_btn.grid(row=r, column=7, padx=5, pady=2)
-
-            # Delete Button
-            # We use a closure or default arg to capture the current index
-            del_btn = ctk.CTkButton(self.table_frame, text="X", width=30, fg_color="red", hover_color="darkred",
-                                    command=lambda i=index: self.delete_row(i))
-            del_btn.grid(row=r, column=8, padx=5, pady=2)
-        
+        # Calculation: per-row valuation plus one aggregate frame shared by
+        # the summary table and the cards
+        with metrics.span("ui.valuation"):
+            self.portfolio, self.aggregate, totals = core.value_portfolio(self.portfolio)
+        total_invested = totals['invested']
+        total_value = totals['value']
+        total_pl = totals['profit_loss']
+        total_pl_pct = totals['profit_loss_pct']
+
+        # Update Cards: in ARS with the USD equivalent when a USD/ARS rate
+        # is known, else the plain sum of prices
+        by_currency = totals.get('by_currency')
+        if by_currency:
+            ars, usd = by_currency['ARS'], by_currency['USD']
+            configure_if_changed(self.card_total_invested,
+                                 text=f"${ars['invested']:,.2f}\nUS${usd['invested']:,.2f}")
+            configure_if_changed(self.card_current_value, text=f"${ars['value']:,.2f}\nUS${usd['value']:,.2f}")
+            color = "green" if ars['profit_loss'] >= 0 else "red"
+            configure_if_changed(self.card_profit_loss,
+                                 text=f"${ars['profit_loss']:,.2f} ({ars['profit_loss_pct']:.2f}%)\n"
+                                      f"US${usd['profit_loss']:,.2f} ({usd['profit_loss_pct']:.2f}%)",
+                                 text_color=color)
+        else:
+            configure_if_changed(self.card_total_invested, text=f"${total_invested:,.2f}")
+            configure_if_changed(self.card_current_value, text=f"${total_value:,.2f}")
+            color = "green" if total_pl >= 0 else "red"
+            configure_if_changed(self.card_profit_loss, text=f"${total_pl:,.2f} ({total_pl_pct:.2f}%)",
+                                 text_color=color)
+
+        # Update Table (diffed against what is on screen)
+        with metrics.span("ui.positions_table"):
+            self.positions_table.set_data(self.portfolio)
+
         # Update Summary Table
         self.update_summary_table()
-    
-    def on_row_hover(self, index, is_hover):
-        color = "#333333" if is_hover else "transparent"
-        if index in self.row_widgets:
-            for widget in self.row_widgets[index]:
-                try:
-                    widget.configure(fg_color=color)
-                except:
-                    pass
 
+    def format_position_row(self, row):
+        pl_color = "green" if row.ProfitLoss >= 0 else "red"
+        comp_name = str(row.Company)
+        if len(comp_name) > 20: comp_name = comp_name[:20] + "..."
+        return [
+            (str(row.Symbol), "white"),
+            (comp_name, "white"),
+            (f"{row.Quantity:.2f}", "white"),
+            (f"${row.BuyPrice:.2f}", "white"),
+            # Removed Date column as it's less relevant for aggregated view
+            (f"${row.CurrentPrice:.2f}", "white"),
+            (f"${row.Value:.2f}", "white"),
+            (f"${row.ProfitLoss:.2f}", pl_color),
+        ]
+
+    def format_summary_row(self, row):
+        return [
+            (str(row.Symbol), "white"),
+            (f"{row.TotalQuantity:.2f}", "white"),
+            (f"${row.WeightedAvgPrice:.2f}", "white"),
+            (f"${row.CurrentPrice:.2f}", "white"),
+            (f"${row.TotalValue:.2f}", "white"),
+        ]
+
+    @metrics.timed("ui.update_summary_table")
     def update_summary_table(self):
-        # Clear existing rows
-        for widget in self.agg_frame.winfo_children():
-            if int(widget.grid_info()["row"]) > 0: # Skip header
-                widget.destroy()
-
         if self.portfolio.empty:
+            self.summary_table.set_data(None)
             return
 
-        # Aggregation Logic
-        # Group by Symbol
-        grouped = self.portfolio.groupby('Symbol').apply(
-            lambda x: pd.Series({
-                'TotalQuantity': x['Quantity'].sum(),
-                'WeightedAvgPrice': (x['Quantity'] * x['BuyPrice']).sum() / x['Quantity'].sum() if x['Quantity'].sum() > 0 else 0,
-                'CurrentPrice': x['CurrentPrice'].iloc[0] if not x['CurrentPrice'].empty else 0,
-                'TotalValue': x['Value'].sum()
-            })
-        ).reset_index()
-
-        # Render rows
-        for index, row in grouped.iterrows():
-            r = index + 1
-            ctk.CTkLabel(self.agg_frame, text=row['Symbol']).grid(row=r, column=0, padx=5, pady=2)
-            ctk.CTkLabel(self.agg_frame, text=f"{row['TotalQuantity']:.2f}").grid(row=r, column=1, padx=5, pady=2)
-            ctk.CTkLabel(self.agg_frame, text=f"${row['WeightedAvgPrice']:.2f}").grid(row=r, column=2, padx=5, pady=2)
-            ctk.CTkLabel(self.agg_frame, text=f"${row['CurrentPrice']:.2f}").grid(row=r, column=3, padx=5, pady=2)
-            ctk.CTkLabel(self.agg_frame, text=f"${row['TotalValue']:.2f}").grid(row=r, column=4, padx=5, pady=2)
+        # Aggregation computed in update_ui
+        self.summary_table.set_data(self.aggregate)
 
 if __name__ == "__main__":
+    ctk.set_appearance_mode("Dark")  # Modes: "System" (standard), "Dark", "Light"
+    ctk.set_default_color_theme("blue")  # Themes: "blue" (standard), "green", "dark-blue"
     app = StockTrackerApp()
     app.mainloop()
@@ -0,0 +1,213 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+import metrics
+from portfolio_db import PortfolioDB
+
+SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+SEARCH_TTL = 3600  # seconds a remote search result is reused
+SEARCH_TIMEOUT = 5
+SEARCH_TYPES = ("EQUITY", "ETF")
+
+SQL_UPSERT_SYMBOL = '''
+    INSERT INTO symbols (symbol, shortname, longname, exchange, quote_type)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(symbol) DO UPDATE SET
+        shortname = COALESCE(excluded.shortname, shortname),
+        longname = COALESCE(excluded.longname, longname),
+        exchange = COALESCE(excluded.exchange, exchange),
+        quote_type = COALESCE(excluded.quote_type, quote_type)
+'''
+
+
+MAX_TYPOS = 2  # for tickers of 5+ characters; shorter ones allow 1
+
+
+def _deletes(word, depth=MAX_TYPOS):
+    # Every string reachable from `word` by removing up to `depth` characters.
+    # Variants under two characters would match most of the index, so they
+    # are left out (one-letter tickers still match themselves).
+    found = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        frontier = {w for w in frontier if len(w) >= 2}
+        found |= frontier
+    return found
+
+
+def typo_distance(a, b):
+    # Damerau-Levenshtein (optimal string alignment) distance
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SymbolIndex:
+    # Local symbol lookup backed by the `symbols` table. Everything is held
+    # in memory after the first load: a sorted symbol list for prefix
+    # queries (bisect) and a delete-neighbourhood index (SymSpell style) on
+    # the ticker without its market suffix for typo-tolerant matching, so
+    # lookups never touch the network or the disk. The first lookup loads
+    # the table (once, even with concurrent callers); the desktop app does
+    # that on the fetch engine at startup.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._entries = {}  # symbol -> suggestion dict (Yahoo search shape)
+        self._sorted = []  # sorted symbols
+        self._words = []  # sorted (name word, symbol)
+        self._deletes = defaultdict(set)  # ticker with up to MAX_TYPOS chars removed -> symbols
+        self._search_cache = {}  # query -> (results, fetched_at)
+        self._loaded = False
+
+    def load(self):
+        with PortfolioDB._lock:
+            conn = PortfolioDB.connection()
+            rows = conn.execute('SELECT symbol, shortname, longname, exchange, quote_type FROM symbols').fetchall()
+            held = conn.execute('SELECT symbol, company FROM portfolio').fetchall()
+            quoted = conn.execute('SELECT symbol, name FROM quote_cache WHERE name IS NOT NULL').fetchall()
+        with self._lock:
+            for row in rows:
+                self._add(dict(zip(('symbol', 'shortname', 'longname', 'exchange', 'quoteType'), row)))
+        # Seed with holdings and names learned by the quote cache
+        self.add([{'symbol': s, 'longname': name} for s, name in held + quoted])
+        self._loaded = True
+
+    def add(self, items):
+        # Add or update entries (search results, successful lookups)
+        items = [item for item in items if item.get('symbol')]
+        if not items:
+            return
+        with self._lock:
+            for item in items:
+                self._add(item)
+        with PortfolioDB.transaction() as conn:
+            conn.executemany(SQL_UPSERT_SYMBOL, [
+                (i['symbol'], i.get('shortname'), i.get('longname'), i.get('exchange'), i.get('quoteType'))
+                for i in items
+            ])
+
+    def _add(self, item):
+        symbol = item['symbol'].upper()
+        entry = self._entries.get(symbol)
+        if entry is None:
+            entry = self._entries[symbol] = {'symbol': symbol}
+            bisect.insort(self._sorted, symbol)
+            for variant in _deletes(symbol.split('.')[0]):
+                self._deletes[variant].add(symbol)
+        for key in ('shortname', 'longname', 'exchange', 'quoteType'):
+            if item.get(key) and entry.get(key) != item[key]:
+                if key in ('shortname', 'longname'):
+                    # The words of the name it replaces no longer match
+                    for word in (entry.get(key) or "").lower().split():
+                        i = bisect.bisect_left(self._words, (word, symbol))
+                        if i < len(self._words) and self._words[i] == (word, symbol):
+                            del self._words[i]
+                    for word in item[key].lower().split():
+                        bisect.insort(self._words, (word, symbol))
+                entry[key] = item[key]
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self.load()
+
+    def get(self, symbol):
+        self.ensure_loaded()
+        with self._lock:
+            return self._entries.get(symbol.upper())
+
+    def prefix(self, query, limit=10):
+        # Symbols starting with the query, then names with a word starting with it
+        self.ensure_loaded()
+        query_upper, query_lower = query.upper(), query.lower()
+        with self._lock:
+            found = []
+            i = bisect.bisect_left(self._sorted, query_upper)
+            while i < len(self._sorted) and self._sorted[i].startswith(query_upper) and len(found) < limit:
+                found.append(self._sorted[i])
+                i += 1
+            i = bisect.bisect_left(self._words, (query_lower, ""))
+            while i < len(self._words) and self._words[i][0].startswith(query_lower) and len(found) < limit:
+                if self._words[i][1] not in found:
+                    found.append(self._words[i][1])
+                i += 1
+            return [self._entries[s] for s in found]
+
+    def fuzzy(self, query, limit=10):
+        # Symbols a few edits away (insert, delete, replace, swap), e.g.
+        # "VIST.BAA" or "VSIT.BA" -> VIST.BA. Candidates share a delete
+        # variant of the ticker; only those get a real distance.
+        self.ensure_loaded()
+        query = query.upper()
+        base = query.split('.')[0]
+        max_typos = MAX_TYPOS if len(base) >= 5 else 1
+        with self._lock:
+            candidates = set()
+            for variant in _deletes(base, max_typos):
+                candidates |= self._deletes.get(variant, set())
+            scored = []
+            for symbol in candidates:
+                if abs(len(symbol) - len(query)) > max_typos:
+                    continue
+                distance = typo_distance(query, symbol)
+                if distance <= max_typos:
+                    scored.append((distance, symbol))
+            scored.sort()
+            return [self._entries[s] for _, s in scored[:limit]]
+
+    def search(self, query, limit=10):
+        # Local suggestions: exact and prefix matches first, then fuzzy ones
+        results = self.prefix(query, limit)
+        if len(results) >= limit:
+            return results
+        seen = {r['symbol'] for r in results}
+        for item in self.fuzzy(query, limit):
+            if len(results) >= limit:
+                break
+            if item['symbol'] not in seen:
+                results.append(item)
+        return results
+
+    def search_remote(self, query):
+        # Yahoo symbol search, cached per query for SEARCH_TTL seconds.
+        # Results are added to the local index for next time.
+        key = query.strip().upper()
+        with self._lock:
+            cached = self._search_cache.get(key)
+            if cached and time.monotonic() - cached[1] < SEARCH_TTL:
+                return cached[0]
+
+        import requests
+        with metrics.span("provider.search"):
+            response = requests.get(SEARCH_URL, params={'q': query}, headers={'User-Agent': 'Mozilla/5.0'},
+                                    timeout=SEARCH_TIMEOUT)
+        data = response.json()
+        results = [q for q in data.get('quotes', []) if q.get('quoteType') in SEARCH_TYPES]
+
+        with self._lock:
+            self._search_cache[key] = (results, time.monotonic())
+        self.add(results)
+        return results
+
+
+_index = None
+
+
+def get_symbol_index():
+    global _index
+    if _index is None:
+        _index = SymbolIndex()
+    return _index
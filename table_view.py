@@ -0,0 +1,171 @@
+import sys
+
+import customtkinter as ctk
+
+ROW_HEIGHT = 32
+
+
+def configure_if_changed(widget, **kwargs):
+    # Tk redraws a widget on every configure() call, even when nothing
+    # changed, so remember what was last applied and skip no-op updates.
+    last = widget.__dict__.setdefault("_applied_config", {})
+    changed = {key: value for key, value in kwargs.items() if last.get(key) != value}
+    if changed:
+        widget.configure(**changed)
+        last.update(changed)
+
+
+class VirtualTable(ctk.CTkFrame):
+    # Table that only materializes the rows that fit on screen.
+    #
+    # A fixed pool of row "slots" is created once and re-pointed at whatever
+    # slice of the data is visible. Rows are identified by a key column
+    # (the symbol), cells are only reconfigured when their text or color
+    # changed, and the row callbacks look the key up at event time, so a
+    # refresh never destroys or rebinds widgets.
+    def __init__(self, parent, title, headers, key_column, format_row,
+                 buttons=(), on_click=None, height=200, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.headers = headers
+        self.key_column = key_column
+        self.format_row = format_row
+        self.buttons = buttons  # (header, text, fg_color, hover_color, command(key))
+        self.on_click = on_click
+        self.data = None
+        self.keys = []
+        self.offset = 0
+        self.slots = []
+
+        total_cols = len(headers) + len(buttons)
+        # Headers live in this frame and cells in self.body; equal-width
+        # columns on both keep them aligned.
+        self.grid_columnconfigure(tuple(range(total_cols)), weight=1, uniform="col")
+        self.grid_rowconfigure(2, weight=1)
+
+        ctk.CTkLabel(self, text=title, corner_radius=6, fg_color=("gray78", "gray23")).grid(
+            row=0, column=0, columnspan=total_cols + 1, padx=5, pady=(5, 0), sticky="ew")
+        for i, header in enumerate(list(headers) + [b[0] for b in buttons]):
+            ctk.CTkLabel(self, text=header, font=ctk.CTkFont(weight="bold")).grid(row=1, column=i, padx=5, pady=5)
+
+        self.body = ctk.CTkFrame(self, fg_color="transparent", height=height)
+        self.body.grid(row=2, column=0, columnspan=total_cols, sticky="nsew")
+        self.body.grid_propagate(False)
+        self.body.grid_columnconfigure(tuple(range(total_cols)), weight=1, uniform="col")
+        self.body.bind("<Configure>", self._on_resize)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=2, column=total_cols, sticky="ns")
+
+        if "linux" in sys.platform:
+            self.bind_all("<Button-4>", self._on_mouse_wheel, add=True)
+            self.bind_all("<Button-5>", self._on_mouse_wheel, add=True)
+        else:
+            self.bind_all("<MouseWheel>", self._on_mouse_wheel, add=True)
+
+    # Data
+
+    def set_data(self, df):
+        # Diff against what is on screen: only the visible slice is formatted
+        # and only cells whose value changed are touched.
+        self.data = df
+        self.keys = df[self.key_column].tolist() if df is not None else []
+        self.offset = max(0, min(self.offset, len(self.keys) - len(self.slots)))
+        self._render()
+
+    def row_for_key(self, key):
+        if self.data is None:
+            return None
+        matches = self.data[self.data[self.key_column] == key]
+        return None if matches.empty else matches.iloc[0]
+
+    # Rendering
+
+    def _render(self):
+        visible = self.data.iloc[self.offset:self.offset + len(self.slots)] if self.keys else None
+        rows = list(visible.itertuples(index=False)) if visible is not None else []
+
+        for slot, row in zip(self.slots, rows):
+            slot["key"] = getattr(row, self.key_column)
+            for lbl, (text, color) in zip(slot["labels"], self.format_row(row)):
+                configure_if_changed(lbl, text=text, text_color=color)
+            if not slot["shown"]:
+                for widget in slot["widgets"]:
+                    widget.grid()
+                slot["shown"] = True
+
+        for slot in self.slots[len(rows):]:
+            slot["key"] = None
+            if slot["shown"]:
+                for widget in slot["widgets"]:
+                    widget.grid_remove()
+                slot["shown"] = False
+
+        total = len(self.keys)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(self.slots)) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _make_slot(self, index):
+        slot = {"key": None, "labels": [], "widgets": [], "shown": True}
+
+        def hover(is_hover):
+            color = "#333333" if is_hover else "transparent"
+            for lbl in slot["labels"]:
+                configure_if_changed(lbl, fg_color=color)
+
+        for col in range(len(self.headers)):
+            lbl = ctk.CTkLabel(self.body, text="", corner_radius=5)
+            lbl.grid(row=index, column=col, padx=5, pady=2, sticky="ew")
+            if self.on_click:
+                lbl.bind("<Button-1>", lambda e: slot["key"] is not None and self.on_click(slot["key"]))
+            lbl.bind("<Enter>", lambda e: hover(True))
+            lbl.bind("<Leave>", lambda e: hover(False))
+            slot["labels"].append(lbl)
+            slot["widgets"].append(lbl)
+
+        for offset, (_, text, fg_color, hover_color, command) in enumerate(self.buttons):
+            btn = ctk.CTkButton(self.body, text=text, width=30, fg_color=fg_color, hover_color=hover_color,
+                                command=lambda c=command: slot["key"] is not None and c(slot["key"]))
+            btn.grid(row=index, column=len(self.headers) + offset, padx=5, pady=2)
+            slot["widgets"].append(btn)
+        return slot
+
+    def _on_resize(self, event):
+        # Keep exactly as many slots as rows fit in the body
+        needed = max(1, event.height // ROW_HEIGHT)
+        while len(self.slots) < needed:
+            self.body.grid_rowconfigure(len(self.slots), minsize=ROW_HEIGHT)
+            self.slots.append(self._make_slot(len(self.slots)))
+        while len(self.slots) > needed:
+            for widget in self.slots.pop()["widgets"]:
+                widget.destroy()
+        if self.data is not None:
+            self.set_data(self.data)
+
+    # Scrolling
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(int(offset), len(self.keys) - len(self.slots)))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self._scroll_to(round(float(value) * len(self.keys)))
+        elif action == "scroll":
+            step = len(self.slots) if unit == "pages" else 1
+            self._scroll_to(self.offset + int(value) * step)
+
+    def _on_mouse_wheel(self, event):
+        path = str(event.widget)
+        if path != str(self) and not path.startswith(str(self) + "."):
+            return
+        if sys.platform.startswith("win"):
+            delta = -int(event.delta / 120)
+        elif sys.platform == "darwin":
+            delta = -event.delta
+        else:
+            delta = -1 if event.num == 4 else 1
+        self._scroll_to(self.offset + delta)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from portfolio_db import PortfolioDB  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    # PortfolioDB on a fresh file in a temp directory
+    previous = PortfolioDB.db_file
+    PortfolioDB.use_database(str(tmp_path / "portfolio.db"))
+    PortfolioDB.init_db()
+    yield PortfolioDB
+    PortfolioDB.use_database(previous)
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+
+COST = 0.01
+
+
+def bars(opens, closes):
+    # field x date x symbol array from dates x symbols opens and closes
+    opens, closes = np.asarray(opens, dtype=float), np.asarray(closes, dtype=float)
+    return np.ascontiguousarray(np.stack([opens, np.maximum(opens, closes), np.minimum(opens, closes), closes]))
+
+
+@pytest.fixture
+def fixed(monkeypatch):
+    # A "strategy" that returns the position it is given
+    monkeypatch.setitem(backtest.STRATEGIES, 'fixed', lambda prices, position: np.asarray(position, dtype=float))
+
+
+PRICES = bars([[10, 20], [11, 21], [12, 22], [13, 23]],
+              [[10.5, 20.5], [11.5, 21.5], [12.5, 22.5], [13.5, 23.5]])
+# Long decided at the close of days 0-1 (first symbol) and day 1 (second
+# one): held on days 1-2 and on day 2
+POSITION = [[1, 0], [1, 1], [0, 0], [0, 0]]
+
+
+def test_signals_fill_at_the_next_open_and_pay_the_cost_per_fill():
+    growth, held = backtest.simulate(PRICES[..., :1], np.array(POSITION)[:, :1], COST)
+
+    assert held[:, 0].tolist() == [0, 1, 1, 0]
+    expected = [
+        1.0,
+        11.5 / 11 * (1 - COST),  # bought at the open of day 1
+        12 / 11.5 * 12.5 / 12,  # held through the night and the day
+        13 / 12.5 * (1 - COST),  # the night, then sold at the open of day 3
+    ]
+    np.testing.assert_allclose(growth[:, 0], expected)
+    # From the entry open to the exit open, less two fills
+    assert np.prod(growth) == pytest.approx(13 / 11 * (1 - COST) ** 2)
+
+
+def test_run_splits_the_capital_and_counts_fills(fixed):
+    result = backtest.run(PRICES, 'fixed', {'position': POSITION}, capital=2000, cost=COST)
+
+    final = result['symbol_equity'][-1]
+    assert final[0] == pytest.approx(1000 * 13 / 11 * (1 - COST) ** 2)
+    assert final[1] == pytest.approx(1000 * 23 / 22 * (1 - COST) ** 2)
+    assert result['equity'][-1] == pytest.approx(final.sum())
+    assert result['stats']['fills'] == 4
+
+
+def test_fills_replay_to_a_flat_position(fixed, db):
+    dates = pd.bdate_range('2025-03-03', periods=4)
+    result = backtest.run(PRICES, 'fixed', {'position': POSITION}, capital=2000, cost=COST)
+
+    records = backtest.fills(PRICES, dates, ['GGAL.BA', 'YPFD.BA'], result, COST)
+
+    assert records[['Date', 'Symbol', 'Action', 'Price']].values.tolist() == [
+        ['04/03/2025', 'GGAL.BA', 'BUY', 11.0],
+        ['05/03/2025', 'YPFD.BA', 'BUY', 22.0],
+        ['06/03/2025', 'GGAL.BA', 'SELL', 13.0],
+        ['06/03/2025', 'YPFD.BA', 'SELL', 23.0],
+    ]
+    # Whole equity of the previous close, after the cost
+    assert records['Quantity'].iloc[0] == pytest.approx(1000 * (1 - COST) / 11, abs=1e-6)
+    # Selling what was bought gives the simulated equity before the exit cost
+    sell = records.iloc[2]
+    assert sell['Quantity'] * sell['Price'] * (1 - COST) == pytest.approx(result['symbol_equity'][3, 0], rel=1e-6)
+
+    db.add_transactions(records)
+    assert db.get_portfolio_df().empty
+    assert db.get_ledger()['action'].tolist() == ['BUY', 'BUY', 'SELL', 'SELL']
+
+
+def random_walk(days=300, symbols=6, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (days, symbols)), axis=0))
+    opens = np.vstack([close[:1], close[:-1]]) * np.exp(rng.normal(0, 0.005, (days, symbols)))
+    return bars(opens, close)
+
+
+def test_sweep_on_the_process_pool_matches_in_process():
+    prices = random_walk()
+    grid = {'fast': [5, 10], 'slow': [20, 40]}
+
+    results, curves = backtest.sweep(prices, 'sma_cross', grid, workers=1)
+    pooled, pooled_curves = backtest.sweep(prices, 'sma_cross', grid, workers=2)
+
+    assert len(results) == 4
+    pd.testing.assert_frame_equal(results, pooled)
+    for i, curve in curves.items():
+        np.testing.assert_array_equal(curve, pooled_curves[i])
+    # The memoized indicators give the same result as a plain run
+    best = results.iloc[0]
+    single = backtest.run(prices, 'sma_cross', {'fast': int(best['fast']), 'slow': int(best['slow'])})
+    assert single['stats']['sharpe'] == best['sharpe']
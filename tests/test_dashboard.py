@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+import pytest
+
+import market_data
+from quote_cache import CachedPriceProvider, QuoteCache
+
+st = pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "accion.py")
+
+
+@pytest.fixture
+def app(db, tmp_path, monkeypatch):
+    # accion.py on the test database, with quotes from a JSON file
+    monkeypatch.chdir(tmp_path)
+    prices = tmp_path / "prices.json"
+    prices.write_text(json.dumps({"VIST.BA": {"price": 29640, "name": "Vista Energy", "time": "2025-12-04T17:00:00"}}))
+    monkeypatch.setattr(market_data, "_provider",
+                        CachedPriceProvider(market_data.StaticPriceProvider(str(prices)), QuoteCache()))
+    st.cache_resource.clear()
+    yield AppTest.from_file(APP, default_timeout=30).run()
+    st.cache_resource.clear()
+
+
+def labeled(elements, label):
+    return next(e for e in elements if e.label == label)
+
+
+def buy(at, symbol, quantity, price):
+    labeled(at.sidebar.text_input, "Nombre de la empresa").input("Vista")
+    labeled(at.sidebar.text_input, "Símbolo de la acción (ej. AAPL)").input(symbol)
+    labeled(at.sidebar.number_input, "Cantidad de acciones").set_value(quantity)
+    labeled(at.sidebar.number_input, "Precio de compra").set_value(price)
+    return labeled(at.sidebar.button, "Agregar").click().run()
+
+
+def table(at):
+    return at.dataframe[0].value.set_index("Símbolo")
+
+
+def test_dashboard_records_to_the_ledger(app, db):
+    at = app
+    assert not at.exception
+    assert at.info[0].value == "Agrega acciones desde el panel izquierdo."
+
+    buy(at, "vist.ba", 10.0, 25000.0)
+    assert not at.exception
+    assert "Acción VIST.BA agregada" in at.success[0].value
+    assert table(at).loc["VIST.BA", "Cantidad"] == 10
+
+    at.sidebar.radio[0].set_value("Editar").run()
+    labeled(at.sidebar.number_input, "Nueva cantidad").set_value(12.0)
+    labeled(at.sidebar.button, "Guardar cambios").click().run()
+    assert table(at).loc["VIST.BA", "Cantidad"] == 12
+
+    at.sidebar.radio[0].set_value("Vender").run()
+    labeled(at.sidebar.number_input, "Cantidad a vender").set_value(2.0)
+    labeled(at.sidebar.number_input, "Precio de venta").set_value(30000.0)
+    labeled(at.sidebar.button, "Vender").click().run()
+    assert table(at).loc["VIST.BA", "Cantidad"] == 10
+
+    at.sidebar.radio[0].set_value("Eliminar").run()
+    labeled(at.sidebar.button, "Eliminar esta acción").click().run()
+    assert not at.exception
+    assert at.info[0].value == "Agrega acciones desde el panel izquierdo."
+    assert db.get_ledger()['action'].tolist() == ['BUY', 'ADJUST', 'SELL', 'CLOSE']
+
+
+def test_background_quotes_reach_the_positions(app, db):
+    # No transaction after the buy: the new quote alone updates the prices
+    at = buy(app, "VIST.BA", 10.0, 25000.0)
+    deadline = time.monotonic() + 10
+    while at.session_state["cartera_db"]["cartera"].loc["VIST.BA", "CurrentPrice"] != 29640:
+        assert time.monotonic() < deadline, "quote never reached the session's positions"
+        time.sleep(0.1)
+        at.run()
+
+    at.sidebar.radio[0].set_value("Vender").run()
+    assert labeled(at.sidebar.number_input, "Precio de venta").value == 29640
+    assert table(at).loc["VIST.BA", "Precio Actual"] == 29640
+    assert db.ledger_version() == 1
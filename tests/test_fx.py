@@ -0,0 +1,98 @@
+import time
+
+import fx
+import market_data
+from fx import FxService
+from market_data import PriceProvider, Quote
+from quote_cache import CachedPriceProvider, QuoteCache
+
+
+def source(rate, delay=0.0, calls=None):
+    # Stub source answering `rate` after `delay` seconds
+    def fetch(timeout):
+        if calls is not None:
+            calls.append(timeout)
+        time.sleep(delay)
+        return rate
+    return fetch
+
+
+def service(sources, **kwargs):
+    kwargs.setdefault('priority', ['Yahoo', 'Blue', 'MEP'])
+    return FxService(sources=sources, **kwargs)
+
+
+def test_waits_for_the_best_ranked_source():
+    fx_service = service({'Yahoo': source(1000.0, delay=0.2), 'Blue': source(1200.0)}, deadline=2)
+
+    rate = fx_service.get_rate()
+
+    assert (rate.source, rate.rate) == ('Yahoo', 1000.0)
+    # Both answers are cached
+    assert sorted(fx_service.rates()) == ['Blue', 'Yahoo']
+
+
+def test_failed_sources_fall_through_the_priority():
+    def broken(timeout):
+        raise OSError("offline")
+
+    fx_service = service({'Yahoo': broken, 'Blue': source(0), 'MEP': source(1150.0, delay=0.05)}, deadline=2)
+
+    rate = fx_service.get_rate()
+
+    assert (rate.source, rate.rate) == ('MEP', 1150.0)
+
+
+def test_deadline_answers_with_what_arrived():
+    fx_service = service({'Yahoo': source(1000.0, delay=1.0), 'Blue': source(1200.0)}, deadline=0.2)
+
+    start = time.monotonic()
+    rate = fx_service.get_rate()
+
+    assert time.monotonic() - start < 0.8
+    assert rate.source == 'Blue'
+
+
+def test_deadline_without_answers_returns_the_last_known_rate():
+    calls = []
+    fx_service = service({'Yahoo': source(1000.0, calls=calls)}, deadline=0.2, ttl=0)
+    fx_service.get_rate()
+    fx_service.sources['Yahoo'] = source(1100.0, delay=1.0)
+
+    rate = fx_service.get_rate()
+
+    assert (rate.source, rate.rate) == ('Yahoo', 1000.0)
+    assert calls == [0.2]  # each source gets the deadline as its timeout
+
+
+def test_rates_are_reused_within_the_ttl():
+    calls = []
+    fx_service = service({'Yahoo': source(1000.0, calls=calls), 'Blue': source(1200.0, calls=calls)}, ttl=60)
+
+    first = fx_service.get_rate()
+    second = fx_service.get_rate()
+    assert second == first
+    assert len(calls) == 2
+
+    fx_service.get_rate(force=True)
+    assert len(calls) == 4
+    fx_service.ttl = 0
+    time.sleep(0.01)
+    fx_service.get_rate()
+    assert len(calls) == 6
+
+
+def test_yahoo_source_passes_the_timeout(monkeypatch):
+    seen = []
+
+    class Provider(PriceProvider):
+        def get_quotes(self, symbols, timeout=None):
+            seen.append(timeout)
+            return {s: Quote(s, 1050.0, None, None) for s in symbols}
+
+    # Through the quote cache, as get_provider() sets it up
+    monkeypatch.setattr(market_data, '_provider', CachedPriceProvider(Provider(), QuoteCache()))
+
+    assert fx.fetch_yahoo(3.0) == 1050.0
+    assert seen == [3.0]
+
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import lots
+
+
+def ledger(*rows):
+    # rows: (id, trade_date, symbol, action, quantity, price[, lot_id])
+    frame = pd.DataFrame([row + (None,) * (7 - len(row)) for row in rows],
+                         columns=['id', 'trade_date', 'symbol', 'action', 'quantity', 'price', 'lot_id'])
+    frame['company'] = frame['symbol']
+    frame['lot_id'] = frame['lot_id'].astype(float)
+    return frame
+
+
+@pytest.mark.parametrize('method', lots.METHODS)
+def test_specific_lot_discarded_by_adjust(method):
+    # Lot 1 is gone after the ADJUST: the sale takes the adjusted lot
+    open_lots, realized = lots.match_lots(ledger(
+        (1, '2025-01-02', 'VIST.BA', 'BUY', 5, 100.0),
+        (2, '2025-01-03', 'VIST.BA', 'ADJUST', 5, 120.0),
+        (3, '2025-01-04', 'VIST.BA', 'SELL', 5, 150.0, 1),
+    ), method)
+    assert open_lots.empty
+    assert realized['LotId'].tolist() == [2]
+    assert realized['Gain'].tolist() == [5 * (150 - 120)]
+
+
+def test_specific_lot_sold_first():
+    open_lots, realized = lots.match_lots(ledger(
+        (1, '2025-11-28', 'VIST.BA', 'BUY', 4, 24750.0),
+        (2, '2025-12-04', 'VIST.BA', 'BUY', 8, 26480.0),
+        (3, '2026-01-10', 'VIST.BA', 'SELL', 10, 29000.0, 2),
+    ))
+    assert realized['LotId'].tolist() == [2, 1]
+    assert realized['Quantity'].tolist() == [8, 2]
+    assert open_lots[['LotId', 'Quantity']].values.tolist() == [[1, 2]]
+
+
+@pytest.mark.parametrize('method', lots.METHODS)
+def test_backdated_buy_matched_by_trade_date(method):
+    # The 2024 buy was imported after the 2025 trades (higher id)
+    open_lots, realized = lots.match_lots(ledger(
+        (1, '2025-03-01', 'META.BA', 'BUY', 5, 200.0),
+        (2, '2025-06-01', 'META.BA', 'SELL', 5, 300.0),
+        (3, '2024-01-15', 'META.BA', 'BUY', 5, 100.0),
+    ), method)
+    expected = {'fifo': 3, 'lifo': 1, 'hifo': 1}[method]
+    assert realized['LotId'].tolist() == [expected]
+    held = (pd.Timestamp('2025-06-01') - pd.Timestamp(realized['LotDate'].iloc[0])).days
+    assert realized['HoldingDays'].tolist() == [held]
+    assert open_lots['LotId'].tolist() == [4 - expected]
+
+
+def test_vectorized_fifo_matches_replay():
+    rng = np.random.default_rng(5)
+    n = 2000
+    symbols = rng.choice(['A', 'B', 'C'], n)
+    frame = pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'trade_date': (pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 500, n), unit='D')).strftime('%Y-%m-%d'),
+        'symbol': symbols, 'company': symbols,
+        'action': rng.choice(['BUY', 'SELL', 'ADJUST', 'CLOSE'], n, p=[0.6, 0.36, 0.02, 0.02]),
+        'quantity': rng.integers(1, 20, n) + rng.integers(0, 100, n) / 100,
+        'price': rng.uniform(10, 100, n).round(2),
+        'lot_id': np.nan,
+    })
+    open_lots, realized = lots.match_lots(frame, 'fifo')
+    ordered = frame.sort_values(['trade_date', 'id'], kind='stable')
+    replay_lots, replay_realized = lots._replay(ordered, 'fifo')
+    pd.testing.assert_frame_equal(realized.iloc[:, :8], replay_realized, check_dtype=False)
+    replay_lots = replay_lots.sort_values(['Date', 'LotId'], kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(open_lots.iloc[:, :6], replay_lots, check_dtype=False)
+
+
+def test_specific_lots_survive_an_export_import_round_trip(db, tmp_path):
+    import core
+
+    db.add_transaction('VIST.BA', 'Vista', 'BUY', 4, 24750.0, '28/11/2025')
+    db.add_transaction('VIST.BA', 'Vista', 'BUY', 8, 26480.0, '04/12/2025')
+    db.add_transaction('VIST.BA', 'Vista', 'SELL', 10, 29000.0, '10/01/2026', lot=2)
+    expected = lots.match_lots(db.get_ledger())[1]
+    path = tmp_path / "ledger.csv"
+    core.export_csv(str(path), transactions=True)
+
+    # Into a database that already has transactions: every id moves
+    db.use_database(str(tmp_path / "other.db"))
+    db.add_transaction('GGAL.BA', 'Galicia', 'BUY', 1, 5000.0, '02/01/2025')
+    db.add_transaction('GGAL.BA', 'Galicia', 'CLOSE', 0, 0, '03/01/2025')
+    core.import_csv(str(path))
+
+    ledger = db.get_ledger()
+    vist = ledger[ledger['symbol'] == 'VIST.BA']
+    assert vist['lot_id'].iloc[-1] == vist['id'].iloc[1]
+    realized = lots.match_lots(ledger)[1]
+    realized = realized[realized['Symbol'] == 'VIST.BA']
+    assert realized['Quantity'].tolist() == expected['Quantity'].tolist() == [8, 2]
+    assert realized['Gain'].tolist() == expected['Gain'].tolist()
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfolio_db
+
+
+def write_csv(path):
+    path.write_text("Empresa,Símbolo,Cantidad,Precio Compra\nApple,AAPL,10,150\n", encoding="utf-8")
+    return path
+
+
+def test_csv_migrates_into_existing_database(db, tmp_path, monkeypatch):
+    # The desktop app already created the default portfolio.db with its own
+    # positions
+    monkeypatch.chdir(tmp_path)
+    db.add_transaction('CVX.BA', 'Chevron', 'BUY', 11, 11400, '04/11/2025')
+    csv = write_csv(tmp_path / "cartera.csv")
+
+    db.migrate_csv_if_needed(str(csv))
+
+    positions = db.get_portfolio_df().set_index('Symbol')
+    assert positions.loc['AAPL', 'Quantity'] == 10
+    assert positions.loc['AAPL', 'BuyPrice'] == 150
+    assert positions.loc['CVX.BA', 'Quantity'] == 11
+    assert not csv.exists()
+    assert os.path.exists(str(csv) + ".bak")
+
+    # Already migrated: running it again imports nothing
+    db.migrate_csv_if_needed(str(csv))
+    assert len(db.get_ledger()) == 2
+
+
+def test_csv_not_migrated_into_another_database_with_a_ledger(db, tmp_path, capsys):
+    # The fixture's database is not the default portfolio.db of the cwd
+    db.add_transaction('CVX.BA', 'Chevron', 'BUY', 11, 11400, '04/11/2025')
+    csv = write_csv(tmp_path / "cartera.csv")
+
+    db.migrate_csv_if_needed(str(csv))
+
+    assert len(db.get_ledger()) == 1
+    assert csv.exists()
+    assert "import" in capsys.readouterr().out
+
+
+def test_csv_migrates_into_another_empty_database(db, tmp_path):
+    csv = write_csv(tmp_path / "cartera.csv")
+
+    db.migrate_csv_if_needed(str(csv))
+
+    assert db.get_portfolio_df()['Symbol'].tolist() == ['AAPL']
+    assert not csv.exists()
+
+
+def test_rebuild_keeps_price_and_fetch_time(db):
+    db.add_transaction('CVX.BA', 'Chevron', 'BUY', 11, 11400, '04/11/2025')
+    db.update_current_prices({'CVX.BA': 12000})
+    before = db.get_portfolio_df().set_index('Symbol').loc['CVX.BA']
+    assert pd.notna(before['PriceUpdatedAt'])
+
+    db.rebuild_portfolio(full=True)
+
+    after = db.get_portfolio_df().set_index('Symbol').loc['CVX.BA']
+    assert after['CurrentPrice'] == 12000
+    assert after['PriceUpdatedAt'] == before['PriceUpdatedAt']
+
+
+def random_ledger(rows, seed):
+    # Few symbols, so positions go flat, are oversold, adjusted and closed
+    # again and again; quantities in quarters keep the sums exact
+    rng = np.random.default_rng(seed)
+    symbols = rng.choice(['GGAL.BA', 'YPFD.BA', 'VIST.BA'], rows)
+    return pd.DataFrame({
+        'symbol': symbols,
+        'company': [f"{s} #{i}" for i, s in enumerate(symbols)],
+        'action': rng.choice(['BUY', 'SELL', 'ADJUST', 'CLOSE'], rows, p=[0.5, 0.4, 0.06, 0.04]),
+        'quantity': rng.integers(0, 40, rows) + rng.integers(0, 4, rows) / 4,
+        'price': rng.uniform(100, 50000, rows).round(2),
+    })
+
+
+def replayed(db, ledger):
+    # Positions after add_transaction applied the ledger row by row
+    for row in ledger.itertuples(index=False):
+        db.add_transaction(row.symbol, row.company, row.action, row.quantity, row.price, '02/01/2025')
+    return db.get_portfolio_df().set_index('Symbol').sort_index()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vectorized_positions_match_row_by_row_replay(db, monkeypatch, seed):
+    monkeypatch.setattr(portfolio_db, 'SNAPSHOT_INTERVAL', 10 ** 9)  # no rebuilds during the replay
+    ledger = random_ledger(400, seed)
+    expected = replayed(db, ledger)
+
+    positions = portfolio_db.positions_from_ledger(ledger).set_index('symbol').sort_index()
+
+    assert positions.index.tolist() == expected.index.tolist()
+    assert positions['company'].tolist() == expected['Company'].tolist()
+    np.testing.assert_allclose(positions['quantity'], expected['Quantity'])
+    np.testing.assert_allclose(positions['avg_price'], expected['BuyPrice'], rtol=1e-9)
+
+
+def test_long_runs_of_partial_sells_keep_the_average(db, monkeypatch):
+    # Thousands of sells scale the cost basis by tiny ratios: the log-space
+    # sum must neither underflow nor drift
+    monkeypatch.setattr(portfolio_db, 'SNAPSHOT_INTERVAL', 10 ** 9)
+    ledger = pd.DataFrame({
+        'symbol': 'GGAL.BA', 'company': 'Galicia',
+        'action': ['BUY', 'BUY'] + ['SELL'] * 3000 + ['BUY'],
+        'quantity': [1e6, 3e6] + [1000.0] * 3000 + [500.0],
+        'price': [100.0, 300.0] + [999.0] * 3000 + [50.0],
+    })
+    expected = replayed(db, ledger)
+
+    positions = portfolio_db.positions_from_ledger(ledger)
+
+    assert positions['quantity'].tolist() == expected['Quantity'].tolist() == [1e6 + 500]
+    np.testing.assert_allclose(positions['avg_price'], expected['BuyPrice'], rtol=1e-9)
+
+
+def test_incremental_rebuild_equals_full_rebuild(db, monkeypatch):
+    # Snapshots every 50 transactions: the last rebuild starts from one
+    monkeypatch.setattr(portfolio_db, 'SNAPSHOT_INTERVAL', 50)
+    ledger = random_ledger(335, seed=11)
+    for row in ledger.itertuples(index=False):
+        db.add_transaction(row.symbol, row.company, row.action, row.quantity, row.price, '02/01/2025')
+
+    db.rebuild_portfolio()
+    incremental = db.get_portfolio_df().set_index('Symbol').sort_index()
+    db.rebuild_portfolio(full=True)
+    full = db.get_portfolio_df().set_index('Symbol').sort_index()
+
+    pd.testing.assert_frame_equal(incremental, full, check_exact=False, rtol=1e-9)
+    expected = portfolio_db.positions_from_ledger(ledger).set_index('symbol').sort_index()
+    np.testing.assert_allclose(full['Quantity'], expected['quantity'])
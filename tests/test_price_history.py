@@ -0,0 +1,44 @@
+from datetime import date
+
+import pandas as pd
+
+from market_data import HISTORY_COLUMNS, PriceProvider
+from price_history import PriceHistory
+
+
+class OneSymbolProvider(PriceProvider):
+    # Daily bars for `symbol` only; any other symbol gets nothing
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.requests = []
+
+    def get_history(self, symbols, start, end):
+        self.requests.append(sorted(symbols))
+        days = pd.bdate_range(start, end).strftime('%Y-%m-%d')
+        rows = [(self.symbol, day, 10.0, 11.0, 9.0, 10.5, 1000.0) for day in days if self.symbol in symbols]
+        return pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+
+
+def test_backfill_marks_covered_only_symbols_with_bars(db):
+    provider = OneSymbolProvider('GGAL.BA')
+    start, end = date(2024, 3, 4), date(2024, 3, 8)
+
+    stored = PriceHistory.backfill(['GGAL.BA', 'YPFD.BA'], start, end, provider=provider)
+
+    assert stored == 5
+    gaps = PriceHistory.gaps(['GGAL.BA', 'YPFD.BA'], start, end)
+    assert gaps['GGAL.BA'] == []
+    assert gaps['YPFD.BA'] == [(start, end)]
+
+    # The next backfill asks again only for the symbol that got nothing
+    PriceHistory.backfill(['GGAL.BA', 'YPFD.BA'], start, end, provider=provider)
+    assert provider.requests[-1] == ['YPFD.BA']
+
+
+def test_backfill_covers_a_gap_without_trading_days(db):
+    provider = OneSymbolProvider('GGAL.BA')
+    saturday, sunday = date(2024, 3, 9), date(2024, 3, 10)
+
+    PriceHistory.backfill(['YPFD.BA'], saturday, sunday, provider=provider)
+
+    assert PriceHistory.gaps(['YPFD.BA'], saturday, sunday)['YPFD.BA'] == []
@@ -0,0 +1,63 @@
+import socket
+import threading
+import time
+
+import price_stream
+from price_stream import StandInFeedServer, TcpPriceFeed, TickBuffer
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_streams_the_subscribed_symbols():
+    server = StandInFeedServer(rate=500).start()
+    feed = TcpPriceFeed(*server.address)
+    buffer = TickBuffer()
+    try:
+        feed.subscribe(['GGAL.BA', 'YPFD.BA'])
+        feed.start(buffer.push)
+        assert wait_for(lambda: buffer.last('GGAL.BA') and buffer.last('YPFD.BA'))
+
+        feed.subscribe(['AAPL'])
+        assert wait_for(lambda: buffer.last('AAPL'))
+        buffer.drain_latest()
+        time.sleep(0.1)
+        assert set(buffer.drain_latest()) == {'AAPL'}
+    finally:
+        feed.stop()
+        server.stop()
+
+
+def test_subscribe_while_connecting_sends_the_new_symbols(monkeypatch):
+    server = StandInFeedServer(rate=500).start()
+    feed = TcpPriceFeed(*server.address)
+    buffer = TickBuffer()
+    connecting = threading.Event()
+    subscribed = threading.Event()
+    create_connection = socket.create_connection
+
+    def slow_connection(*args, **kwargs):
+        # The subscription changes before the socket is handed to the feed
+        connecting.set()
+        subscribed.wait(5)
+        return create_connection(*args, **kwargs)
+
+    monkeypatch.setattr(price_stream.socket, 'create_connection', slow_connection)
+    try:
+        feed.subscribe(['GGAL.BA'])
+        feed.start(buffer.push)
+        assert connecting.wait(5)
+        feed.subscribe(['AAPL'])
+        subscribed.set()
+
+        assert wait_for(lambda: buffer.last('AAPL'))
+        assert buffer.last('GGAL.BA') is None
+    finally:
+        feed.stop()
+        server.stop()
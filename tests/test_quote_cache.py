@@ -0,0 +1,111 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+import quote_cache
+from market_data import PriceProvider, Quote
+from quote_cache import CachedPriceProvider, QuoteCache
+
+
+class CountingProvider(PriceProvider):
+    # Quotes at a fixed price; counts calls and can hold them until released
+    def __init__(self, block=False):
+        self.calls = []
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def get_quotes(self, symbols, timeout=None):
+        self.calls.append(list(symbols))
+        self.release.wait(5)
+        return {s: Quote(s, 100.0, None, None) for s in symbols}
+
+
+@pytest.fixture
+def counters():
+    # metrics on and empty for the test; returns a reader of the counters
+    was_enabled = metrics.is_enabled()
+    metrics.enable()
+    metrics.reset()
+    yield lambda name: metrics.snapshot()['counters'].get(f'quote_cache.{name}', 0)
+    metrics.reset()
+    metrics.enable(was_enabled)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(quote_cache, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_quotes_expire_after_the_ttl(clock, counters):
+    provider = CountingProvider()
+    cached = CachedPriceProvider(provider, QuoteCache(ttl=60))
+
+    cached.get_quotes(['GGAL.BA'])
+    clock[0] += 60
+    cached.get_quotes(['GGAL.BA'])
+    assert len(provider.calls) == 1
+    assert (counters('misses'), counters('hits')) == (1, 1)
+
+    clock[0] += 1
+    assert cached.cache.get('GGAL.BA') is None
+    assert cached.cache.last_known('GGAL.BA').price == 100.0
+    cached.get_quotes(['GGAL.BA'])
+    assert len(provider.calls) == 2
+    assert counters('misses') == 2
+
+
+def test_least_recently_used_quote_is_evicted(clock):
+    cache = QuoteCache(max_entries=2)
+    cache.put_many([Quote('A', 1.0, None, None), Quote('B', 2.0, None, None)])
+    assert cache.get('A')  # A is now more recent than B
+    cache.put_many([Quote('C', 3.0, None, None)])
+
+    assert cache.last_known('B') is None
+    assert cache.last_known('A').price == 1.0
+    assert cache.last_known('C').price == 3.0
+
+
+def test_only_missing_symbols_are_fetched(counters):
+    provider = CountingProvider()
+    cached = CachedPriceProvider(provider, QuoteCache())
+    cached.get_quotes(['A', 'B'])
+
+    quotes = cached.get_quotes(['A', 'B', 'C'])
+
+    assert sorted(quotes) == ['A', 'B', 'C']
+    assert provider.calls == [['A', 'B'], ['C']]
+    assert (counters('hits'), counters('misses')) == (2, 3)
+
+
+def test_concurrent_misses_make_one_provider_call(counters):
+    provider = CountingProvider(block=True)
+    cached = CachedPriceProvider(provider, QuoteCache())
+    results = []
+
+    def lookup():
+        results.append(cached.get_quotes(['VIST.BA']))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    threads[0].start()
+    deadline = time.monotonic() + 5
+    while not provider.calls:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while counters('coalesced') < 7:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    provider.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(provider.calls) == 1
+    assert [r['VIST.BA'].price for r in results] == [100.0] * 8
+    assert (counters('misses'), counters('coalesced')) == (1, 7)
@@ -0,0 +1,56 @@
+import numpy as np
+
+import cli
+import core
+import rebalance
+
+
+def test_sells_the_overweight_to_buy_the_underweight():
+    shares = rebalance.rebalance_matrix([600, 400], [10, 10], [0.5, 0.5])
+    assert shares.tolist() == [[-10, 10]]
+
+
+def test_cash_is_invested_toward_the_targets():
+    shares = rebalance.rebalance_matrix([500, 500], [10, 10], [0.5, 0.5], cash=1000)
+    assert shares.tolist() == [[50, 50]]
+
+
+def test_orders_are_whole_lots():
+    shares = rebalance.rebalance_matrix([1000, 0, 0], [10, 10, 10], [0.7, 0.08, 0.22], lots=[1, 7, 7])
+    assert shares.tolist() == [[-30, 7, 21]]
+
+
+def test_no_cash_and_nothing_to_sell_gives_no_orders():
+    # The untargeted holding is not sold to fund the buys
+    shares = rebalance.rebalance_matrix([300, 300, 400], [10, 10, 10], [0.5, 0.5, np.nan])
+    assert shares.tolist() == [[0, 0, 0]]
+
+
+def rebalance_output(capsys, *argv):
+    args = cli.build_parser().parse_args(['rebalance', *argv])
+    args.func(args)
+    return capsys.readouterr().out
+
+
+def test_cli_reports_drift_it_cannot_fix(db, capsys):
+    for symbol, quantity in (('META.BA', 30), ('VIST.BA', 30), ('YPFD.BA', 40)):
+        db.add_transaction(symbol, symbol, 'BUY', quantity, 10, '02/01/2025')
+    db.update_current_prices({'META.BA': 10, 'VIST.BA': 10, 'YPFD.BA': 10})
+
+    out = rebalance_output(capsys, '--set', 'META.BA=0.5', 'VIST.BA=0.5')
+
+    assert "dentro de la tolerancia" not in out
+    assert "supera la tolerancia" in out
+    assert "--cash" in out and "YPFD.BA" in out
+    _, summary = core.rebalance_plan()
+    assert summary['max_drift_before'] > summary['tolerance']
+
+
+def test_cli_within_tolerance(db, capsys):
+    for symbol in ('META.BA', 'VIST.BA'):
+        db.add_transaction(symbol, symbol, 'BUY', 50, 10, '02/01/2025')
+    db.update_current_prices({'META.BA': 10, 'VIST.BA': 10})
+
+    out = rebalance_output(capsys, '--set', 'META.BA=0.5', 'VIST.BA=0.5')
+
+    assert "Sin órdenes: la cartera está dentro de la tolerancia" in out
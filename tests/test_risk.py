@@ -0,0 +1,133 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import risk
+from market_data import HISTORY_COLUMNS
+from price_history import PriceHistory
+
+SYMBOLS = ['GGAL.BA', 'YPFD.BA']
+BENCHMARK = '^MERV'
+
+
+def store_closes(closes):
+    # closes: dates x symbols frame -> daily bars in `prices`
+    long = closes.rename_axis('date').reset_index().melt('date', var_name='symbol', value_name='close').dropna()
+    long['date'] = long['date'].dt.strftime('%Y-%m-%d')
+    for field in ('open', 'high', 'low'):
+        long[field] = long['close']
+    long['volume'] = 0.0
+    PriceHistory.store(long[HISTORY_COLUMNS])
+
+
+def synthetic_closes(days=120, seed=3):
+    # The benchmark is a random walk; the holdings follow it with betas of
+    # 1.5 and 0.5 plus noise of their own
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0005, 0.015, days)
+    returns = np.column_stack([1.5 * market + rng.normal(0, 0.01, days),
+                               0.5 * market + rng.normal(0, 0.01, days), market])
+    closes = 100 * np.cumprod(1 + returns, axis=0)
+    dates = pd.bdate_range('2025-01-06', periods=days)
+    return pd.DataFrame(closes, index=dates, columns=SYMBOLS + [BENCHMARK])
+
+
+def test_covariance_matches_pandas_on_ragged_histories():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.02, (300, 4))
+    returns[:100, 1] = np.nan  # listed later
+    returns[:250, 3] = np.nan
+    returns[rng.random(returns.shape) < 0.05] = np.nan  # scattered gaps
+    expected = pd.DataFrame(returns).cov().to_numpy()
+    np.testing.assert_allclose(risk.covariance(returns), expected, rtol=1e-10, atol=1e-15)
+
+
+def test_covariance_needs_two_common_days():
+    returns = np.array([[0.01, np.nan], [0.02, np.nan], [np.nan, 0.03]])
+    cov = risk.covariance(returns)
+    assert cov[0, 0] == pytest.approx(np.var([0.01, 0.02], ddof=1))
+    assert np.isnan(cov[0, 1]) and np.isnan(cov[1, 1])
+
+
+def test_value_at_risk_matches_references():
+    returns = np.random.default_rng(1).normal(0.001, 0.02, 500)
+    var = risk.value_at_risk(returns, confidence=0.95, horizon=4)
+
+    cutoff = np.quantile(returns, 0.05)
+    assert var['historical_var'] == pytest.approx(-cutoff * 2)
+    assert var['historical_cvar'] == pytest.approx(-returns[returns <= cutoff].mean() * 2)
+    mu, sigma = returns.mean() * 4, returns.std(ddof=1) * 2
+    normal = NormalDist(mu, sigma)
+    assert var['parametric_var'] == pytest.approx(-normal.inv_cdf(0.05))
+    # Expected loss beyond the VaR of a normal distribution
+    z = NormalDist().inv_cdf(0.95)
+    assert var['parametric_cvar'] == pytest.approx(sigma * NormalDist().pdf(z) / 0.05 - mu)
+    assert risk.value_at_risk(np.array([0.01, np.nan])) is None
+
+
+def test_analyze_against_numpy_references(db):
+    closes = synthetic_closes()
+    store_closes(closes)
+    portfolio = pd.DataFrame({'Symbol': SYMBOLS + [SYMBOLS[0]], 'Value': [30000.0, 50000.0, 20000.0]})
+
+    report = risk.analyze(portfolio, benchmark=BENCHMARK, cache=risk.ReturnsCache())
+
+    returns = closes.pct_change().iloc[1:]
+    weights = np.array([0.5, 0.5])
+    for symbol in SYMBOLS:
+        expected = returns[symbol].std(ddof=1) * np.sqrt(risk.TRADING_DAYS)
+        assert report['volatility'][symbol] == pytest.approx(expected)
+    portfolio_returns = returns[SYMBOLS].to_numpy() @ weights
+    p = report['portfolio']
+    assert p['volatility'] == pytest.approx(portfolio_returns.std(ddof=1) * np.sqrt(risk.TRADING_DAYS))
+    bench = returns[BENCHMARK].to_numpy()
+    assert p['beta'] == pytest.approx(np.cov(portfolio_returns, bench)[0, 1] / bench.var(ddof=1))
+    assert p['beta'] == pytest.approx(1.0, abs=0.2)
+    assert p['var']['historical_var'] == pytest.approx(-np.quantile(portfolio_returns, 0.05))
+    assert p['var']['historical_var_amount'] == pytest.approx(p['var']['historical_var'] * 100000)
+    pd.testing.assert_frame_equal(report['correlation'], returns[SYMBOLS].corr(), check_names=False)
+    assert report['risk_contribution'].sum() == pytest.approx(1.0)
+    assert report['missing'] == []
+    assert report['days'] == len(returns)
+
+
+def test_analyze_lists_symbols_without_history(db):
+    store_closes(synthetic_closes()[SYMBOLS])
+    portfolio = pd.DataFrame({'Symbol': SYMBOLS + ['VIST.BA'], 'Value': [1.0, 1.0, 2.0]})
+
+    report = risk.analyze(portfolio, benchmark=None, cache=risk.ReturnsCache())
+
+    assert report['missing'] == ['VIST.BA']
+    assert report['symbols'] == SYMBOLS
+    assert report['portfolio']['beta'] is None
+    assert report['exposure']['top']['VIST.BA'] == 0.5
+
+
+def test_returns_cache_reloads_from_the_oldest_written_date(db, monkeypatch):
+    closes = synthetic_closes()
+    store_closes(closes.iloc[:100])
+    cache = risk.ReturnsCache()
+    symbols = SYMBOLS + [BENCHMARK]
+    cache.get(symbols)
+
+    loads = []
+    get_matrix = PriceHistory.get_matrix
+    monkeypatch.setattr(PriceHistory, 'get_matrix', lambda symbols, start=None, **kw: (
+        loads.append(start), get_matrix(symbols, start=start, **kw))[1])
+
+    # Nothing written: served from memory
+    _, model = cache.get(symbols)
+    assert loads == []
+
+    # New bars and a corrected old one: read again from the corrected date
+    store_closes(closes.iloc[100:])
+    corrected = closes.iloc[[40]] * 1.01
+    store_closes(corrected)
+    cached, model = cache.get(symbols)
+    assert loads == [corrected.index[0].strftime('%Y-%m-%d')]
+
+    fresh = get_matrix(symbols, fill=False)
+    pd.testing.assert_frame_equal(cached, fresh, check_names=False, check_freq=False)
+    np.testing.assert_allclose(model['covariance'], risk.covariance(risk.simple_returns(fresh.to_numpy())))
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import scheduler
+from scheduler import RefreshScheduler, is_market_open
+
+UTC = timezone.utc
+WEDNESDAY = datetime(2026, 10, 14, tzinfo=UTC)  # ART is UTC-3, New York on EDT (UTC-4)
+SATURDAY = datetime(2026, 10, 17, 15, 0, tzinfo=UTC)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Monotonic clock behind the per-minute request budget
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'time', SimpleNamespace(monotonic=lambda: now[0], perf_counter=lambda: now[0]))
+    return now
+
+
+def holdings(rows, updated_at):
+    # Portfolio frame like core.load_portfolio() from (symbol, quantity,
+    # price) rows, all priced at `updated_at`
+    frame = pd.DataFrame(rows, columns=['Symbol', 'Quantity', 'CurrentPrice'])
+    frame['PriceUpdatedAt'] = [updated_at.isoformat() if price else None for price in frame['CurrentPrice']]
+    return frame
+
+
+def test_byma_hours():
+    assert not is_market_open("BYMA", WEDNESDAY.replace(hour=13, minute=59))
+    assert is_market_open("BYMA", WEDNESDAY.replace(hour=14))  # 11:00 in Buenos Aires
+    assert is_market_open("BYMA", WEDNESDAY.replace(hour=19, minute=59))
+    assert not is_market_open("BYMA", WEDNESDAY.replace(hour=20))  # 17:00
+
+
+def test_nyse_hours_follow_daylight_saving():
+    assert not is_market_open("NYSE", WEDNESDAY.replace(hour=13, minute=29))
+    assert is_market_open("NYSE", WEDNESDAY.replace(hour=13, minute=30))  # 9:30 EDT
+    assert not is_market_open("NYSE", WEDNESDAY.replace(hour=20))  # 16:00 EDT
+    january = datetime(2026, 1, 14, tzinfo=UTC)
+    assert not is_market_open("NYSE", january.replace(hour=14))
+    assert is_market_open("NYSE", january.replace(hour=14, minute=30))  # 9:30 EST
+
+
+def test_weekends_are_closed_except_for_symbols_without_hours():
+    assert not is_market_open("BYMA", SATURDAY)
+    assert not is_market_open("NYSE", SATURDAY)
+    assert not is_market_open("NYSE", SATURDAY + timedelta(days=1, hours=3))
+    assert is_market_open(None, SATURDAY)
+
+
+def test_closed_markets_only_refresh_symbols_without_a_price(clock):
+    portfolio = holdings([('GGAL.BA', 10, 5000.0), ('AAPL', 2, 200.0), ('YPFD.BA', 5, 0.0),
+                          ('USDARS=X', 1, 1000.0)], SATURDAY - timedelta(hours=1))
+    selected, deferred, closed = RefreshScheduler().plan(portfolio, SATURDAY)
+
+    assert sorted(selected) == ['USDARS=X', 'YPFD.BA']
+    assert deferred == []
+    assert sorted(closed) == ['AAPL', 'GGAL.BA']
+
+
+def test_open_markets_refresh_stale_prices_largest_first(clock):
+    now = WEDNESDAY.replace(hour=15)
+    portfolio = holdings([('GGAL.BA', 1, 100.0), ('YPFD.BA', 100, 100.0), ('AAPL', 1, 100.0)],
+                         now - timedelta(seconds=120))
+    portfolio.loc[portfolio['Symbol'] == 'AAPL', 'PriceUpdatedAt'] = (now - timedelta(seconds=30)).isoformat()
+    selected, deferred, closed = RefreshScheduler(interval=60).plan(portfolio, now)
+
+    assert selected == ['YPFD.BA', 'GGAL.BA']
+    assert deferred == closed == []
+
+
+def test_request_budget_is_per_minute(clock, monkeypatch):
+    now = WEDNESDAY.replace(hour=15)
+    symbols = ['GGAL.BA', 'YPFD.BA', 'PAMP.BA', 'VIST.BA', 'BMA.BA']
+    portfolio = holdings([(s, 1, 100.0) for s in symbols], now - timedelta(hours=1))
+    monkeypatch.setattr(scheduler.core, 'load_portfolio', lambda: portfolio)
+    fetched = []
+
+    def refresh(selected):
+        # Prices refreshed now are no longer stale
+        fetched.append(list(selected))
+        portfolio.loc[portfolio['Symbol'].isin(selected), 'PriceUpdatedAt'] = clock_time[0].isoformat()
+        return {'prices': {s: 100.0 for s in selected}, 'changed': []}
+
+    clock_time = [now]
+    refresher = RefreshScheduler(interval=60, budget=3, refresh=refresh)
+    first = refresher.run_once(now)
+    assert len(first['selected']) == 3 and len(first['deferred']) == 2
+    assert refresher.remaining_budget() == 0
+
+    # The retry interval is over but the minute is not
+    clock[0] += 59
+    clock_time[0] = now + timedelta(seconds=59)
+    second = refresher.run_once(clock_time[0])
+    assert second['selected'] == [] and sorted(second['deferred']) == sorted(first['deferred'])
+
+    clock[0] += 1
+    clock_time[0] = now + timedelta(seconds=60)
+    third = refresher.run_once(clock_time[0])
+    # The symbols left waiting are the stalest now; the budget takes one more
+    assert sorted(third['selected'][:2]) == sorted(first['deferred'])
+    assert len(third['selected']) == 3 and third['selected'][2] in first['selected']
+    assert [len(f) for f in fetched] == [3, 3]  # nothing fetched while over budget
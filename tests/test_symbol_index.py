@@ -0,0 +1,54 @@
+import threading
+
+from symbol_index import SymbolIndex
+
+
+def test_lookups_by_prefix_name_and_typo(db):
+    index = SymbolIndex()
+    index.add([{'symbol': 'VIST.BA', 'longname': 'Vista Energy'}, {'symbol': 'YPFD.BA', 'shortname': 'YPF'}])
+
+    assert index.get('vist.ba')['longname'] == 'Vista Energy'
+    assert [e['symbol'] for e in index.prefix('YP')] == ['YPFD.BA']
+    assert [e['symbol'] for e in index.prefix('energ')] == ['VIST.BA']
+    assert [e['symbol'] for e in index.search('VSIT.BA')] == ['VIST.BA']
+
+
+def test_a_new_name_replaces_the_words_of_the_old_one(db):
+    index = SymbolIndex()
+    index.add([{'symbol': 'VIST.BA', 'longname': 'Vista Oil & Gas'}])
+    index.add([{'symbol': 'VIST.BA', 'longname': 'Vista Energy', 'shortname': 'Vista'}])
+
+    assert index.prefix('oil') == []
+    assert index.prefix('gas') == []
+    assert [e['symbol'] for e in index.prefix('energy')] == ['VIST.BA']
+    # "vista" is still in the short name
+    assert [e['symbol'] for e in index.prefix('vista')] == ['VIST.BA']
+    index.add([{'symbol': 'VIST.BA', 'shortname': 'VIST'}])
+    assert [e['symbol'] for e in index.prefix('vista')] == ['VIST.BA']
+    index.add([{'symbol': 'VIST.BA', 'longname': 'Energy Co'}])
+    assert index.prefix('vista') == []
+
+
+def test_concurrent_first_lookups_load_once(db, monkeypatch):
+    SymbolIndex().add([{'symbol': 'GGAL.BA', 'longname': 'Grupo Galicia'}])
+    index = SymbolIndex()
+    loads = []
+    release = threading.Event()
+    load = index.load
+
+    def slow_load():
+        loads.append(1)
+        release.wait(5)
+        load()
+
+    monkeypatch.setattr(index, 'load', slow_load)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(index.get('GGAL.BA'))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert loads == [1]
+    assert [r['longname'] for r in results] == ['Grupo Galicia'] * 6
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from portfolio_db import positions_from_ledger
+
+# Multi-currency valuation. Every instrument is priced in ARS (BYMA tickers,
+# CEDEARs included) or USD (everything else); positions are converted to
+# both in one vectorized pass. Market values use the current USD/ARS rate and
+# cost bases use the rate of each trade's date, looked up with merge_asof in
+# the daily USD/ARS series stored in `prices` under FX_SYMBOL.
+FX_SYMBOL = "ARS=X"
+
+
+def currency_for(symbol):
+    return "ARS" if symbol.endswith(".BA") else "USD"
+
+
+def is_ars(symbols):
+    # Boolean array, currency_for over a Series
+    return symbols.str.endswith(".BA").to_numpy(dtype=bool)
+
+
+def rates_at(dates, fx_series):
+    # USD/ARS in effect on each date (ISO strings or datetimes): the last
+    # rate on or before it. Dates before the series take its first rate,
+    # unparsable ones its last. Returns an array aligned with `dates`.
+    dates = pd.to_datetime(pd.Series(dates).reset_index(drop=True), errors='coerce')
+    series = fx_series.dropna().sort_index()
+    rates = np.full(len(dates), float(series.iloc[-1]))
+    valid = dates.notna().to_numpy()
+    if valid.any():
+        left = pd.DataFrame({'date': dates[valid].to_numpy(), 'row': np.flatnonzero(valid)}).sort_values('date')
+        right = pd.DataFrame({'date': pd.to_datetime(series.index).to_numpy(), 'rate': series.to_numpy(dtype=float)})
+        merged = pd.merge_asof(left, right, on='date', direction='backward')
+        rates[merged['row'].to_numpy()] = merged['rate'].fillna(float(series.iloc[0])).to_numpy()
+    return rates
+
+
+def converted_avg_prices(ledger, fx_series):
+    # Average cost of every open position in its other currency (USD for
+    # ARS instruments and the other way round): every trade price converted
+    # at its own date's rate, then the ledger replayed as usual. Sells keep
+    # the average, so this is exact for the average-cost method.
+    if ledger.empty or fx_series.dropna().empty:
+        return pd.Series(dtype=float)
+    rate = rates_at(ledger['trade_date'], fx_series)
+    price = ledger['price'].to_numpy(dtype=float)
+    converted = ledger[['symbol', 'company', 'action', 'quantity']].assign(
+        price=np.where(is_ars(ledger['symbol']), price / rate, price * rate))
+    return positions_from_ledger(converted).set_index('symbol')['avg_price']
+
+
+def value_currencies(portfolio, fx_rate, converted_avg=None):
+    # Adds Currency and the CURRENCY_COLUMNS (invested and value in ARS and
+    # in USD) to a frame already run through value_positions. Positions
+    # missing from converted_avg are costed at fx_rate.
+    ars = is_ars(portfolio['Symbol'])
+    quantity = portfolio['Quantity'].to_numpy(dtype=float)
+    buy_price = portfolio['BuyPrice'].to_numpy(dtype=float)
+    invested = portfolio['Invested'].to_numpy(dtype=float)
+    value = portfolio['Value'].to_numpy(dtype=float)
+
+    other_avg = np.where(ars, buy_price / fx_rate, buy_price * fx_rate)
+    if converted_avg is not None and len(converted_avg):
+        ledger_avg = portfolio['Symbol'].map(converted_avg).to_numpy(dtype=float)
+        other_avg = np.where(np.isnan(ledger_avg), other_avg, ledger_avg)
+    other_cost = quantity * other_avg
+
+    portfolio['Currency'] = np.where(ars, 'ARS', 'USD')
+    portfolio['InvestedARS'] = np.where(ars, invested, other_cost)
+    portfolio['InvestedUSD'] = np.where(ars, other_cost, invested)
+    portfolio['ValueARS'] = np.where(ars, value, value * fx_rate)
+    portfolio['ValueUSD'] = np.where(ars, value / fx_rate, value)
+    return portfolio